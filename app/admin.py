@@ -3,6 +3,7 @@ Admin panel va boshqarish
 """
 from __future__ import annotations
 import logging
+import time
 from typing import List, Optional
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, User
 from aiogram.filters import Command
@@ -10,11 +11,15 @@ from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from app.database import db
+from app.broadcast import broadcasts
+from app.database import adb
 
 logger = logging.getLogger(__name__)
 admin_router = Router()
 
+# Foydalanuvchilar ro'yxatining bir sahifasi
+USERS_PAGE_SIZE = 20
+
 
 class AdminState(StatesGroup):
     waiting_broadcast_message = State()
@@ -25,15 +30,15 @@ class AdminState(StatesGroup):
     choosing_notification_target = State()
 
 
-def is_admin(user_id: int) -> bool:
+async def is_admin(user_id: int) -> bool:
     """Admin tekshirish"""
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     return user and user.get('is_admin', False) and not user.get('is_banned', False)
 
 
 async def admin_only(msg: Message) -> bool:
     """Admin filtri"""
-    if not is_admin(msg.from_user.id):
+    if not await is_admin(msg.from_user.id):
         await msg.reply("❌ Siz admin emassiz!")
         return False
     return True
@@ -47,7 +52,7 @@ async def handle_admin_panel(msg: Message):
         logger.info(f"👑 Admin panel request from {user_id} (@{msg.from_user.username})")
 
         # Admin tekshiruvi
-        admin_check = is_admin(user_id)
+        admin_check = await is_admin(user_id)
         logger.debug(f"   is_admin({user_id}) = {admin_check}")
 
         if not admin_check:
@@ -88,13 +93,33 @@ async def handle_admin_panel(msg: Message):
         await msg.answer(text, reply_markup=keyboard)
         logger.info(f"✅ Admin panel opened for {user_id}")
 
-        db.log_admin_action(user_id, "admin_panel_opened")
+        await adb.log_admin_action(user_id, "admin_panel_opened")
 
     except Exception as e:
         logger.error(f"❌ Admin panel error: {e}", exc_info=True)
         await msg.answer(f"❌ Xatolik: {str(e)[:100]}")
 
 
+@admin_router.message(Command("vacuum_full"))
+async def handle_vacuum_full(msg: Message):
+    """Eski bazada incremental vacuum ni yoqish (bir martalik to'liq VACUUM).
+
+    VACUUM butun faylni qayta yozadi va tugaguncha baza band bo'ladi -
+    kam trafik vaqtida bir marta ishga tushiriladi.
+    """
+    if not await admin_only(msg):
+        return
+    await msg.answer("⏳ To'liq VACUUM boshlandi. Tugaguncha bot javob bermasligi mumkin...")
+    started = time.monotonic()
+    ok = await adb.enable_incremental_vacuum()
+    elapsed = time.monotonic() - started
+    await adb.log_admin_action(msg.from_user.id, "vacuum_full", details=f"ok={ok} {elapsed:.1f}s")
+    if ok:
+        await msg.answer(f"✅ Incremental vacuum yoqildi ({elapsed:.1f}s)")
+    else:
+        await msg.answer("❌ VACUUM bajarilmadi, loglarni tekshiring")
+
+
 @admin_router.callback_query(F.data == "admin_users")
 async def show_users(callback: CallbackQuery):
     """Foydalanuvchilarni ko'rish"""
@@ -102,32 +127,33 @@ async def show_users(callback: CallbackQuery):
         user_id = callback.from_user.id
         logger.info(f"Admin users query from {user_id} (@{callback.from_user.username})")
         logger.debug(f"   Callback user: {callback.from_user}")
-        logger.debug(f"   is_admin({user_id}) = {is_admin(user_id)}")
 
-        if not is_admin(user_id):
+        admin_check = await is_admin(user_id)
+        logger.debug(f"   is_admin({user_id}) = {admin_check}")
+
+        if not admin_check:
             logger.warning(f"Non-admin tried admin_users: {user_id}")
             await callback.answer("❌ Admin emas!", show_alert=True)
             return
 
-        users = db.get_all_users()
-        admin_users = [u for u in users if u['is_admin']]
-        banned_users = [u for u in users if u['is_banned']]
+        counts = await adb.get_user_counts()
 
         text = (
             f"<b>👥 Foydalanuvchilar Statistikasi</b>\n\n"
-            f"📊 <b>Jami:</b> {len(users)}\n"
-            f"👑 <b>Adminlar:</b> {len(admin_users)}\n"
-            f"🚫 <b>Banlanganlar:</b> {len(banned_users)}\n"
-            f"✅ <b>Faol:</b> {len([u for u in users if not u['is_banned']])}\n\n"
+            f"📊 <b>Jami:</b> {counts['total']}\n"
+            f"👑 <b>Adminlar:</b> {counts['admins']}\n"
+            f"🚫 <b>Banlanganlar:</b> {counts['banned']}\n"
+            f"✅ <b>Faol:</b> {counts['active']}\n\n"
         )
 
         # Top users
-        top_users = sorted(users, key=lambda x: x['downloads_count'], reverse=True)[:5]
+        top_users = await adb.get_top_users(limit=5)
         text += "<b>🏆 Top 5 Foydalanuvchi:</b>\n"
         for i, user in enumerate(top_users, 1):
             text += f"{i}. `{user['user_id']}` - {user['downloads_count']} downloads\n"
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📋 Ro'yxat", callback_data="admin_users_page:next:0")],
             [InlineKeyboardButton(text="🔙 Orqaga", callback_data="admin_back")],
         ])
 
@@ -140,6 +166,52 @@ async def show_users(callback: CallbackQuery):
         await callback.answer(f"Xatolik: {str(e)[:50]}", show_alert=True)
 
 
+@admin_router.callback_query(F.data.startswith("admin_users_page:"))
+async def browse_users(callback: CallbackQuery):
+    """Foydalanuvchilar ro'yxati (keyset sahifalash)"""
+    try:
+        if not await is_admin(callback.from_user.id):
+            await callback.answer("❌ Admin emas!", show_alert=True)
+            return
+
+        # admin_users_page:<next|prev>:<cursor_user_id>
+        _, direction, cursor_id = callback.data.split(":")
+        users, has_more = await adb.get_users_page(int(cursor_id), direction, limit=USERS_PAGE_SIZE)
+
+        if not users:
+            await callback.answer("📭 Boshqa foydalanuvchi yo'q")
+            return
+
+        text = "<b>📋 Foydalanuvchilar</b>\n\n"
+        for user in users:
+            flags = ("👑" if user['is_admin'] else "") + ("🚫" if user['is_banned'] else "")
+            username = f"@{user['username']}" if user['username'] else "-"
+            text += f"`{user['user_id']}` {username} - {user['downloads_count']} {flags}\n"
+
+        # Yo'nalish bo'yicha: next da oldingi sahifa cursor_id > 0 bo'lsa bor
+        has_prev = has_more if direction == "prev" else int(cursor_id) > 0
+        has_next = has_more if direction == "next" else True
+
+        nav = []
+        if has_prev:
+            nav.append(InlineKeyboardButton(
+                text="⬅️", callback_data=f"admin_users_page:prev:{users[0]['user_id']}"))
+        if has_next:
+            nav.append(InlineKeyboardButton(
+                text="➡️", callback_data=f"admin_users_page:next:{users[-1]['user_id']}"))
+
+        rows = [nav] if nav else []
+        rows.append([InlineKeyboardButton(text="🔙 Orqaga", callback_data="admin_users")])
+        keyboard = InlineKeyboardMarkup(inline_keyboard=rows)
+
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"❌ Error browsing users: {e}", exc_info=True)
+        await callback.answer(f"Xatolik: {str(e)[:50]}", show_alert=True)
+
+
 @admin_router.callback_query(F.data == "admin_stats")
 async def show_stats(callback: CallbackQuery):
     """Statistikani ko'rish"""
@@ -147,12 +219,12 @@ async def show_stats(callback: CallbackQuery):
         user_id = callback.from_user.id
         logger.info(f"Admin stats query from {user_id}")
 
-        if not is_admin(user_id):
+        if not await is_admin(user_id):
             logger.warning(f"Non-admin tried admin_stats: {user_id}")
             await callback.answer("❌ Admin emas!", show_alert=True)
             return
 
-        stats = db.get_statistics()
+        stats = await adb.get_statistics()
 
         success_rate = 0
         if stats['successful_downloads'] + stats['failed_downloads'] > 0:
@@ -168,6 +240,8 @@ async def show_stats(callback: CallbackQuery):
             f"📈 <b>Muvaffaqiyat darajasi:</b> {success_rate:.1f}%\n\n"
             f"💾 <b>Jami storage:</b> {stats['total_storage_used'] / (1024*1024):.1f} MB\n"
             f"⏱️ <b>Avg download time:</b> {stats['avg_download_time']:.1f} sec\n"
+            f"♻️ <b>Kesh (hit/miss):</b> {stats.get('cache_hits', 0)}/{stats.get('cache_misses', 0)}\n"
+            f"🧠 <b>User kesh hit ratio:</b> {stats.get('user_cache_hit_ratio', 0) * 100:.1f}%\n"
         )
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -186,7 +260,7 @@ async def show_stats(callback: CallbackQuery):
 @admin_router.callback_query(F.data == "admin_broadcast")
 async def broadcast_start(callback: CallbackQuery, state: FSMContext):
     """Broadcast xabar yuborish"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
@@ -204,7 +278,7 @@ async def broadcast_start(callback: CallbackQuery, state: FSMContext):
 @admin_router.message(AdminState.waiting_broadcast_message)
 async def process_broadcast(msg: Message, state: FSMContext):
     """Broadcast xabarni qayta ishlash"""
-    if not is_admin(msg.from_user.id):
+    if not await is_admin(msg.from_user.id):
         return
 
     if msg.text == "/cancel":
@@ -212,50 +286,36 @@ async def process_broadcast(msg: Message, state: FSMContext):
         await msg.reply("❌ Bekor qilindi")
         return
 
-    # Broadcast xabarni yuborish
-    users = db.get_all_users(is_banned=False)
-    broadcast_text = msg.text
+    await state.clear()
+    progress_msg = await msg.answer("📤 Broadcast yuborilmoqda...")
 
-    sent_count = 0
-    failed_count = 0
-    message_id = db.send_message(
+    # Matn saqlanadi; media esa har qabul qiluvchiga copy_message bilan nusxalanadi
+    is_media = not msg.text
+    message_id = await adb.create_broadcast(
         msg.from_user.id,
-        broadcast_text,
-        is_broadcast=True
+        msg.html_text or f"[{msg.content_type}]",
+        copy_from_chat_id=msg.chat.id if is_media else None,
+        copy_message_id=msg.message_id if is_media else None,
+        progress_chat_id=progress_msg.chat.id,
+        progress_message_id=progress_msg.message_id,
     )
+    if not message_id:
+        await progress_msg.edit_text("❌ Broadcastni saqlashda xatolik")
+        return
 
-    progress_msg = await msg.answer(f"📤 Broadcast yuborilmoqda... (0/{len(users)})")
-
-    for i, user in enumerate(users):
-        try:
-            # Telegram API orqali xabar yuborish qilish kerak
-            # await bot.send_message(user['user_id'], broadcast_text)
-            sent_count += 1
-            if i % 10 == 0:
-                await progress_msg.edit_text(f"📤 Broadcast yuborilmoqda... ({i}/{len(users)})")
-        except Exception as e:
-            logger.error(f"Broadcast {user['user_id']} uchun: {e}")
-            failed_count += 1
-
-    db.update_message_status(message_id, sent_count, failed_count)
-    db.log_admin_action(
+    await adb.log_admin_action(
         msg.from_user.id,
-        "broadcast_sent",
-        details=f"Sent: {sent_count}, Failed: {failed_count}"
-    )
-
-    await state.clear()
-    await msg.answer(
-        f"✅ Broadcast tugallandi!\n\n"
-        f"✅ Yuborilgan: {sent_count}\n"
-        f"❌ Xatolar: {failed_count}"
+        "broadcast_started",
+        details=f"Message #{message_id}"
     )
+    # Yetkazish fonda: progress xabari tahrirlanadi, natija bazaga yoziladi
+    await broadcasts.start_pending(msg.bot)
 
 
 @admin_router.callback_query(F.data == "admin_ban")
 async def ban_start(callback: CallbackQuery, state: FSMContext):
     """Ban qilish"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
@@ -273,7 +333,7 @@ async def ban_start(callback: CallbackQuery, state: FSMContext):
 @admin_router.message(AdminState.waiting_user_id_for_ban)
 async def process_ban(msg: Message, state: FSMContext):
     """Ban qilish operatsiyasi"""
-    if not is_admin(msg.from_user.id):
+    if not await is_admin(msg.from_user.id):
         return
 
     if msg.text == "/cancel":
@@ -283,14 +343,14 @@ async def process_ban(msg: Message, state: FSMContext):
 
     try:
         user_id = int(msg.text)
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
 
         if not user:
             await msg.reply("❌ Foydalanuvchi topilmadi")
             return
 
-        if db.ban_user(user_id, "Admin tomonidan"):
-            db.log_admin_action(
+        if await adb.ban_user(user_id, "Admin tomonidan"):
+            await adb.log_admin_action(
                 msg.from_user.id,
                 "ban_user",
                 user_id,
@@ -309,7 +369,7 @@ async def process_ban(msg: Message, state: FSMContext):
 @admin_router.callback_query(F.data == "admin_unban")
 async def unban_start(callback: CallbackQuery, state: FSMContext):
     """Ban olib tashlash"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
@@ -326,7 +386,7 @@ async def unban_start(callback: CallbackQuery, state: FSMContext):
 @admin_router.message(AdminState.waiting_user_id_for_unban)
 async def process_unban(msg: Message, state: FSMContext):
     """Unban operatsiyasi"""
-    if not is_admin(msg.from_user.id):
+    if not await is_admin(msg.from_user.id):
         return
 
     if msg.text == "/cancel":
@@ -336,14 +396,14 @@ async def process_unban(msg: Message, state: FSMContext):
 
     try:
         user_id = int(msg.text)
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
 
         if not user:
             await msg.reply("❌ Foydalanuvchi topilmadi")
             return
 
-        if db.unban_user(user_id):
-            db.log_admin_action(
+        if await adb.unban_user(user_id):
+            await adb.log_admin_action(
                 msg.from_user.id,
                 "unban_user",
                 user_id,
@@ -362,7 +422,7 @@ async def process_unban(msg: Message, state: FSMContext):
 @admin_router.callback_query(F.data == "admin_make_admin")
 async def make_admin_start(callback: CallbackQuery, state: FSMContext):
     """Admin qilish"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
@@ -379,7 +439,7 @@ async def make_admin_start(callback: CallbackQuery, state: FSMContext):
 @admin_router.message(AdminState.waiting_user_id_for_admin)
 async def process_make_admin(msg: Message, state: FSMContext):
     """Admin qilish operatsiyasi"""
-    if not is_admin(msg.from_user.id):
+    if not await is_admin(msg.from_user.id):
         return
 
     if msg.text == "/cancel":
@@ -389,14 +449,14 @@ async def process_make_admin(msg: Message, state: FSMContext):
 
     try:
         user_id = int(msg.text)
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
 
         if not user:
             await msg.reply("❌ Foydalanuvchi topilmadi")
             return
 
-        if db.make_admin(user_id):
-            db.log_admin_action(
+        if await adb.make_admin(user_id):
+            await adb.log_admin_action(
                 msg.from_user.id,
                 "make_admin",
                 user_id,
@@ -415,11 +475,11 @@ async def process_make_admin(msg: Message, state: FSMContext):
 @admin_router.callback_query(F.data == "admin_logs")
 async def show_admin_logs(callback: CallbackQuery):
     """Admin loggari"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
-    logs = db.get_admin_logs(limit=20)
+    logs = await adb.get_admin_logs(limit=20)
 
     text = "<b>📝 Admin Amallari</b>\n\n"
     for log in logs[:10]:
@@ -438,7 +498,7 @@ async def show_admin_logs(callback: CallbackQuery):
 @admin_router.callback_query(F.data == "admin_notifications")
 async def show_notifications_menu(callback: CallbackQuery, state: FSMContext):
     """Bildirishnomalar menyu"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
@@ -455,7 +515,7 @@ async def show_notifications_menu(callback: CallbackQuery, state: FSMContext):
 @admin_router.callback_query(F.data == "admin_send_notification")
 async def send_notification_start(callback: CallbackQuery, state: FSMContext):
     """Xabar yuborish"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
@@ -472,7 +532,7 @@ async def send_notification_start(callback: CallbackQuery, state: FSMContext):
 @admin_router.message(AdminState.waiting_notification_message)
 async def process_notification(msg: Message, state: FSMContext):
     """Xabarni qayta ishlash"""
-    if not is_admin(msg.from_user.id):
+    if not await is_admin(msg.from_user.id):
         return
 
     if msg.text == "/cancel":
@@ -480,11 +540,13 @@ async def process_notification(msg: Message, state: FSMContext):
         await msg.reply("❌ Bekor qilindi")
         return
 
-    users = db.get_all_users(is_banned=False)
-    for user in users:
-        db.add_notification(user['user_id'], msg.text, "info")
+    # Bitta qator yoziladi, foydalanuvchilar uni o'qiganda belgilanadi
+    if not await adb.broadcast_notification(msg.text, "info"):
+        await msg.answer("❌ Bildirishnomani saqlashda xatolik")
+        return
 
-    await msg.answer(f"✅ {len(users)} ta foydalanuvchiga bildirishnoma yuborildi")
+    counts = await adb.get_user_counts()
+    await msg.answer(f"✅ {counts['active']} ta foydalanuvchiga bildirishnoma yuborildi")
     await state.clear()
 
 
@@ -495,12 +557,12 @@ async def show_bot_status(callback: CallbackQuery):
         user_id = callback.from_user.id
         logger.info(f"Admin status query from {user_id}")
 
-        if not is_admin(user_id):
+        if not await is_admin(user_id):
             logger.warning(f"Non-admin tried admin_status: {user_id}")
             await callback.answer("❌ Admin emas!", show_alert=True)
             return
 
-        stats = db.get_statistics()
+        stats = await adb.get_statistics()
 
         text = (
             "<b>🤖 Bot Status</b>\n\n"
@@ -530,7 +592,7 @@ async def go_back(callback: CallbackQuery):
         user_id = callback.from_user.id
         logger.info(f"Back to admin menu from {user_id}")
 
-        if not is_admin(user_id):
+        if not await is_admin(user_id):
             logger.warning(f"Non-admin tried admin_back: {user_id}")
             await callback.answer("❌ Admin emas!", show_alert=True)
             return
@@ -576,7 +638,7 @@ async def go_back(callback: CallbackQuery):
 @admin_router.callback_query(F.data == "admin_settings")
 async def show_settings(callback: CallbackQuery):
     """Sozlamalar"""
-    if not is_admin(callback.from_user.id):
+    if not await is_admin(callback.from_user.id):
         await callback.answer("❌ Admin emas!", show_alert=True)
         return
 
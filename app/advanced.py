@@ -126,7 +126,7 @@ class MetadataExtractor:
 
 async def batch_download(urls: List[str], chat_id: int) -> Dict[str, List[str]]:
     """Batch yuklab olish"""
-    from app.utils import download_video_and_audio
+    from app.utils import download_video_and_audio, cleanup_dir
 
     results = {
         "success": [],
@@ -135,7 +135,8 @@ async def batch_download(urls: List[str], chat_id: int) -> Dict[str, List[str]]:
 
     for url in urls:
         try:
-            video, audio, title = await download_video_and_audio(url, chat_id)
+            result = await download_video_and_audio(url, chat_id)
+            cleanup_dir(result.workdir)
             results["success"].append(url)
             logger.info(f"✅ Muvaffaqiyatli: {url}")
         except Exception as e:
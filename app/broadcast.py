@@ -0,0 +1,218 @@
+"""
+Broadcast yetkazish: Bot API chegaralari ostida parallel yuborish
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from app.database import adb
+from app.ratelimit import RateLimiter, Throttle
+
+logger = logging.getLogger(__name__)
+
+# Telegram: bot uchun ~30 xabar/soniya; qolgani oddiy javoblarga qoladi
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Bir vaqtdagi so'rovlar: rate * API javob vaqtidan katta bo'lsa chegaraga yetadi
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "30"))
+# Natijalar bazaga shu nechta qabul qiluvchidan keyin yoziladi
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+# Progress xabari necha soniyada bir marta tahrirlanadi
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+BROADCAST_MAX_ATTEMPTS = 5
+
+# Bitta bot - bitta cheklovchi: barcha broadcastlar va progress tahrirlari birga hisoblanadi
+limiter = RateLimiter(BROADCAST_RATE)
+
+
+class BroadcastRun:
+    """Bitta broadcastni yetkazish.
+
+    Pending qabul qiluvchilar keyset sahifalar bilan o'qiladi va navbat orqali
+    ishchilarga beriladi. Natijalar partiyalab yoziladi: qayta ishga tushganda
+    faqat yozilmagan (pending) qabul qiluvchilarga yuboriladi.
+    """
+
+    def __init__(self, bot: Bot, message: Dict,
+                 concurrency: int = BROADCAST_CONCURRENCY,
+                 batch_size: int = BROADCAST_BATCH_SIZE):
+        self.bot = bot
+        self.message = message
+        self.id = message['id']
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.sent = message['sent_count'] or 0
+        self.failed = message['failed_count'] or 0
+        self.total = 0
+        self._results: List[Tuple[int, str, Optional[str]]] = []
+        self._flush_lock = asyncio.Lock()
+        self._progress = Throttle(BROADCAST_PROGRESS_INTERVAL)
+
+    async def run(self):
+        """Barcha pending qabul qiluvchilarga yuborish va broadcastni yakunlash"""
+        started = time.perf_counter()
+        before = self.sent + self.failed
+        self.total = before + await adb.count_broadcast_pending(self.id)
+        logger.info(f"📢 Broadcast #{self.id}: {self.total - before}/{self.total} yuborilmoqda")
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            after = 0
+            while True:
+                page = await adb.get_broadcast_recipients(self.id, after, self.batch_size)
+                if not page:
+                    break
+                for user_id in page:
+                    await queue.put(user_id)
+                after = page[-1]
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # To'xtatilganda ham tayyor natijalar saqlanadi
+            await self._flush()
+
+        if self._results or await adb.count_broadcast_pending(self.id):
+            # Yozilmagan natijalar yoki o'qish xatosi - scheduler keyinroq davom ettiradi
+            logger.warning(f"⚠️ Broadcast #{self.id} to'liq tugamadi, keyinroq davom etadi")
+            return
+
+        await adb.finish_broadcast(self.id)
+        await adb.log_admin_action(
+            self.message['sender_id'],
+            "broadcast_sent",
+            details=f"Sent: {self.sent}, Failed: {self.failed}"
+        )
+        elapsed = time.perf_counter() - started
+        done = self.sent + self.failed - before
+        logger.info(
+            f"✅ Broadcast #{self.id} tugallandi: {self.sent} sent, {self.failed} failed "
+            f"({done / elapsed if elapsed else 0:.1f} msg/s)"
+        )
+        await self._report(
+            f"✅ Broadcast tugallandi!\n\n"
+            f"✅ Yuborilgan: {self.sent}\n"
+            f"❌ Xatolar: {self.failed}"
+        )
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                try:
+                    status, error = await self._deliver(user_id)
+                except Exception as e:
+                    logger.error(f"Broadcast {user_id} uchun: {e}")
+                    status, error = "failed", str(e)
+
+                self._results.append((user_id, status, error))
+                if status == "sent":
+                    self.sent += 1
+                else:
+                    self.failed += 1
+
+                if len(self._results) >= self.batch_size:
+                    await self._flush()
+                if self._progress.ready():
+                    await self._report(
+                        f"📤 Broadcast yuborilmoqda... ({self.sent + self.failed}/{self.total})"
+                    )
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, user_id: int) -> Tuple[str, Optional[str]]:
+        """Bitta qabul qiluvchiga yuborish: (status, xato)"""
+        for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+            await limiter.acquire(user_id)
+            try:
+                if self.message['copy_message_id']:
+                    # Media bir marta yuklangan: Telegram uni qayta yuklamasdan nusxalaydi
+                    await self.bot.copy_message(
+                        user_id, self.message['copy_from_chat_id'], self.message['copy_message_id']
+                    )
+                else:
+                    await self.bot.send_message(user_id, self.message['message_text'])
+                return "sent", None
+            except TelegramRetryAfter as e:
+                # Flood limit butun bot uchun: barcha ishchilar kutadi
+                logger.warning(f"⏳ Broadcast #{self.id}: RetryAfter {e.retry_after}s")
+                limiter.pause(e.retry_after)
+            except TelegramForbiddenError as e:
+                # Botni bloklagan yoki o'chirilgan akkaunt
+                return "blocked", str(e)
+            except TelegramBadRequest as e:
+                return "failed", str(e)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt == BROADCAST_MAX_ATTEMPTS:
+                    return "failed", str(e)
+                await asyncio.sleep(attempt)
+        return "failed", "Urinishlar tugadi"
+
+    async def _flush(self):
+        """Yig'ilgan natijalarni bitta tranzaksiyada yozish"""
+        async with self._flush_lock:
+            results, self._results = self._results, []
+            if results and not await adb.record_broadcast_results(self.id, results):
+                self._results[:0] = results
+
+    async def _report(self, text: str):
+        """Admin progress xabarini tahrirlash"""
+        chat_id = self.message['progress_chat_id']
+        message_id = self.message['progress_message_id']
+        if not message_id:
+            return
+        try:
+            await limiter.acquire(chat_id)
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except TelegramRetryAfter as e:
+            limiter.pause(e.retry_after)
+        except Exception as e:
+            logger.debug(f"Progress tahrirlanmadi: {e}")
+
+
+class BroadcastManager:
+    """Faol broadcastlar: har xabar uchun bitta task"""
+
+    def __init__(self):
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def start_pending(self, bot: Bot) -> int:
+        """Tugallanmagan broadcastlarni ishga tushirish (yangi yoki restartdan keyin)"""
+        started = 0
+        for message in await adb.get_pending_messages(limit=10):
+            if message['id'] in self._tasks:
+                continue
+            task = asyncio.create_task(self._run(BroadcastRun(bot, message)))
+            self._tasks[message['id']] = task
+            task.add_done_callback(lambda _, message_id=message['id']: self._tasks.pop(message_id, None))
+            started += 1
+        return started
+
+    async def _run(self, run: BroadcastRun):
+        try:
+            await run.run()
+        except Exception as e:
+            logger.error(f"Broadcast #{run.id} xatosi: {e}", exc_info=True)
+
+    async def stop(self):
+        """Faol broadcastlarni to'xtatish; qolganlari keyingi ishga tushishda davom etadi"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+broadcasts = BroadcastManager()
@@ -2,6 +2,8 @@
 Config va konfiguratsiya
 """
 import os
+import re
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -19,9 +21,59 @@ if not BOT_TOKEN or BOT_TOKEN == "YOUR_TELEGRAM_BOT_TOKEN_HERE":
 DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# Shu bot nusxasining nomi: baza va DATA_DIR umumiy bo'lsa har nusxada boshqacha,
+# qayta ishga tushganda esa o'zgarmas bo'lishi kerak (standart - hostname)
+INSTANCE_ID = re.sub(r"[^A-Za-z0-9_.-]", "_", os.getenv("INSTANCE_ID") or socket.gethostname())
+# Shuncha soniya heartbeat yozmagan nusxa o'lgan hisoblanadi: uning ishlari tiklanadi
+INSTANCE_LEASE_SECONDS = int(os.getenv("INSTANCE_LEASE_SECONDS", "90"))
+
+# Lokal Telegram Bot API server (ixtiyoriy), masalan: http://telegram-bot-api:8081
+# Bo'sh bo'lsa - api.telegram.org ishlatiladi
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+TELEGRAM_API_LOCAL = bool(TELEGRAM_API_URL)
+
 # Maksimal fayl o'lcham (baytda)
 MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", "2097152000"))
 
+# Ommaviy Bot API botlar uchun 50 MB dan katta faylni qabul qilmaydi;
+# 2 GB gacha faqat lokal server rejimida ishlaydi
+PUBLIC_API_UPLOAD_LIMIT = 50 * 1024 * 1024
+if not TELEGRAM_API_LOCAL:
+    MAX_UPLOAD_BYTES = min(MAX_UPLOAD_BYTES, PUBLIC_API_UPLOAD_LIMIT)
+
+# Yuklab olish boshlanishidan oldin diskda band qilinadigan joy (video + audio)
+DISK_JOB_RESERVE_BYTES = int(os.getenv("DISK_JOB_RESERVE_BYTES", str(2 * MAX_UPLOAD_BYTES)))
+
+# Ish kataloglari (DATA_DIR/work) egallashi mumkin bo'lgan maksimal hajm
+DISK_CACHE_MAX_BYTES = int(os.getenv("DISK_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+# Yuqori chegaradan oshsa pastki chegaragacha eng eski kataloglar o'chiriladi
+DISK_CACHE_HIGH_WATERMARK = float(os.getenv("DISK_CACHE_HIGH_WATERMARK", "0.9"))
+DISK_CACHE_LOW_WATERMARK = float(os.getenv("DISK_CACHE_LOW_WATERMARK", "0.7"))
+# Diskda kamida shuncha bo'sh joy qolishi kerak (tozalash 2 baravarigacha davom etadi)
+DISK_MIN_FREE_BYTES = int(os.getenv("DISK_MIN_FREE_BYTES", str(1024 ** 3)))
+# Ishlatilmayotgan katalog shuncha soniyadan keyin hajmdan qat'i nazar o'chiriladi
+DISK_CACHE_MAX_AGE = int(os.getenv("DISK_CACHE_MAX_AGE", str(7 * 86400)))
+
+# Update qabul qilish rejimi: polling yoki webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Webhook parametrlari (BOT_MODE=webhook)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # tashqi manzil, masalan https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # bo'sh bo'lsa BOT_TOKEN dan hosil qilinadi (barcha nusxalarda bir xil)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Telegram: 1-100
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBAPP_BACKLOG = int(os.getenv("WEBAPP_BACKLOG", "1024"))
+
+# FSM holati: memory (bitta nusxa) yoki sqlite (bazadagi umumiy jadval -
+# load balancer ortidagi bir nechta nusxa uchun shart)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory").lower()
+
+# Prometheus /metrics serveri (0 - o'chirilgan)
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
 # Logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
@@ -29,7 +81,8 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 SUPPORT_ADMIN = os.getenv("SUPPORT_ADMIN", "@admin")
 
 # Yuklab olish parametrlari
-DOWNLOAD_TIMEOUT = 300  # 5 daqiqa
+DOWNLOAD_TIMEOUT = int(os.getenv("DOWNLOAD_TIMEOUT", "300"))  # 5 daqiqa
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))  # Parallel yt-dlp jarayonlari
 MAX_RETRIES = 3
 RETRY_DELAY = 2
 
@@ -37,9 +90,13 @@ RETRY_DELAY = 2
 THUMBNAIL_QUALITY = 85
 IMAGE_QUALITY = 90
 
-# Audio sifati (kbps)
+# Audio sifati (kbps) - faqat MP3 ga qayta kodlashda ishlatiladi
 AUDIO_BITRATE = "192k"
 
+# true - audio har doim MP3 ga qayta kodlanadi (eski xatti-harakat).
+# false - AAC/Opus/MP3 asl kodekda remux qilinadi (-acodec copy)
+AUDIO_FORCE_MP3 = os.getenv("AUDIO_FORCE_MP3", "false").lower() in ("1", "true", "yes")
+
 # Video formatlar
 VIDEO_FORMAT = "bv*+ba/b[ext=mp4]/b"
 VIDEO_MERGE_FORMAT = "mp4"
@@ -2,132 +2,185 @@
 Database va ma'lumotlar boshqarish
 SQLite bilan ishlash
 """
+import asyncio
+import functools
+import gzip
+import os
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from typing import Optional, List, Dict, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Sequence, Tuple
 import json
 import logging
 
+from app.config import INSTANCE_ID
+from app.metrics import DB_QUERY_SECONDS
+from app.migrations import migrate
+from app.storage import StorageBackend
+from app.tracing import span
+from app.writebehind import WriteBehindBuffer
+
 logger = logging.getLogger(__name__)
 
 DB_PATH = Path("data/bot.db")
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+# SQLite sozlamalari
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))  # 64 MB page cache
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # 256 MB
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE = 256  # Har ulanishda tayyorlangan so'rovlar keshi
+# >1 bo'lsa users/downloads/notifications user_id bo'yicha shu nechta faylga bo'linadi
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+
+# Har nusxa bir martada band qiladigan download id lari (id_sequences dan)
+DOWNLOAD_ID_BLOCK = int(os.getenv("DOWNLOAD_ID_BLOCK", "100"))
+
+# notifications.user_id = 0 - barcha foydalanuvchilar uchun bitta qator
+BROADCAST_USER_ID = 0
+
+# Foydalanuvchi qatorlari keshi
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))  # soniya
+
+# Yuklab olish tarixini saqlash: eski qatorlar oylik siqilgan arxivga ko'chiriladi
+DOWNLOAD_RETENTION_DAYS = int(os.getenv("DOWNLOAD_RETENTION_DAYS", "90"))
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "data/archive"))
+RETENTION_BATCH_SIZE = 5000
+VACUUM_PAGES = 2000  # Bitta incremental_vacuum da bo'shatiladigan sahifalar
+
+
+class UserCache:
+    """users qatorlari uchun cheklangan LRU + TTL kesh.
+
+    Qatorlar nusxa sifatida beriladi; mutatorlar invalidate/update chaqiradi.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._rows: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._rows.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._rows[user_id]
+                self.misses += 1
+                return None
+            self._rows.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, user_id: int, row: Dict):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._rows[user_id] = (time.monotonic() + self.ttl, dict(row))
+            self._rows.move_to_end(user_id)
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+
+    def update(self, user_id: int, **fields):
+        """Keshdagi qatorni joyida yangilash (bo'lmasa hech narsa qilmaydi)"""
+        with self._lock:
+            entry = self._rows.get(user_id)
+            if entry is not None:
+                entry[1].update(fields)
+
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            for user_id in user_ids:
+                self._rows.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._rows),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
 
-class Database:
-    """Database boshqaruvchi"""
 
-    def __init__(self, db_path: Path = DB_PATH):
+class Database(StorageBackend):
+    """Database boshqaruvchi (bitta SQLite fayl)"""
+
+    def __init__(self, db_path: Path = DB_PATH, instance_id: str = INSTANCE_ID):
         self.db_path = db_path
+        # downloads qatorlari shu nusxa nomi bilan belgilanadi (tiklash uchun)
+        self.instance_id = instance_id
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.user_cache = UserCache()
+        self._id_lock = threading.Lock()
+        # Band qilingan oraliq: [_next_download_id, _download_id_end)
+        self._next_download_id = self._download_id_end = 0
         self.init_db()
 
-    def get_connection(self):
-        """Database ulanishi"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    def get_connection(self) -> sqlite3.Connection:
+        """Joriy oqim uchun doimiy ulanish.
 
-    def init_db(self):
-        """Jadvallarni yaratish"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Users jadvali
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                is_admin BOOLEAN DEFAULT 0,
-                is_banned BOOLEAN DEFAULT 0,
-                join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                downloads_count INTEGER DEFAULT 0,
-                storage_used INTEGER DEFAULT 0
-            )
-        ''')
-
-        # Download history jadvali
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS downloads (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                url TEXT NOT NULL,
-                format TEXT NOT NULL,
-                title TEXT,
-                file_size INTEGER,
-                status TEXT,
-                download_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completion_time TIMESTAMP,
-                error_message TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        ''')
-
-        # Messages jadvali (broadcast uchun)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sender_id INTEGER NOT NULL,
-                message_text TEXT NOT NULL,
-                is_broadcast BOOLEAN DEFAULT 0,
-                target_users TEXT,
-                sent_count INTEGER DEFAULT 0,
-                failed_count INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (sender_id) REFERENCES users(user_id)
-            )
-        ''')
-
-        # Statistics jadvali
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS statistics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE DEFAULT CURRENT_DATE,
-                total_users INTEGER DEFAULT 0,
-                active_users INTEGER DEFAULT 0,
-                total_downloads INTEGER DEFAULT 0,
-                successful_downloads INTEGER DEFAULT 0,
-                failed_downloads INTEGER DEFAULT 0,
-                total_storage_used INTEGER DEFAULT 0,
-                avg_download_time REAL DEFAULT 0,
-                platforms_used TEXT
-            )
-        ''')
-
-        # Admin logs jadvali
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS admin_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                admin_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                target_user_id INTEGER,
-                details TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (admin_id) REFERENCES users(user_id),
-                FOREIGN KEY (target_user_id) REFERENCES users(user_id)
-            )
-        ''')
-
-        # Notifications jadvali
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                message TEXT NOT NULL,
-                notification_type TEXT,
-                is_read BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                read_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
+        Ulanish har so'rovda ochilib-yopilmaydi: `with self.get_connection() as conn`
+        tranzaksiyani commit/rollback qiladi, lekin ulanishni yopmaydi.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                cached_statements=DB_STATEMENT_CACHE,
+                # Ulanish faqat o'z oqimida ishlatiladi; close() boshqa oqimdan chaqirilishi mumkin
+                check_same_thread=False,
             )
-        ''')
+            conn.row_factory = sqlite3.Row
+            self._configure_connection(conn)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _configure_connection(conn: sqlite3.Connection):
+        """WAL va ishlash tezligi uchun pragmalar"""
+        # Yangi bazada darhol ishlaydi; eskisi enable_incremental_vacuum() bilan qo'lda o'tkaziladi
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        # WAL bilan NORMAL xavfsiz: faqat checkpoint da fsync
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
 
-        conn.commit()
-        conn.close()
-        logger.info("✅ Database jadvallari yaratildi")
+    def close(self):
+        """Barcha oqimlarning ulanishlarini yopish"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def init_db(self):
+        """Jadvallarni yaratish va sxemani oxirgi versiyaga migratsiya qilish"""
+        version = migrate(self.get_connection())
+        logger.info(f"✅ Database jadvallari tayyor (sxema v{version})")
 
     # USER OPERATSIYALARI
 
@@ -135,29 +188,34 @@ class Database:
                  last_name: str = "", is_admin: bool = False) -> bool:
         """Foydalanuvchi qo'shish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR IGNORE INTO users 
-                (user_id, username, first_name, last_name, is_admin)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name, is_admin))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR IGNORE INTO users 
+                    (user_id, username, first_name, last_name, is_admin)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, username, first_name, last_name, is_admin))
+            self.user_cache.invalidate(user_id)
             return True
         except Exception as e:
             logger.error(f"User qo'shishda xatolik: {e}")
             return False
 
     def get_user(self, user_id: int) -> Optional[Dict]:
-        """Foydalanuvchi ma'lumoti"""
+        """Foydalanuvchi ma'lumoti (avval keshdan)"""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return cached
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            user = cursor.fetchone()
-            conn.close()
-            return dict(user) if user else None
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+                user = cursor.fetchone()
+            if not user:
+                return None
+            user = dict(user)
+            self.user_cache.put(user_id, user)
+            return dict(user)
         except Exception as e:
             logger.error(f"User olishda xatolik: {e}")
             return None
@@ -166,39 +224,107 @@ class Database:
                      is_banned: Optional[bool] = None) -> List[Dict]:
         """Barcha foydalanuvchilar"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
 
-            query = 'SELECT * FROM users'
-            params = []
+                query = 'SELECT * FROM users'
+                params = []
 
-            if is_admin is not None:
-                query += ' WHERE is_admin = ?'
-                params.append(is_admin)
+                if is_admin is not None:
+                    query += ' WHERE is_admin = ?'
+                    params.append(is_admin)
 
-            if is_banned is not None:
-                if params:
-                    query += ' AND is_banned = ?'
-                else:
-                    query += ' WHERE is_banned = ?'
-                params.append(is_banned)
+                if is_banned is not None:
+                    if params:
+                        query += ' AND is_banned = ?'
+                    else:
+                        query += ' WHERE is_banned = ?'
+                    params.append(is_banned)
 
-            cursor.execute(query, params)
-            users = cursor.fetchall()
-            conn.close()
+                cursor.execute(query, params)
+                users = cursor.fetchall()
             return [dict(user) for user in users]
         except Exception as e:
             logger.error(f"Foydalanuvchilar olishda xatolik: {e}")
             return []
 
+    def get_user_counts(self) -> Dict:
+        """Jami / admin / ban qilingan / faol foydalanuvchilar soni (SQL da)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT
+                        (SELECT COUNT(*) FROM users) as total,
+                        (SELECT COUNT(*) FROM users WHERE is_admin = 1) as admins,
+                        (SELECT COUNT(*) FROM users WHERE is_banned = 1) as banned
+                ''')
+                row = cursor.fetchone()
+            return {
+                'total': row['total'],
+                'admins': row['admins'],
+                'banned': row['banned'],
+                'active': row['total'] - row['banned'],
+            }
+        except Exception as e:
+            logger.error(f"Foydalanuvchilar sonini olishda xatolik: {e}")
+            return {'total': 0, 'admins': 0, 'banned': 0, 'active': 0}
+
+    def get_top_users(self, limit: int = 5) -> List[Dict]:
+        """Eng ko'p yuklab olgan foydalanuvchilar (indeks bo'yicha top-N)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT user_id, username, downloads_count FROM users
+                    ORDER BY downloads_count DESC, user_id DESC
+                    LIMIT ?
+                ''', (limit,))
+                users = cursor.fetchall()
+            return [dict(user) for user in users]
+        except Exception as e:
+            logger.error(f"Top foydalanuvchilarni olishda xatolik: {e}")
+            return []
+
+    def get_users_page(self, cursor_id: int = 0, direction: str = "next",
+                       limit: int = 10) -> Tuple[List[Dict], bool]:
+        """user_id bo'yicha keyset sahifa.
+
+        next - cursor_id dan keyingi, prev - cursor_id dan oldingi foydalanuvchilar.
+        Qaytadi: (user_id o'sish tartibidagi qatorlar, shu yo'nalishda yana bormi)
+        """
+        if direction == "prev":
+            query = '''
+                SELECT user_id, username, downloads_count, is_admin, is_banned FROM users
+                WHERE user_id < ? ORDER BY user_id DESC LIMIT ?
+            '''
+        else:
+            query = '''
+                SELECT user_id, username, downloads_count, is_admin, is_banned FROM users
+                WHERE user_id > ? ORDER BY user_id LIMIT ?
+            '''
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # Bitta ortiqcha qator - keyingi sahifa borligini bilish uchun
+                cursor.execute(query, (cursor_id, limit + 1))
+                users = [dict(user) for user in cursor.fetchall()]
+            has_more = len(users) > limit
+            users = users[:limit]
+            if direction == "prev":
+                users.reverse()
+            return users, has_more
+        except Exception as e:
+            logger.error(f"Foydalanuvchilar sahifasini olishda xatolik: {e}")
+            return [], False
+
     def ban_user(self, user_id: int, reason: str = "") -> bool:
         """Foydalanuvchini ban qilish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET is_banned = 1 WHERE user_id = ?', (user_id,))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('UPDATE users SET is_banned = 1 WHERE user_id = ?', (user_id,))
+            self.user_cache.update(user_id, is_banned=1)
             logger.info(f"👤 {user_id} ban qilindi. Sabab: {reason}")
             return True
         except Exception as e:
@@ -208,11 +334,10 @@ class Database:
     def unban_user(self, user_id: int) -> bool:
         """Ban olib tashlash"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET is_banned = 0 WHERE user_id = ?', (user_id,))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('UPDATE users SET is_banned = 0 WHERE user_id = ?', (user_id,))
+            self.user_cache.update(user_id, is_banned=0)
             logger.info(f"👤 {user_id} unbanned")
             return True
         except Exception as e:
@@ -222,11 +347,10 @@ class Database:
     def make_admin(self, user_id: int) -> bool:
         """Admin qilish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET is_admin = 1 WHERE user_id = ?', (user_id,))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('UPDATE users SET is_admin = 1 WHERE user_id = ?', (user_id,))
+            self.user_cache.update(user_id, is_admin=1)
             logger.info(f"👑 {user_id} admin qilindi")
             return True
         except Exception as e:
@@ -236,11 +360,10 @@ class Database:
     def remove_admin(self, user_id: int) -> bool:
         """Admin o'chirish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET is_admin = 0 WHERE user_id = ?', (user_id,))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('UPDATE users SET is_admin = 0 WHERE user_id = ?', (user_id,))
+            self.user_cache.update(user_id, is_admin=0)
             logger.info(f"👑 {user_id} adminlik olib tashlandi")
             return True
         except Exception as e:
@@ -250,102 +373,434 @@ class Database:
     def update_user_activity(self, user_id: int):
         """Foydalanuvchi faoliyatini yangilash"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                'UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?',
-                (user_id,)
-            )
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?',
+                    (user_id,)
+                )
+            self.user_cache.invalidate(user_id)
         except Exception as e:
             logger.error(f"Faoliyat yangilashda xatolik: {e}")
 
     # DOWNLOAD OPERATSIYALARI
 
+    def allocate_download_id(self, user_id: int) -> int:
+        """Keyingi download id (write-behind bufer bilan umumiy hisoblagich).
+
+        Id lar shu nusxa band qilgan oraliqdan beriladi; oraliq tugasa bazadan
+        yangisi olinadi, shuning uchun bir bazadagi nusxalar id da to'qnashmaydi.
+        """
+        with self._id_lock:
+            if self._next_download_id >= self._download_id_end:
+                first = self.reserve_ids('downloads', DOWNLOAD_ID_BLOCK, self.get_max_download_id())
+                self._next_download_id, self._download_id_end = first, first + DOWNLOAD_ID_BLOCK
+            download_id = self._next_download_id
+            self._next_download_id += 1
+        return download_id
+
+    def reserve_ids(self, name: str, count: int, floor: int = 0) -> int:
+        """id_sequences dagi `name` hisoblagichidan count ta id band qilish.
+
+        floor - bazada allaqachon bor eng katta id. Bitta yozish tranzaksiyasi,
+        shuning uchun boshqa jarayonlar bu oraliqni ololmaydi.
+        Returns: oraliqning birinchi id si
+        """
+        with self.get_connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO id_sequences (name, value) VALUES (?, ?)', (name, floor))
+            conn.execute('UPDATE id_sequences SET value = MAX(value, ?) + ? WHERE name = ?',
+                         (floor, count, name))
+            end = conn.execute('SELECT value FROM id_sequences WHERE name = ?', (name,)).fetchone()[0]
+        return end - count + 1
+
     def log_download(self, user_id: int, url: str, format_type: str,
-                    title: str = "", file_size: int = 0, status: str = "pending") -> int:
-        """Download logga qo'shish"""
+                    title: str = "", file_size: int = 0, status: str = "pending",
+                    download_id: Optional[int] = None) -> int:
+        """Download logga qo'shish (download_id - oldindan ajratilgan id)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO downloads (user_id, url, format, title, file_size, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, url, format_type, title, file_size, status))
-            conn.commit()
-            download_id = cursor.lastrowid
-            conn.close()
+            if download_id is None:
+                download_id = self.allocate_download_id(user_id)
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO downloads (id, user_id, url, format, title, file_size, status, instance_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (download_id, user_id, url, format_type, title, file_size, status, self.instance_id))
             return download_id
         except Exception as e:
             logger.error(f"Download log qo'shishda xatolik: {e}")
             return 0
 
-    def complete_download(self, download_id: int, file_size: int = 0):
+    def complete_download(self, download_id: int, file_size: int = 0,
+                          cache_hit: bool = False):
         """Download tugallash"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE downloads 
-                SET status = 'completed', 
-                    completion_time = CURRENT_TIMESTAMP,
-                    file_size = ?
-                WHERE id = ?
-            ''', (file_size, download_id))
-
-            # User statistikasini yangilash
-            cursor.execute('SELECT user_id FROM downloads WHERE id = ?', (download_id,))
-            result = cursor.fetchone()
-            if result:
-                user_id = result[0]
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''
-                    UPDATE users 
-                    SET downloads_count = downloads_count + 1,
-                        storage_used = storage_used + ?
-                    WHERE user_id = ?
-                ''', (file_size, user_id))
+                    UPDATE downloads 
+                    SET status = 'completed', 
+                        completion_time = CURRENT_TIMESTAMP,
+                        file_size = ?,
+                        cache_hit = ?
+                    WHERE id = ?
+                ''', (file_size, cache_hit, download_id))
+
+                # User statistikasini yangilash
+                cursor.execute('SELECT user_id FROM downloads WHERE id = ?', (download_id,))
+                result = cursor.fetchone()
+                if result:
+                    user_id = result[0]
+                    cursor.execute('''
+                        UPDATE users 
+                        SET downloads_count = downloads_count + 1,
+                            storage_used = storage_used + ?
+                        WHERE user_id = ?
+                    ''', (file_size, user_id))
+                    self.user_cache.invalidate(user_id)
 
-            conn.commit()
-            conn.close()
         except Exception as e:
             logger.error(f"Download tugallashda xatolik: {e}")
 
     def fail_download(self, download_id: int, error_message: str = ""):
         """Download muvaffaqiyatsiz"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE downloads 
-                SET status = 'failed', 
-                    completion_time = CURRENT_TIMESTAMP,
-                    error_message = ?
-                WHERE id = ?
-            ''', (error_message, download_id))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE downloads 
+                    SET status = 'failed', 
+                        completion_time = CURRENT_TIMESTAMP,
+                        error_message = ?
+                    WHERE id = ?
+                ''', (error_message, download_id))
         except Exception as e:
             logger.error(f"Download failure qo'shishda xatolik: {e}")
 
+    def recover_stale_downloads(self, started_before: str, alive: Sequence[str] = (),
+                                error_message: str = "Interrupted by restart") -> List[Dict]:
+        """Jarayon o'lganda qolib ketgan pending/processing qatorlarini failed qilish.
+
+        started_before - joriy jarayon boshlangan vaqt (undan keyingi qatorlarga
+        tegilmaydi). alive - tirik boshqa nusxalar: ularning ishlari davom
+        etmoqda, shuning uchun faqat shu nusxa, o'lgan nusxalar va egasiz (eski)
+        qatorlar tiklanadi. Failed qilingan qatorlar qaytariladi.
+        """
+        placeholders = ",".join("?" * len(alive))
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT id, user_id, url, format, download_time, instance_id FROM downloads
+                    WHERE status IN ('pending', 'processing') AND download_time < ?
+                      AND COALESCE(instance_id, '') NOT IN ({placeholders})
+                ''', (started_before, *alive))
+                rows = [dict(r) for r in cursor.fetchall()]
+                cursor.executemany('''
+                    UPDATE downloads
+                    SET status = 'failed',
+                        completion_time = CURRENT_TIMESTAMP,
+                        error_message = ?
+                    WHERE id = ?
+                ''', [(error_message, row['id']) for row in rows])
+            return rows
+        except Exception as e:
+            logger.error(f"Qolib ketgan downloadlarni tiklashda xatolik: {e}")
+            return []
+
+    def heartbeat(self):
+        """Shu nusxa tirikligini yozish (tiklashda uning ishlariga tegilmaydi)"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    INSERT INTO instances (instance_id, heartbeat_at) VALUES (?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(instance_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+                ''', (self.instance_id,))
+        except Exception as e:
+            logger.error(f"Heartbeat yozishda xatolik: {e}")
+
+    def live_instances(self, lease_seconds: int) -> List[str]:
+        """Oxirgi lease_seconds ichida heartbeat yozgan boshqa nusxalar"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT instance_id FROM instances
+                    WHERE heartbeat_at >= datetime('now', ?) AND instance_id != ?
+                ''', (f"-{int(lease_seconds)} seconds", self.instance_id))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Tirik nusxalarni o'qishda xatolik: {e}")
+            return []
+
+    def get_max_download_id(self) -> int:
+        """Eng katta download id (o'chirilganlarini ham hisobga olib)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT MAX(
+                        COALESCE((SELECT MAX(id) FROM downloads), 0),
+                        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'downloads'), 0)
+                    )
+                ''')
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Download id o'qishda xatolik: {e}")
+            return 0
+
+    def apply_write_batch(self, inserts: List[Tuple], updates: List[Tuple],
+                          activity: List[Tuple[int, str]]) -> Tuple[List, List, List]:
+        """Write-behind bufer yozuvlarini bitta tranzaksiyada yozish.
+
+        inserts: (id, user_id, url, format, title, file_size, status, download_time)
+        updates: (status, id, file_size, cache_hit, error_message, completion_time)
+        activity: (user_id, last_activity)
+        Partiya xato bersa qatorlar bittadan yoziladi: bitta buzuq qator
+        (masalan, id to'qnashuvi) qolganlarini to'sib qo'ymaydi. Qatori hali
+        yozilmagan download ning update i ham yozilmagan hisoblanadi va INSERT
+        bilan birga qayta urinadi.
+        Returns: yozilmagan (inserts, updates, activity); hammasi yozilsa bo'sh
+        """
+        if self._write_batch(inserts, updates, activity):
+            return [], [], []
+        failed: Tuple[List, List, List] = ([], [], [])
+        if len(inserts) + len(updates) + len(activity) == 1:
+            for rows, batch in zip(failed, (inserts, updates, activity)):
+                rows.extend(batch)
+            return failed
+        for index, batch in enumerate((inserts, updates, activity)):
+            for row in batch:
+                single: Tuple[List, List, List] = ([], [], [])
+                single[index].append(row)
+                if not self._write_batch(*single):
+                    failed[index].append(row)
+        return failed
+
+    def _write_batch(self, inserts: List[Tuple], updates: List[Tuple],
+                     activity: List[Tuple[int, str]]) -> bool:
+        completed_users = set()
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO downloads
+                        (id, user_id, url, format, title, file_size, status, download_time, instance_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(*row, self.instance_id) for row in inserts])
+
+                for status, download_id, file_size, cache_hit, error_message, ts in updates:
+                    if status == 'completed':
+                        cursor.execute('''
+                            UPDATE downloads
+                            SET status = 'completed', completion_time = ?, file_size = ?, cache_hit = ?
+                            WHERE id = ?
+                        ''', (ts, file_size, cache_hit, download_id))
+                        self._require_download(cursor, download_id)
+                        cursor.execute('''
+                            UPDATE users
+                            SET downloads_count = downloads_count + 1,
+                                storage_used = storage_used + ?
+                            WHERE user_id = (SELECT user_id FROM downloads WHERE id = ?)
+                        ''', (file_size, download_id))
+                        cursor.execute('SELECT user_id FROM downloads WHERE id = ?', (download_id,))
+                        row = cursor.fetchone()
+                        if row:
+                            completed_users.add(row[0])
+                    else:
+                        cursor.execute('''
+                            UPDATE downloads
+                            SET status = 'failed', completion_time = ?, error_message = ?
+                            WHERE id = ?
+                        ''', (ts, error_message, download_id))
+                        self._require_download(cursor, download_id)
+
+                cursor.executemany(
+                    'UPDATE users SET last_activity = ? WHERE user_id = ?',
+                    [(ts, user_id) for user_id, ts in activity]
+                )
+            # Faoliyat joyida yangilanadi, statistikasi o'zgarganlar qayta o'qiladi
+            for user_id, ts in activity:
+                self.user_cache.update(user_id, last_activity=ts)
+            self.user_cache.invalidate(*completed_users)
+            return True
+        except Exception as e:
+            logger.error(f"Write-behind yozuvlarini yozishda xatolik: {e}")
+            return False
+
+    @staticmethod
+    def _require_download(cursor: sqlite3.Cursor, download_id: int):
+        # Yo'q qatorga update yozilmaydi: tranzaksiya bekor bo'lib, qayta urinadi
+        if cursor.rowcount == 0:
+            raise LookupError(f"download {download_id} hali yozilmagan")
+
+    def archive_downloads(self, older_than_days: int = DOWNLOAD_RETENTION_DAYS,
+                          archive_dir: Path = ARCHIVE_DIR,
+                          batch_size: int = RETENTION_BATCH_SIZE) -> int:
+        """Eski downloads qatorlarini oylik gzip JSONL arxivga ko'chirish.
+
+        users.downloads_count/storage_used va statistika rollup lari alohida
+        saqlanadi, shuning uchun qatorlarni o'chirish ularga ta'sir qilmaydi.
+        Qaytadi: arxivlangan qatorlar soni.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+        archive_dir = Path(archive_dir)
+        archived = 0
+        try:
+            while True:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    # id vaqt bilan birga o'sadi: eng eskilari jadval boshida, indeks kerak emas
+                    cursor.execute('SELECT * FROM downloads ORDER BY id LIMIT ?', (batch_size,))
+                    rows = []
+                    for row in cursor.fetchall():
+                        if row['download_time'] is None or row['download_time'] >= cutoff:
+                            break
+                        rows.append(dict(row))
+                    if not rows:
+                        break
+
+                    # Avval arxivga yozamiz, keyin o'chiramiz: uzilishda yo'qotish bo'lmaydi
+                    by_month: Dict[str, List[Dict]] = {}
+                    for row in rows:
+                        by_month.setdefault(row['download_time'][:7], []).append(row)
+                    archive_dir.mkdir(parents=True, exist_ok=True)
+                    for month, month_rows in by_month.items():
+                        path = archive_dir / f"downloads-{month}.jsonl.gz"
+                        # gzip append - fayl oxiriga yangi member qo'shiladi
+                        with gzip.open(path, "at", encoding="utf-8") as f:
+                            for row in month_rows:
+                                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+                    cursor.execute('DELETE FROM downloads WHERE id <= ?', (rows[-1]['id'],))
+                archived += len(rows)
+                if len(rows) < batch_size:
+                    break
+
+            if archived:
+                logger.info(f"🗄️ {archived} ta eski download arxivlandi: {archive_dir}")
+            return archived
+        except Exception as e:
+            logger.error(f"Download arxivlashda xatolik: {e}")
+            return archived
+
+    def incremental_vacuum(self, pages: int = VACUUM_PAGES) -> int:
+        """Bo'sh sahifalarni qisman qaytarish. Qaytadi: bo'shatilgan sahifalar"""
+        try:
+            conn = self.get_connection()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # Eski baza: to'liq VACUUM bu yerda qilinmaydi (butun faylni bloklaydi)
+                logger.info("🧹 auto_vacuum INCREMENTAL emas - o'tkazib yuborildi (/vacuum_full bilan yoqing)")
+                return 0
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            freed = before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            return freed
+        except Exception as e:
+            logger.error(f"Incremental vacuum xatosi: {e}")
+            return 0
+
+    def enable_incremental_vacuum(self) -> bool:
+        """Eski bazada auto_vacuum=INCREMENTAL ni yoqish (bir martalik to'liq VACUUM).
+
+        Butun fayl qayta yoziladi va shu vaqtda baza bloklanadi, shuning uchun
+        faqat admin buyrug'i bilan, kam trafik vaqtida ishga tushiriladi.
+        Qaytadi: True - yoqildi (yoki allaqachon yoqilgan)
+        """
+        try:
+            conn = self.get_connection()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return True
+            logger.warning(f"🧹 {self.db_path}: auto_vacuum=INCREMENTAL uchun to'liq VACUUM")
+            started = time.monotonic()
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            logger.info(f"🧹 VACUUM tugadi: {time.monotonic() - started:.1f}s")
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        except Exception as e:
+            logger.error(f"To'liq VACUUM xatosi: {e}")
+            return False
+
     def get_user_downloads(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Foydalanuvchining yuklab olishlari"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM downloads 
-                WHERE user_id = ? 
-                ORDER BY download_time DESC 
-                LIMIT ?
-            ''', (user_id, limit))
-            downloads = cursor.fetchall()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM downloads 
+                    WHERE user_id = ? 
+                    ORDER BY download_time DESC 
+                    LIMIT ?
+                ''', (user_id, limit))
+                downloads = cursor.fetchall()
             return [dict(d) for d in downloads]
         except Exception as e:
             logger.error(f"Yuklab olishlari o'qishda xatolik: {e}")
             return []
 
+    # FILE_ID KESH OPERATSIYALARI
+
+    def get_cached_files(self, url_key: str, format_type: str) -> Dict[str, Dict]:
+        """Keshdagi file_id lar (media_type -> yozuv)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM file_cache
+                    WHERE url_key = ? AND format = ?
+                ''', (url_key, format_type))
+                rows = cursor.fetchall()
+            return {row['media_type']: dict(row) for row in rows}
+        except Exception as e:
+            logger.error(f"Keshni o'qishda xatolik: {e}")
+            return {}
+
+    def cache_file(self, url_key: str, format_type: str, media_type: str,
+                   file_id: str, title: str = "", file_size: int = 0):
+        """Yuborilgan faylning file_id sini keshga yozish"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO file_cache
+                    (url_key, format, media_type, file_id, title, file_size)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (url_key, format_type, media_type, file_id, title, file_size))
+        except Exception as e:
+            logger.error(f"Keshga yozishda xatolik: {e}")
+
+    def record_cache_hit(self, url_key: str, format_type: str):
+        """Kesh hit hisoblagichini oshirish"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE file_cache
+                    SET hits = hits + 1, last_hit = CURRENT_TIMESTAMP
+                    WHERE url_key = ? AND format = ?
+                ''', (url_key, format_type))
+        except Exception as e:
+            logger.error(f"Kesh hit yozishda xatolik: {e}")
+
+    def invalidate_cache(self, url_key: str, format_type: str,
+                         media_types: Optional[List[str]] = None):
+        """Yaroqsiz file_id larni keshdan o'chirish (media_types - faqat shular)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if media_types is None:
+                    cursor.execute(
+                        'DELETE FROM file_cache WHERE url_key = ? AND format = ?',
+                        (url_key, format_type)
+                    )
+                else:
+                    cursor.executemany(
+                        'DELETE FROM file_cache WHERE url_key = ? AND format = ? AND media_type = ?',
+                        [(url_key, format_type, media_type) for media_type in media_types]
+                    )
+        except Exception as e:
+            logger.error(f"Keshni o'chirishda xatolik: {e}")
+
     # MESSAGE OPERATSIYALARI
 
     def send_message(self, sender_id: int, message_text: str,
@@ -353,19 +808,17 @@ class Database:
                     is_broadcast: bool = False) -> int:
         """Xabar yuborish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
 
-            targets_json = json.dumps(target_users) if target_users else None
+                targets_json = json.dumps(target_users) if target_users else None
 
-            cursor.execute('''
-                INSERT INTO messages (sender_id, message_text, target_users, is_broadcast)
-                VALUES (?, ?, ?, ?)
-            ''', (sender_id, message_text, targets_json, is_broadcast))
+                cursor.execute('''
+                    INSERT INTO messages (sender_id, message_text, target_users, is_broadcast)
+                    VALUES (?, ?, ?, ?)
+                ''', (sender_id, message_text, targets_json, is_broadcast))
 
-            conn.commit()
-            message_id = cursor.lastrowid
-            conn.close()
+                message_id = cursor.lastrowid
             return message_id
         except Exception as e:
             logger.error(f"Xabar yuborish xatosi: {e}")
@@ -374,16 +827,15 @@ class Database:
     def get_pending_messages(self, limit: int = 10) -> List[Dict]:
         """Yuborilmagan xabarlar"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM messages 
-                WHERE sent_count = 0
-                ORDER BY created_at
-                LIMIT ?
-            ''', (limit,))
-            messages = cursor.fetchall()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM messages
+                    WHERE status = 'pending'
+                    ORDER BY created_at
+                    LIMIT ?
+                ''', (limit,))
+                messages = cursor.fetchall()
             return [dict(m) for m in messages]
         except Exception as e:
             logger.error(f"Xabarlarni o'qishda xatolik: {e}")
@@ -392,69 +844,273 @@ class Database:
     def update_message_status(self, message_id: int, sent_count: int, failed_count: int):
         """Xabar statusini yangilash"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE messages 
-                SET sent_count = ?, failed_count = ?
-                WHERE id = ?
-            ''', (sent_count, failed_count, message_id))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE messages 
+                    SET sent_count = ?, failed_count = ?
+                    WHERE id = ?
+                ''', (sent_count, failed_count, message_id))
         except Exception as e:
             logger.error(f"Xabar statusini yangilashda xatolik: {e}")
 
+    def create_broadcast(self, sender_id: int, message_text: str,
+                         copy_from_chat_id: Optional[int] = None,
+                         copy_message_id: Optional[int] = None,
+                         progress_chat_id: Optional[int] = None,
+                         progress_message_id: Optional[int] = None,
+                         user_ids: Optional[List[int]] = None) -> int:
+        """Broadcast va uning qabul qiluvchilari (bitta tranzaksiya).
+
+        user_ids berilmasa - bazadagi ban qilinmagan barcha foydalanuvchilar.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO messages (sender_id, message_text, is_broadcast, copy_from_chat_id,
+                                          copy_message_id, progress_chat_id, progress_message_id)
+                    VALUES (?, ?, 1, ?, ?, ?, ?)
+                ''', (sender_id, message_text, copy_from_chat_id, copy_message_id,
+                      progress_chat_id, progress_message_id))
+                message_id = cursor.lastrowid
+
+                if user_ids is None:
+                    cursor.execute('''
+                        INSERT INTO broadcast_recipients (message_id, user_id)
+                        SELECT ?, user_id FROM users WHERE is_banned = 0
+                    ''', (message_id,))
+                else:
+                    cursor.executemany(
+                        'INSERT OR IGNORE INTO broadcast_recipients (message_id, user_id) VALUES (?, ?)',
+                        [(message_id, user_id) for user_id in user_ids]
+                    )
+            return message_id
+        except Exception as e:
+            logger.error(f"Broadcast yaratishda xatolik: {e}")
+            return 0
+
+    def get_broadcast_recipients(self, message_id: int, after_user_id: int = 0,
+                                 limit: int = 500) -> List[int]:
+        """Hali yuborilmagan qabul qiluvchilar (keyset sahifa)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT user_id FROM broadcast_recipients
+                    WHERE message_id = ? AND status = 'pending' AND user_id > ?
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (message_id, after_user_id, limit))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Broadcast qabul qiluvchilarini o'qishda xatolik: {e}")
+            return []
+
+    def count_broadcast_pending(self, message_id: int) -> int:
+        """Hali yuborilmagan qabul qiluvchilar soni"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT COUNT(*) FROM broadcast_recipients
+                    WHERE message_id = ? AND status = 'pending'
+                ''', (message_id,))
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Broadcast holatini o'qishda xatolik: {e}")
+            return 0
+
+    def record_broadcast_results(self, message_id: int,
+                                 results: List[Tuple[int, str, Optional[str]]]) -> bool:
+        """(user_id, status, error) natijalarini yozish va hisoblagichlarni oshirish.
+
+        Faqat pending qatorlar o'zgaradi, shuning uchun takroriy yozuv
+        hisoblagichlarni ikki marta oshirmaydi.
+        """
+        if not results:
+            return True
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                sent = failed = 0
+                for user_id, status, error in results:
+                    cursor.execute('''
+                        UPDATE broadcast_recipients
+                        SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE message_id = ? AND user_id = ? AND status = 'pending'
+                    ''', (status, error, message_id, user_id))
+                    if cursor.rowcount:
+                        if status == "sent":
+                            sent += 1
+                        else:
+                            failed += 1
+                cursor.execute('''
+                    UPDATE messages
+                    SET sent_count = sent_count + ?, failed_count = failed_count + ?
+                    WHERE id = ?
+                ''', (sent, failed, message_id))
+            return True
+        except Exception as e:
+            logger.error(f"Broadcast natijalarini yozishda xatolik: {e}")
+            return False
+
+    def finish_broadcast(self, message_id: int):
+        """Broadcastni tugallangan deb belgilash"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE messages
+                    SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (message_id,))
+        except Exception as e:
+            logger.error(f"Broadcastni yakunlashda xatolik: {e}")
+
     # NOTIFICATION OPERATSIYALARI
 
     def add_notification(self, user_id: int, message: str,
                         notification_type: str = "info") -> int:
         """Bildirishnoma qo'shish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO notifications (user_id, message, notification_type)
-                VALUES (?, ?, ?)
-            ''', (user_id, message, notification_type))
-            conn.commit()
-            notif_id = cursor.lastrowid
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO notifications (user_id, message, notification_type)
+                    VALUES (?, ?, ?)
+                ''', (user_id, message, notification_type))
+                notif_id = cursor.lastrowid
             return notif_id
         except Exception as e:
             logger.error(f"Bildirishnoma qo'shishda xatolik: {e}")
             return 0
 
-    def get_unread_notifications(self, user_id: int) -> List[Dict]:
-        """O'qilmagan bildirishnomalar"""
+    def broadcast_notification(self, message: str, notification_type: str = "info") -> int:
+        """Barcha foydalanuvchilarga bildirishnoma: bitta qator, bitta commit"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM notifications 
-                WHERE user_id = ? AND is_read = 0
-                ORDER BY created_at DESC
-            ''', (user_id,))
-            notifs = cursor.fetchall()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO notifications (user_id, message, notification_type)
+                    VALUES (?, ?, ?)
+                ''', (BROADCAST_USER_ID, message, notification_type))
+                notif_id = cursor.lastrowid
+            return notif_id
+        except Exception as e:
+            logger.error(f"Ommaviy bildirishnoma qo'shishda xatolik: {e}")
+            return 0
+
+    def get_unread_notifications(self, user_id: int, limit: int = 50) -> List[Dict]:
+        """O'qilmagan bildirishnomalar: shaxsiy va ro'yxatdan o'tgandan keyingi ommaviy.
+
+        Ban qilingan foydalanuvchi ommaviy bildirishnomalarni ko'rmaydi.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM (
+                        SELECT * FROM notifications
+                        WHERE user_id = ? AND is_read = 0
+                        UNION ALL
+                        SELECT * FROM notifications n
+                        WHERE n.user_id = ? AND n.is_read = 0
+                          AND n.created_at >= COALESCE(
+                              (SELECT join_date FROM users WHERE user_id = ?), '')
+                          AND NOT EXISTS (
+                              SELECT 1 FROM users WHERE user_id = ? AND is_banned = 1
+                          )
+                          AND NOT EXISTS (
+                              SELECT 1 FROM notification_reads r
+                              WHERE r.user_id = ? AND r.notification_id = n.id
+                          )
+                    )
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                ''', (user_id, BROADCAST_USER_ID, user_id, user_id, user_id, limit))
+                notifs = cursor.fetchall()
             return [dict(n) for n in notifs]
         except Exception as e:
             logger.error(f"Bildirishnomalarni o'qishda xatolik: {e}")
             return []
 
-    def mark_notification_read(self, notification_id: int):
-        """Bildirishnomani o'qish"""
+    def mark_notifications_read(self, user_id: int, notification_ids: List[int]):
+        """Foydalanuvchining bildirishnomalarini bitta tranzaksiyada o'qilgan qilish.
+
+        Ommaviy bildirishnomalar uchun notification_reads ga yoziladi.
+        """
+        if not notification_ids:
+            return
+        placeholders = ",".join("?" * len(notification_ids))
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE notifications 
-                SET is_read = 1, read_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (notification_id,))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    UPDATE notifications
+                    SET is_read = 1, read_at = CURRENT_TIMESTAMP
+                    WHERE user_id = ? AND id IN ({placeholders})
+                ''', (user_id, *notification_ids))
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO notification_reads (user_id, notification_id)
+                    SELECT ?, id FROM notifications
+                    WHERE user_id = ? AND id IN ({placeholders})
+                ''', (user_id, BROADCAST_USER_ID, *notification_ids))
         except Exception as e:
-            logger.error(f"Bildirishnoma o'qish xatosi: {e}")
+            logger.error(f"Bildirishnomalarni o'qishda xatolik: {e}")
+
+    # FSM OPERATSIYALARI
+
+    def get_fsm_state(self, key: str) -> Optional[str]:
+        """FSM holati (yo'q bo'lsa None)"""
+        try:
+            row = self.get_connection().execute(
+                'SELECT state FROM fsm_states WHERE key = ?', (key,)
+            ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"FSM holatini o'qishda xatolik: {e}")
+            return None
+
+    def set_fsm_state(self, key: str, state: Optional[str]):
+        """FSM holatini yozish; holat ham ma'lumot ham bo'sh bo'lsa qator o'chiriladi"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    INSERT INTO fsm_states (key, state) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+                ''', (key, state))
+                self._drop_empty_fsm(conn, key)
+        except Exception as e:
+            logger.error(f"FSM holatini yozishda xatolik: {e}")
+
+    def get_fsm_data(self, key: str) -> Dict:
+        """FSM ma'lumotlari"""
+        try:
+            row = self.get_connection().execute(
+                'SELECT data FROM fsm_states WHERE key = ?', (key,)
+            ).fetchone()
+            return json.loads(row[0]) if row else {}
+        except Exception as e:
+            logger.error(f"FSM ma'lumotini o'qishda xatolik: {e}")
+            return {}
+
+    def set_fsm_data(self, key: str, data: Dict):
+        """FSM ma'lumotlarini almashtirish"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    INSERT INTO fsm_states (key, data) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+                ''', (key, json.dumps(data, ensure_ascii=False)))
+                self._drop_empty_fsm(conn, key)
+        except Exception as e:
+            logger.error(f"FSM ma'lumotini yozishda xatolik: {e}")
+
+    @staticmethod
+    def _drop_empty_fsm(conn: sqlite3.Connection, key: str):
+        # state.clear() dan keyin jadvalda bo'sh qator qolmasin
+        conn.execute("DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
 
     # ADMIN LOG OPERATSIYALARI
 
@@ -462,29 +1118,26 @@ class Database:
                         target_user_id: Optional[int] = None, details: str = ""):
         """Admin amalni logga qo'shish"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO admin_logs (admin_id, action, target_user_id, details)
-                VALUES (?, ?, ?, ?)
-            ''', (admin_id, action, target_user_id, details))
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO admin_logs (admin_id, action, target_user_id, details)
+                    VALUES (?, ?, ?, ?)
+                ''', (admin_id, action, target_user_id, details))
         except Exception as e:
             logger.error(f"Admin log qo'shishda xatolik: {e}")
 
     def get_admin_logs(self, limit: int = 50) -> List[Dict]:
         """Admin loggari"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM admin_logs 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            ''', (limit,))
-            logs = cursor.fetchall()
-            conn.close()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM admin_logs 
+                    ORDER BY timestamp DESC 
+                    LIMIT ?
+                ''', (limit,))
+                logs = cursor.fetchall()
             return [dict(log) for log in logs]
         except Exception as e:
             logger.error(f"Admin loggani o'qishda xatolik: {e}")
@@ -493,46 +1146,113 @@ class Database:
     # STATISTICS
 
     def get_statistics(self) -> Dict:
-        """Bot statistikasi"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+        """Bot statistikasi.
 
-            cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_banned = 0')
-            total_users = cursor.fetchone()['count']
-
-            cursor.execute('SELECT COUNT(*) as count FROM users WHERE last_activity > datetime("now", "-1 day")')
-            active_users = cursor.fetchone()['count']
-
-            cursor.execute('SELECT COUNT(*) as count FROM downloads WHERE status = "completed"')
-            successful_downloads = cursor.fetchone()['count']
+        Hisoblagichlar stats_totals da triggerlar orqali yuritiladi, shuning uchun
+        tarix hajmidan qat'i nazar bitta qator o'qiladi. Faol foydalanuvchilar
+        last_activity indeksi bo'yicha faqat oxirgi 24 soat oralig'ida sanaladi.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
 
-            cursor.execute('SELECT COUNT(*) as count FROM downloads WHERE status = "failed"')
-            failed_downloads = cursor.fetchone()['count']
+                cursor.execute('SELECT * FROM stats_totals WHERE id = 1')
+                totals = cursor.fetchone()
 
-            cursor.execute('SELECT SUM(storage_used) as total FROM users')
-            result = cursor.fetchone()
-            total_storage = result['total'] or 0
+                cursor.execute("SELECT COUNT(*) as count FROM users WHERE last_activity > datetime('now', '-1 day')")
+                active_users = cursor.fetchone()['count']
 
-            cursor.execute('SELECT AVG(CAST((julianday(completion_time) - julianday(download_time)) * 86400 AS INTEGER)) as avg_time FROM downloads WHERE status = "completed"')
-            result = cursor.fetchone()
-            avg_time = result['avg_time'] or 0
-
-            conn.close()
+            successful_downloads = totals['successful_downloads']
+            avg_time = totals['total_download_seconds'] / successful_downloads if successful_downloads else 0
 
+            user_cache = self.user_cache.stats()
             return {
-                'total_users': total_users,
+                'total_users': totals['total_users'],
                 'active_users': active_users,
                 'successful_downloads': successful_downloads,
-                'failed_downloads': failed_downloads,
-                'total_storage_used': total_storage,
+                'failed_downloads': totals['failed_downloads'],
+                'total_storage_used': totals['total_storage_used'],
                 'avg_download_time': avg_time,
+                'cache_hits': totals['cache_hits'],
+                'cache_misses': totals['cache_misses'],
+                'user_cache_hit_ratio': user_cache['hit_ratio'],
             }
         except Exception as e:
             logger.error(f"Statistika olishda xatolik: {e}")
             return {}
 
+    def get_daily_statistics(self, days: int = 7) -> List[Dict]:
+        """Oxirgi kunlar bo'yicha rollup qatorlari (yangilari birinchi)"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM statistics
+                    WHERE date IS NOT NULL
+                    ORDER BY date DESC
+                    LIMIT ?
+                ''', (days,))
+                rows = cursor.fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Kunlik statistikani o'qishda xatolik: {e}")
+            return []
+
+
+class AsyncDatabase:
+    """Database ning asinxron fasadi.
+
+    Metodlar Database bilan bir xil, lekin `await adb.get_user(...)` ko'rinishida
+    chaqiriladi va alohida DB oqimida (o'z navbati bilan) bajariladi, shuning
+    uchun diskdagi kutishlar event loop ni bloklamaydi.
+    """
+
+    def __init__(self, database: StorageBackend):
+        self.database = database
+        # Har shard uchun bitta oqim; bitta faylda so'rovlar navbat bilan,
+        # bitta doimiy ulanishda bajariladi
+        self._executor = ThreadPoolExecutor(
+            max_workers=database.shard_count, thread_name_prefix="db"
+        )
+
+    def __getattr__(self, name: str):
+        method = getattr(self.database, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            # Navbatda kutish ham kiradi: handler ko'radigan kechikish
+            with DB_QUERY_SECONDS.time(method=name), span(f"db.{name}"):
+                return await loop.run_in_executor(
+                    self._executor, functools.partial(method, *args, **kwargs)
+                )
+
+        setattr(self, name, call)
+        return call
+
+    async def close(self):
+        """Navbatdagi so'rovlarni tugatib, ulanishlarni yopish"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.database.close)
+        self._executor.shutdown(wait=True)
+
+
+def create_database(db_path: Path = DB_PATH, shards: int = DB_SHARDS) -> StorageBackend:
+    """Sozlamaga mos backend: bitta fayl yoki shardlangan"""
+    if shards > 1:
+        from app.sharding import ShardedDatabase
+        return ShardedDatabase(db_path, shards)
+    return Database(db_path)
+
 
 # Global database instance
-db = Database()
+db = create_database()
+
+# Handlerlar uchun asinxron fasad
+adb = AsyncDatabase(db)
+
+# Download log va faoliyat yozuvlari uchun bufer
+writes = WriteBehindBuffer(adb)
 
@@ -0,0 +1,150 @@
+"""
+Natija fayllarini foydalanuvchiga yetkazish: har media turi alohida
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple, Type
+
+from app.formats import PLANS, FileTooLargeError
+from app.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Media turlari yuborilish tartibida
+MEDIA_ORDER = ("video", "animation", "photo", "audio")
+
+# upload(media_type) -> (file_id, hajm); None - bu media tayyorlanmagan
+Upload = Callable[[str], Awaitable[Optional[Tuple[Optional[str], int]]]]
+
+
+@dataclass
+class Delivery:
+    """Yuborish natijasi: yuborilganlar va xato bergan media turlari"""
+
+    # media_type -> (file_id, hajm)
+    sent: Dict[str, Tuple[Optional[str], int]] = field(default_factory=dict)
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size in self.sent.values())
+
+    @property
+    def empty(self) -> bool:
+        """Na yuborilgan, na xato bergan media bor"""
+        return not self.sent and not self.errors
+
+
+def check_upload_size(size: int, limit: int) -> None:
+    """Limitdan katta fayl yuklanmaydi: xato errors ga tushadi va qayd etiladi"""
+    if limit and size > limit:
+        raise FileTooLargeError(size, limit)
+
+
+async def upload_all(media_types: Iterable[str], upload: Upload) -> Delivery:
+    """Har media turini alohida task da yuklash.
+
+    Bittasining xatosi (masalan, audio ajratish) qolganlarini to'xtatmaydi:
+    video yuborilib bo'linadi, audio xatosi errors ga yoziladi.
+    """
+    order = [media_type for media_type in MEDIA_ORDER if media_type in set(media_types)]
+    tasks = [asyncio.ensure_future(upload(media_type)) for media_type in order]
+    try:
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    delivery = Delivery()
+    for media_type, outcome in zip(order, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.warning(f"{media_type} yuborilmadi: {outcome!r}")
+            delivery.errors[media_type] = outcome
+        elif outcome is not None:
+            delivery.sent[media_type] = outcome
+    return delivery
+
+
+async def send_cached(cached: Dict[str, Dict], send: Callable[[str, Dict], Awaitable[Any]],
+                      stale: Type[BaseException]) -> Delivery:
+    """Keshdagi file_id larni tartib bilan yuborish.
+
+    `stale` xatosi bilan rad etilgan file_id errors ga yoziladi va qolganlari
+    yuborilaveradi: video yetkazilgan bo'lsa, faqat audio qayta olinadi.
+    """
+    delivery = Delivery()
+    for media_type in MEDIA_ORDER:
+        entry = cached.get(media_type)
+        if not entry:
+            continue
+        try:
+            await send(media_type, entry)
+        except stale as e:
+            delivery.errors[media_type] = e
+            continue
+        delivery.sent[media_type] = (entry['file_id'], entry['file_size'] or 0)
+    return delivery
+
+
+def refetch_format(format_type: str, missing: Set[str]) -> str:
+    """Faqat yetishmagan media turlarini yuklab oladigan format (bo'lmasa o'zi)"""
+    for candidate, plan in PLANS.items():
+        if set(plan.outputs) == missing:
+            return candidate
+    return format_type
+
+
+@dataclass
+class SharedDownload:
+    """Single-flight natijasi: yuklangan fayllar va yetakchi yuborganlari"""
+
+    result: Any
+    leader: Delivery
+
+
+async def deliver_once(flights: SingleFlight, key: Hashable,
+                       download: Callable[[], Awaitable[Any]],
+                       make_upload: Callable[[Any], Upload],
+                       send_file_id: Callable[[Any, str, str], Awaitable[Any]]) -> Tuple[Any, Delivery]:
+    """Bir xil parallel so'rovlar uchun bitta yuklab olish va bitta upload.
+
+    Ishni boshlagan so'rovchi (yetakchi) faylni yuklab oladi va o'z chatiga
+    yuboradi; qolganlar uning file_id lari bilan yuboradi. Yetakchi yubora
+    olmagan media turlarini har biri o'zi yuklaydi.
+    send_file_id(natija, media_type, file_id) - file_id bilan yuborish.
+    Returns: (natija, shu so'rovchiga yetkazilganlar)
+    """
+    is_leader = False
+
+    async def lead() -> SharedDownload:
+        result = await download()
+        try:
+            return SharedDownload(result, await upload_all(result.media_types, make_upload(result)))
+        except BaseException:
+            result.close()
+            raise
+
+    def start():
+        nonlocal is_leader
+        is_leader = True
+        return lead()
+
+    async with flights.join(key, start) as shared:
+        if is_leader:
+            return shared.result, shared.leader
+
+        upload = make_upload(shared.result)
+
+        async def send(media_type: str):
+            file_id, size = shared.leader.sent.get(media_type, (None, 0))
+            if file_id:
+                try:
+                    await send_file_id(shared.result, media_type, file_id)
+                    return file_id, size
+                except Exception as e:
+                    logger.warning(f"{media_type} file_id bilan yuborilmadi, qayta yuklanadi: {e}")
+            return await upload(media_type)
+
+        return shared.result, await upload_all(shared.result.media_types, send)
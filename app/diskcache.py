@@ -0,0 +1,330 @@
+"""
+DATA_DIR ish kataloglari uchun hajm bilan cheklangan LRU disk kesh
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.config import (
+    DATA_DIR, DISK_CACHE_HIGH_WATERMARK, DISK_CACHE_LOW_WATERMARK, DISK_CACHE_MAX_AGE,
+    DISK_CACHE_MAX_BYTES, DISK_MIN_FREE_BYTES, INSTANCE_ID,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bo'sh joy o'lchovi shuncha soniya keshlanadi (admit da syscall bo'lmasin)
+_FREE_SPACE_TTL = 1.0
+
+
+class DiskFullError(Exception):
+    """Yangi ish uchun diskda joy yo'q (tozalashdan keyin ham)"""
+
+
+@dataclass
+class WorkdirEntry:
+    key: str
+    size: int
+    last_used: float
+    # Ishlatayotganlar soni; > 0 bo'lsa o'chirilmaydi
+    pins: int = 0
+
+
+class DiskCache:
+    """Ish kataloglari indeksi: hajm hisobi, LRU tozalash, SQLite da saqlash.
+
+    Kataloglar root/<xx>/<key> ko'rinishida (xx - kalitning birinchi ikki
+    belgisi), shuning uchun bitta katalogda cheksiz ko'p bola bo'lmaydi.
+    Hajm va bo'sh joy xotiradagi hisoblagichlardan olinadi: can_admit O(1),
+    hot path da katalog skanerlanmaydi. Indeks o'zgarishlari maintain() da
+    bitta tranzaksiyada yoziladi.
+    """
+
+    def __init__(self, root: Path, index_path: Path,
+                 max_bytes: int = DISK_CACHE_MAX_BYTES,
+                 high_watermark: float = DISK_CACHE_HIGH_WATERMARK,
+                 low_watermark: float = DISK_CACHE_LOW_WATERMARK,
+                 min_free_bytes: int = DISK_MIN_FREE_BYTES,
+                 max_age: int = DISK_CACHE_MAX_AGE,
+                 clock: Callable[[], float] = time.time):
+        self.root = Path(root)
+        self.index_path = Path(index_path)
+        self.high_bytes = int(max_bytes * high_watermark)
+        self.low_bytes = int(max_bytes * low_watermark)
+        self.min_free_bytes = min_free_bytes
+        self.max_age = max_age
+        self._clock = clock
+        self._entries: "OrderedDict[str, WorkdirEntry]" = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        # Indeksga yozilmagan o'zgarishlar: key -> entry (None - o'chirilgan)
+        self._dirty: Dict[str, Optional[WorkdirEntry]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._free = 0
+        self._free_checked = float("-inf")
+        self.evictions = 0
+
+    # INDEKS
+
+    def load(self):
+        """Indeksni SQLite dan o'qish (ishga tushganda, threadda)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS workdirs (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        rows = self._conn.execute('SELECT key, size, last_used FROM workdirs ORDER BY last_used').fetchall()
+        with self._lock:
+            self._entries = OrderedDict((key, WorkdirEntry(key, size, last_used)) for key, size, last_used in rows)
+            self._used = sum(entry.size for entry in self._entries.values())
+        logger.info(f"💾 Disk kesh: {len(rows)} ta katalog, {self._used / (1024 * 1024):.1f}MB")
+
+    def persist(self):
+        """Yig'ilgan o'zgarishlarni bitta tranzaksiyada yozish"""
+        if self._conn is None:
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        upserts = [(e.key, e.size, e.last_used) for e in dirty.values() if e is not None]
+        deletes = [(key,) for key, e in dirty.items() if e is None]
+        try:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO workdirs VALUES (?, ?, ?)', upserts)
+                self._conn.executemany('DELETE FROM workdirs WHERE key = ?', deletes)
+        except sqlite3.Error as e:
+            logger.error(f"Disk kesh indeksini yozishda xatolik: {e}")
+            with self._lock:
+                for key, entry in dirty.items():
+                    self._dirty.setdefault(key, entry)
+
+    def close(self):
+        """Indeksni yozib, ulanishni yopish"""
+        self.persist()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # HOT PATH
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    def free_bytes(self) -> int:
+        """Diskdagi bo'sh joy (qisqa muddat keshlanadi)"""
+        now = time.monotonic()
+        if now - self._free_checked >= _FREE_SPACE_TTL:
+            self._free = shutil.disk_usage(self.root).free
+            self._free_checked = now
+        return self._free
+
+    def can_admit(self, job_bytes: int) -> bool:
+        """job_bytes hajmli yangi ish sig'adimi (O(1))"""
+        return (self._used + job_bytes <= self.high_bytes
+                and self.free_bytes() - job_bytes >= self.min_free_bytes)
+
+    def create(self, job_bytes: int) -> Path:
+        """Yangi band qilingan (pinned) ish katalogi; hajm commit gacha taxminiy"""
+        key = uuid.uuid4().hex
+        path = self.path_for(key)
+        path.mkdir(parents=True, exist_ok=True)
+        entry = WorkdirEntry(key, job_bytes, self._clock(), pins=1)
+        with self._lock:
+            self._entries[key] = entry
+            self._used += job_bytes
+            self._dirty[key] = entry
+        return path
+
+    async def admit(self, job_bytes: int) -> Path:
+        """Joy bo'lsa katalog yaratish; bo'lmasa avval threadda tozalash"""
+        if not self.can_admit(job_bytes):
+            await asyncio.to_thread(self.evict, job_bytes)
+            if not self.can_admit(job_bytes):
+                raise DiskFullError(
+                    f"{job_bytes / (1024 * 1024):.0f}MB uchun joy yo'q "
+                    f"(band: {self._used / (1024 * 1024):.0f}MB)"
+                )
+        return self.create(job_bytes)
+
+    def commit(self, path: Path):
+        """Ish tugagach haqiqiy hajmni yozish (faqat shu katalog o'qiladi)"""
+        size = _dir_size(path)
+        with self._lock:
+            entry = self._entries.get(path.name)
+            if entry is None:
+                return
+            self._used += size - entry.size
+            entry.size = size
+            self._touch(entry)
+
+    def touch(self, path: Path):
+        """Katalog ishlatildi - LRU oxiriga"""
+        with self._lock:
+            entry = self._entries.get(path.name)
+            if entry is not None:
+                self._touch(entry)
+
+    def release(self, path: Path, delete: bool = True):
+        """Ishni tugatish: pin olinadi va (odatda) katalog o'chiriladi"""
+        with self._lock:
+            entry = self._entries.get(path.name)
+            if entry is not None:
+                entry.pins = max(entry.pins - 1, 0)
+                if entry.pins or not delete:
+                    self._touch(entry)
+                    return
+        if delete:
+            shutil.rmtree(path, ignore_errors=True)
+            if entry is not None and not path.exists():
+                with self._lock:
+                    self._forget(entry)
+
+    # TOZALASH
+
+    def evict(self, job_bytes: int = 0) -> int:
+        """Chegaralar buzilgan bo'lsa eng eski bo'sh kataloglarni o'chirish.
+
+        Hajm pastki chegaragacha va bo'sh joy 2 * min_free gacha tiklanadi.
+        Ishlatilayotgan (pinned) kataloglarga tegilmaydi. Bo'shatilgan baytlar qaytariladi.
+        """
+        if self.can_admit(job_bytes):
+            return 0
+
+        freed = 0
+        target_free = 2 * self.min_free_bytes + job_bytes
+        for entry in self._evictable():
+            self._free_checked = float("-inf")
+            if self._used + job_bytes <= self.low_bytes and self.free_bytes() >= target_free:
+                break
+            freed += self._remove(entry)
+        if freed:
+            logger.info(f"🧹 Disk kesh: {freed / (1024 * 1024):.1f}MB bo'shatildi")
+        return freed
+
+    def expire(self) -> int:
+        """max_age dan eski ishlatilmayotgan kataloglarni o'chirish"""
+        cutoff = self._clock() - self.max_age
+        freed = 0
+        for entry in self._evictable():
+            if entry.last_used >= cutoff:
+                break
+            freed += self._remove(entry)
+        return freed
+
+    def recover(self) -> Dict[str, int]:
+        """Ishga tushganda oldingi jarayondan qolgan kataloglarni o'chirish.
+
+        Ish kataloglari jarayondan uzoq yashamaydi: indeksdagi pin qilinmagan
+        yozuvlar va indeksga yozilmay qolgan kataloglar yetim. Faqat shu
+        nusxaning ildizi ko'riladi (boshqa nusxalar kataloglariga tegilmaydi);
+        to'liq ko'rib chiqish faqat shu yerda - hot path da emas.
+        """
+        removed = freed = 0
+        for entry in self._evictable():
+            shutil.rmtree(self.path_for(entry.key), ignore_errors=True)
+            with self._lock:
+                self._forget(entry)
+            removed += 1
+            freed += entry.size
+
+        if self.root.exists():
+            for bucket in self.root.iterdir():
+                if not bucket.is_dir():
+                    continue
+                for path in bucket.iterdir():
+                    # Indeksda bor (ya'ni hozir ishlatilayotgan) kataloglarga tegilmaydi
+                    if path.name in self._entries:
+                        continue
+                    freed += _dir_size(path) if path.is_dir() else path.stat().st_size
+                    if path.is_dir():
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        path.unlink(missing_ok=True)
+                    removed += 1
+
+        self.persist()
+        return {'workdirs': removed, 'bytes': freed}
+
+    def maintain(self) -> int:
+        """Fon ishi: muddati o'tganlarni va chegaradan oshganini tozalash, indeksni yozish"""
+        freed = self.expire() + self.evict()
+        self.persist()
+        return freed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pinned = sum(1 for entry in self._entries.values() if entry.pins)
+            return {
+                'entries': len(self._entries),
+                'pinned': pinned,
+                'used_bytes': self._used,
+                'high_bytes': self.high_bytes,
+                'evictions': self.evictions,
+            }
+
+    def _evictable(self) -> List[WorkdirEntry]:
+        """Eng eskidan boshlab ishlatilmayotgan kataloglar"""
+        with self._lock:
+            return [entry for entry in self._entries.values() if not entry.pins]
+
+    def _remove(self, entry: WorkdirEntry) -> int:
+        if entry.pins:
+            return 0
+        path = self.path_for(entry.key)
+        shutil.rmtree(path, ignore_errors=True)
+        if path.exists():
+            logger.warning(f"⚠️ Katalog o'chirilmadi: {path}")
+            return 0
+        with self._lock:
+            if entry.pins or self._entries.get(entry.key) is not entry:
+                return 0
+            self._forget(entry)
+            self.evictions += 1
+        return entry.size
+
+    def _touch(self, entry: WorkdirEntry):
+        entry.last_used = self._clock()
+        self._entries.move_to_end(entry.key)
+        self._dirty[entry.key] = entry
+
+    def _forget(self, entry: WorkdirEntry):
+        if self._entries.pop(entry.key, None) is not None:
+            self._used -= entry.size
+            self._dirty[entry.key] = None
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# Ish kataloglari DATA_DIR/work/<nusxa> ostida: bot.db dan va DATA_DIR umumiy
+# bo'lsa boshqa nusxalar kataloglaridan alohida
+WORK_ROOT = DATA_DIR / "work"
+disk_cache = DiskCache(WORK_ROOT / INSTANCE_ID, WORK_ROOT / INSTANCE_ID / "index.db")
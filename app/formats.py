@@ -0,0 +1,203 @@
+"""
+Format turiga qarab eng arzon yuklab olish rejasi
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# GIF (animatsiya) uchun cheklovlar
+GIF_MAX_HEIGHT = 480
+GIF_MAX_DURATION = 60  # soniya
+
+# Rasm uchun thumbnail bo'lmasa olinadigan eng past sifatli oqim
+IMAGE_FALLBACK_FORMAT = "wv*[height>=240]/wv*/w"
+
+
+@dataclass(frozen=True)
+class DownloadPlan:
+    """Bitta format turi uchun yt-dlp rejasi"""
+
+    format_type: str
+    # Qaysi media turlari yuboriladi (video, audio, animation, photo)
+    outputs: Tuple[str, ...]
+    # yt-dlp format selektori (None - media yuklanmaydi)
+    ydl_format: Optional[str]
+    merge_output_format: Optional[str] = None
+    write_thumbnail: bool = False
+
+    @property
+    def skip_download(self) -> bool:
+        return self.ydl_format is None
+
+    def ydl_options(self, outtmpl: str) -> dict:
+        """Rejaga mos yt-dlp parametrlari"""
+        opts = {"outtmpl": outtmpl}
+        if self.skip_download:
+            opts["skip_download"] = True
+        else:
+            opts["format"] = self.ydl_format
+        if self.merge_output_format:
+            opts["merge_output_format"] = self.merge_output_format
+        if self.write_thumbnail:
+            opts["writethumbnail"] = True
+        return opts
+
+
+PLANS = {
+    # To'liq video (mp4 ga birlashtiriladi)
+    "video": DownloadPlan(
+        "video", ("video",),
+        ydl_format="bv*+ba/b[ext=mp4]/b",
+        merge_output_format="mp4",
+    ),
+    # Faqat audio oqimi - video umuman yuklanmaydi
+    "audio": DownloadPlan(
+        "audio", ("audio",),
+        ydl_format="bestaudio/b",
+    ),
+    # Ovozsiz, past o'lchamli oqim; H.264 bo'lsa qayta kodlanmaydi
+    "gif": DownloadPlan(
+        "gif", ("animation",),
+        ydl_format=(
+            f"bv*[height<={GIF_MAX_HEIGHT}][vcodec^=avc1]/"
+            f"bv*[height<={GIF_MAX_HEIGHT}]/"
+            f"b[height<={GIF_MAX_HEIGHT}]/wv*/w"
+        ),
+    ),
+    # Faqat thumbnail
+    "image": DownloadPlan(
+        "image", ("photo",),
+        ydl_format=None,
+        write_thumbnail=True,
+    ),
+    # Video + undan ajratilgan audio
+    "both": DownloadPlan(
+        "both", ("video", "audio"),
+        ydl_format="bv*+ba/b[ext=mp4]/b",
+        merge_output_format="mp4",
+    ),
+}
+
+
+def plan_download(format_type: str) -> DownloadPlan:
+    """Format turi uchun reja (noma'lum tur - both)"""
+    return PLANS.get(format_type, PLANS["both"])
+
+
+class FileTooLargeError(Exception):
+    """Hech bir format yuklash limitiga sig'maydi"""
+
+    def __init__(self, size: int, limit: int):
+        self.size = size
+        self.limit = limit
+        super().__init__(
+            f"Fayl hajmi (~{size / (1024 * 1024):.0f} MB) "
+            f"limitdan ({limit / (1024 * 1024):.0f} MB) katta"
+        )
+
+    def __reduce__(self):
+        # Ishchi jarayondan pickle orqali qaytishi uchun
+        return (FileTooLargeError, (self.size, self.limit))
+
+
+class SelectedFormat:
+    """Oldindan tanlangan format va uning taxminiy hajmi (None - noma'lum)"""
+
+    def __init__(self, format_id: str, estimated_size: Optional[int]):
+        self.format_id = format_id
+        self.estimated_size = estimated_size
+
+    def __repr__(self) -> str:
+        return f"SelectedFormat({self.format_id!r}, {self.estimated_size})"
+
+
+def estimate_size(fmt: dict, duration: Optional[float]) -> Optional[int]:
+    """Format hajmi: filesize, filesize_approx yoki davomiylik x bitrate"""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return int(size)
+    tbr = fmt.get("tbr") or ((fmt.get("vbr") or 0) + (fmt.get("abr") or 0))
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def _has_video(fmt: dict) -> bool:
+    return fmt.get("vcodec") not in (None, "none")
+
+
+def _has_audio(fmt: dict) -> bool:
+    return fmt.get("acodec") not in (None, "none")
+
+
+def _quality(fmt: dict) -> tuple:
+    return (fmt.get("height") or 0, fmt.get("tbr") or fmt.get("abr") or 0)
+
+
+def _candidates(info: dict, plan: DownloadPlan) -> List[Tuple[tuple, str, Optional[int]]]:
+    """(sifat, format_id, hajm) nomzodlari"""
+    formats = [f for f in info.get("formats") or [] if f.get("format_id")]
+    duration = info.get("duration")
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    result = []
+
+    if plan.outputs == ("audio",):
+        for f in audio_only or [f for f in formats if _has_audio(f)]:
+            result.append(((f.get("abr") or f.get("tbr") or 0,), f["format_id"], estimate_size(f, duration)))
+        return result
+
+    # Video: progressive formatlar + video-only va eng yaxshi audio juftligi
+    best_audio = max(
+        audio_only,
+        key=lambda f: (f.get("ext") == "m4a", f.get("abr") or f.get("tbr") or 0),
+        default=None,
+    )
+    audio_size = estimate_size(best_audio, duration) if best_audio else None
+
+    for f in formats:
+        if not _has_video(f):
+            continue
+        size = estimate_size(f, duration)
+        if _has_audio(f):
+            result.append((_quality(f), f["format_id"], size))
+        elif best_audio:
+            total = size + audio_size if size is not None and audio_size is not None else None
+            result.append((_quality(f), f"{f['format_id']}+{best_audio['format_id']}", total))
+    return result
+
+
+def select_format(info: dict, plan: DownloadPlan, max_bytes: int) -> Optional[SelectedFormat]:
+    """Limitga sig'adigan eng yaxshi formatni tanlash.
+
+    Ma'lum hajmlilar sig'masa, ulardan pastroq sifatli hajmi noma'lum
+    format tanlanadi: rejadagi cheklanmagan selektorga (eng katta format)
+    qaytilmaydi.
+    None - barcha hajmlar noma'lum, rejadagi selektor ishlatiladi.
+    Raises: FileTooLargeError - sig'adigan yoki pastroq sifatli format yo'q.
+    """
+    if not max_bytes or plan.skip_download or "animation" in plan.outputs:
+        return None
+
+    candidates = _candidates(info, plan)
+    if not candidates:
+        # Formatlar ro'yxati yo'q - butun yozuvning o'zi bitta format
+        size = estimate_size(info, info.get("duration"))
+        if size is not None and size > max_bytes:
+            raise FileTooLargeError(size, max_bytes)
+        return None
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    known = [c for c in candidates if c[2] is not None]
+    for _, format_id, size in known:
+        if size <= max_bytes:
+            return SelectedFormat(format_id, size)
+
+    if not known:
+        return None
+
+    # Sig'magan eng past sifatdan ham pastroq, hajmi noma'lum nomzod
+    bound = min(c[0] for c in known)
+    for quality, format_id, size in candidates:
+        if size is None and quality < bound:
+            return SelectedFormat(format_id, None)
+    raise FileTooLargeError(min(c[2] for c in known), max_bytes)
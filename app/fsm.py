@@ -0,0 +1,38 @@
+"""
+FSM holatini bot nusxalari uchun umumiy bazada saqlash
+"""
+from __future__ import annotations
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage: holat va ma'lumot fsm_states jadvalida.
+
+    Webhook rejimida ketma-ket update lar turli nusxalarga tushsa ham
+    (masalan, link bir nusxaga, format tugmasi boshqasiga) holat topiladi.
+    """
+
+    def __init__(self, adb, key_builder: Optional[KeyBuilder] = None):
+        self.adb = adb
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.adb.set_fsm_state(
+            self.key_builder.build(key), state.state if isinstance(state, State) else state
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.adb.get_fsm_state(self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.adb.set_fsm_data(self.key_builder.build(key), data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.adb.get_fsm_data(self.key_builder.build(key))
+
+    async def close(self) -> None:
+        # Ulanishlar AsyncDatabase bilan birga yopiladi
+        pass
@@ -4,6 +4,7 @@ import logging
 import os
 from contextlib import suppress
 from pathlib import Path
+from typing import Tuple
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, FSInputFile, CallbackQuery
@@ -11,17 +12,38 @@ from aiogram.filters import CommandStart, Command
 from aiogram.enums import ParseMode
 from aiogram.utils.markdown import hlink
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from dotenv import load_dotenv
 
 from app.admin import admin_router
-from app.database import db
+from app.broadcast import broadcasts
+from app.delivery import (
+    Delivery, SharedDownload, Upload, check_upload_size, deliver_once, refetch_format,
+    send_cached,
+)
+from app.database import adb, writes
+from app.diskcache import disk_cache
+from app.fsm import SQLiteStorage
+from app.recovery import recover_on_startup
 from app.user_panel import logger_router
-from app.utils import download_video_and_audio, cleanup_dir, ensure_chat_dir, DownloadError
-from app.validators import is_supported_url
-from app.config import BOT_TOKEN, MAX_UPLOAD_BYTES
+from app.formats import FileTooLargeError
+from app.metrics import IN_FLIGHT, StageTimer, bot_api_middleware, observe_download
+from app.singleflight import SingleFlight
+from app.tracing import annotate, current_trace_id, tracer
+from app.tasks import start_background_tasks, stop_background_tasks
+from app.utils import download_video_and_audio, download_pool, DownloadError, DownloadResult
+from app.validators import is_supported_url, normalize_url, platform_of
+from app.config import (
+    BOT_TOKEN, BOT_MODE, MAX_UPLOAD_BYTES, TELEGRAM_API_URL, TELEGRAM_API_LOCAL,
+    METRICS_HOST, METRICS_PORT, FSM_STORAGE,
+)
+from app.webhook import run_webhook, start_metrics_server
 
 load_dotenv()
 
@@ -38,10 +60,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger("bot")
 
+# Lokal Bot API server: fayllar yo'l orqali yuboriladi, limit 2 GB
+session = None
+if TELEGRAM_API_LOCAL:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=True))
+    logger.info(f"🛰️ Local Bot API server: {TELEGRAM_API_URL}")
+
 bot = Bot(
     token=BOT_TOKEN,
+    session=session,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
+# Har Bot API chaqiruvi davomiyligi (metodi va natijasi bilan)
+bot.session.middleware(bot_api_middleware)
+
+
+ALLOWED_UPDATES = ["message", "callback_query"]
 
 
 class DownloadState(StatesGroup):
@@ -49,10 +83,126 @@ class DownloadState(StatesGroup):
     waiting_for_format = State()
 
 
+TOO_BIG_MESSAGES = {
+    "video": "⚠️ Video hajmi juda katta. Telegram cheklovisi.",
+    "animation": "⚠️ GIF hajmi juda katta. Telegram cheklovisi.",
+    "photo": "⚠️ Rasm hajmi juda katta. Telegram cheklovisi.",
+    "audio": "⚠️ Audio hajmi juda katta. Sifatni kamaytirish kerak.",
+}
+
+FAILED_MESSAGES = {
+    "video": "⚠️ Videoni yuborib bo'lmadi.",
+    "animation": "⚠️ GIF ni yuborib bo'lmadi.",
+    "photo": "⚠️ Rasmni yuborib bo'lmadi.",
+    "audio": "⚠️ Audioni tayyorlab yoki yuborib bo'lmadi.",
+}
+
+
+def input_file(path: Path):
+    """Yuboriladigan fayl.
+
+    Lokal serverda faylni server o'zi diskdan o'qiydi (file:// URI) -
+    baytlar bot jarayoni orqali oqib o'tmaydi. DATA_DIR ikkala
+    konteynerda bir xil yo'lda mount qilingan bo'lishi kerak.
+    """
+    if TELEGRAM_API_LOCAL:
+        return path.resolve().as_uri()
+    return FSInputFile(path=path)
+
+
+def release_download(shared: SharedDownload) -> None:
+    """Oxirgi so'rovchi chiqqanda yuklangan ish katalogini o'chirish"""
+    shared.result.close()
+
+
+# Bir xil URL + format uchun parallel so'rovlar bitta yuklab olish va bitta
+# upload ga birlashadi (qolganlar file_id bilan oladi)
+download_flights = SingleFlight(on_release=release_download)
+
+
+async def send_media(message: Message, media_type: str, file, title: str) -> Message:
+    """Faylni (yoki file_id ni) media turiga mos usulda yuborish"""
+    if media_type == "video":
+        return await message.answer_video(video=file, caption=f"🎬 <b>{title}</b>")
+    if media_type == "animation":
+        return await message.answer_animation(animation=file, caption=f"🎞️ <b>{title}</b>")
+    if media_type == "photo":
+        return await message.answer_photo(photo=file, caption=f"🖼️ <b>{title}</b>")
+    return await message.answer_audio(audio=file, caption=f"🎧 {title} — Audio")
+
+
+def sent_file_id(sent: Message, media_type: str) -> str | None:
+    """Yuborilgan xabardan file_id ni olish"""
+    media = getattr(sent, media_type, None) or sent.document
+    if isinstance(media, list):
+        # Rasm bir nechta o'lchamda qaytadi - eng kattasi oxirida
+        media = media[-1] if media else None
+    return media.file_id if media else None
+
+
+def uploader(message: Message, result: DownloadResult, timer: StageTimer) -> Upload:
+    """Natija fayllarini yuklovchi (deliver_once uchun).
+
+    Har bir fayl tayyor bo'lishi bilanoq yuklanadi: video yuklanayotganda
+    audio ajratish davom etadi, ikkala yuklash bir vaqtda ketadi.
+    """
+    async def upload(media_type: str) -> Tuple[str | None, int] | None:
+        path = await result.wait(media_type)
+        if not path:
+            return None
+        size = path.stat().st_size
+        check_upload_size(size, MAX_UPLOAD_BYTES)
+        with timer.stage(f"upload_{media_type}"):
+            sent = await send_media(message, media_type, input_file(path), result.title)
+        return sent_file_id(sent, media_type), size
+
+    return upload
+
+
+async def deliver_from_cache(message: Message, url_key: str, format_type: str) -> Delivery:
+    """Keshdagi file_id lar bilan yuborish.
+
+    Rad etilgan (eskirgan) file_id lar errors da qaytadi va faqat ular
+    keshdan o'chiriladi; yuborilganlari qayta yuborilmaydi.
+    """
+    cached = await adb.get_cached_files(url_key, format_type)
+    if not cached:
+        return Delivery()
+
+    delivery = await send_cached(
+        cached,
+        lambda media_type, entry: send_media(message, media_type, entry['file_id'], entry['title']),
+        TelegramBadRequest,
+    )
+    if delivery.errors:
+        logger.warning(f"Cached file_id rejected for {url_key}: {', '.join(delivery.errors)}")
+        await adb.invalidate_cache(url_key, format_type, list(delivery.errors))
+    if delivery.sent:
+        await adb.record_cache_hit(url_key, format_type)
+    return delivery
+
+
+# /metrics serveri (on_startup da ishga tushadi)
+metrics_runner = None
+
+
 async def on_startup() -> None:
     logger.info("Bot started")
-    db.init_db()  # Database tables yaratish
+    # Ishchi jarayonlar serveri DB/yozuvchi oqimlardan oldin ishga tushadi
+    download_pool.start()
+    await adb.init_db()  # Database tables yaratish
+    await writes.start()
     logger.info("✅ Database initialized")
+    tracer.start()
+    await asyncio.to_thread(disk_cache.load)
+    # Oldingi jarayon to'satdan to'xtagan bo'lsa - qolib ketgan ishlar va kataloglar
+    await recover_on_startup(bot)
+
+    # Fon ishlari; to'xtatilgan broadcastlar darhol davom etadi
+    await start_background_tasks(bot)
+
+    global metrics_runner
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
 
     # Admin IDlarni .env dan o'qish
     admin_id_str = os.getenv("ADMIN_ID", "5773429637")
@@ -65,25 +215,35 @@ async def on_startup() -> None:
 
     # Adminlarni database ga qo'shish
     for admin_id in ADMIN_IDS:
-        user = db.get_user(admin_id)
+        user = await adb.get_user(admin_id)
         if not user:
-            db.add_user(admin_id, username="admin", first_name="Admin", is_admin=True)
+            await adb.add_user(admin_id, username="admin", first_name="Admin", is_admin=True)
             logger.info(f"✅ Admin qo'shildi: {admin_id}")
         elif not user.get('is_admin'):
-            db.make_admin(admin_id)
+            await adb.make_admin(admin_id)
             logger.info(f"✅ {admin_id} admin qilindi")
-            db.make_admin(admin_id)
+            await adb.make_admin(admin_id)
             logger.info(f"✅ {admin_id} admin qilindi")
 
 
 async def on_shutdown() -> None:
+    # Broadcast natijalari va buferdagi yozuvlar ulanishlar yopilishidan oldin yoziladi
+    await stop_background_tasks()
+    await broadcasts.stop()
+    await writes.stop()
+    await adb.close()
+    await asyncio.to_thread(disk_cache.close)
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    # Navbatdagi trace lar faylga yoziladi
+    await asyncio.to_thread(tracer.stop)
     logger.info("Bot stopped")
 
 
 async def handle_start(msg: Message):
     # Foydalanuvchini database ga qo'shish
-    if not db.get_user(msg.from_user.id):
-        db.add_user(
+    if not await adb.get_user(msg.from_user.id):
+        await adb.add_user(
             msg.from_user.id,
             username=msg.from_user.username or "No username",
             first_name=msg.from_user.first_name or "",
@@ -92,7 +252,7 @@ async def handle_start(msg: Message):
 
     # Admin tekshiruvi
     from app.admin import is_admin
-    if is_admin(msg.from_user.id):
+    if await is_admin(msg.from_user.id):
         logger.info(f"👑 Admin {msg.from_user.id} admin panelga redirect qilindi")
         # Admin panelni avtomatik ochish
         from app.admin import handle_admin_panel
@@ -139,7 +299,7 @@ async def handle_help(msg: Message):
         "3. Bot yuklab olib, qayta ishlaydi va yuboradi\n\n"
         "<b>Format turlari:</b>\n"
         "🎬 <b>Video (MP4)</b> - To'liq video\n"
-        "🎧 <b>Audio (MP3)</b> - Faqat ovoz\n"
+        "🎧 <b>Audio</b> - Faqat ovoz\n"
         "🎞️ <b>GIF</b> - Animatsiyalı GIF\n"
         "🖼️ <b>Image</b> - Statik rasm\n\n"
         "<b>Masalalar yuz berganda:</b>\n"
@@ -161,9 +321,9 @@ async def handle_formats(msg: Message):
         "   • Eng ko'p platformada ishlaydi\n"
         "   • H.264 kodeki bilan\n"
         "   • AAC audiosi bilan\n\n"
-        "🎧 <b>Audio (MP3)</b>\n"
+        "🎧 <b>Audio (M4A/OGG/MP3)</b>\n"
         "   • Faqat ovoz\n"
-        "   • 192 kbps sifat\n"
+        "   • Asl sifat (qayta kodlanmaydi)\n"
         "   • Musiqalar uchun ideal\n\n"
         "🎞️ <b>GIF</b>\n"
         "   • Animatsiyalı GIF\n"
@@ -184,8 +344,8 @@ async def handle_link(msg: Message, state: FSMContext):
         return  # Komandalar uchun xalqaro handlers ishlatiladi
 
     # Foydalanuvchini database ga qo'shish/yangilash
-    if not db.get_user(msg.from_user.id):
-        db.add_user(
+    if not await adb.get_user(msg.from_user.id):
+        await adb.add_user(
             msg.from_user.id,
             username=msg.from_user.username or "No username",
             first_name=msg.from_user.first_name or "",
@@ -239,72 +399,117 @@ async def handle_format_callback(callback: CallbackQuery, state: FSMContext):
     except Exception as e:
         logger.warning(f"Callback answer failed: {e}")
 
+    # Har yuklab olish - bitta trace (bosqichlar, DB va Bot API chaqiruvlari bilan)
+    with tracer.trace("download", user_id=callback.from_user.id):
+        await process_download(callback, url, format_type)
+
+
+async def process_download(callback: CallbackQuery, url: str, format_type: str):
+    """Keshdan yuborish yoki yuklab olib yuborish"""
     # Download logini database ga qo'shish
-    download_id = db.log_download(
+    download_id = writes.log_download(
         callback.from_user.id,
         url,
         format_type,
         status="processing"
     )
+    annotate(download_id=download_id)
+
+    url_key = normalize_url(url)
+    platform = platform_of(url)
+    timer = StageTimer()
+    from_cache = await deliver_from_cache(callback.message, url_key, format_type)
+    if from_cache.sent and not from_cache.errors:
+        writes.complete_download(download_id, from_cache.size, cache_hit=True)
+        logger.info(f"♻️ Cache hit: {url_key} ({format_type})")
+        with suppress(Exception):
+            await callback.message.delete()
+        writes.update_user_activity(callback.from_user.id)
+        observe_download(timer, platform, format_type, "cached")
+        return
+
+    # Keshdan yuborilganlari qayta yuborilmaydi: faqat rad etilganlari yuklab olinadi
+    fetch_format = format_type
+    if from_cache.sent:
+        fetch_format = refetch_format(format_type, set(from_cache.errors))
+
+    def record_failure(error: str):
+        if from_cache.sent:
+            # Keshdan yuborilgani yetkazilgan hisoblanadi
+            writes.complete_download(download_id, from_cache.size, cache_hit=True)
+        else:
+            writes.fail_download(download_id, error[:200])
 
     try:
         await callback.message.edit_text("⏳ Yuklab olish boshlandi... Bir oz kuting.")
     except Exception as e:
         logger.warning(f"Message edit failed: {e}")
 
-    chat_dir = ensure_chat_dir(callback.message.chat.id)
-    video_path: Path | None = None
-    audio_path: Path | None = None
-
+    outcome = "failed"
+    IN_FLIGHT.inc()
     try:
-        video_path, audio_path, title = await download_video_and_audio(url, callback.message.chat.id, format_type)
-
-        # Send video if available
-        if video_path and video_path.exists():
-            if MAX_UPLOAD_BYTES and video_path.stat().st_size > MAX_UPLOAD_BYTES:
-                await callback.message.answer("⚠️ Video hajmi juda katta. Telegram cheklovisi.")
-            else:
-                video_file = FSInputFile(path=video_path)
-                await callback.message.answer_video(video=video_file, caption=f"🎬 <b>{title}</b>")
-                db.complete_download(download_id, video_path.stat().st_size)
-
-        # Send audio if available
-        if audio_path and audio_path.exists():
-            if MAX_UPLOAD_BYTES and audio_path.stat().st_size > MAX_UPLOAD_BYTES:
-                await callback.message.answer("⚠️ Audio hajmi juda katta. Sifatni kamaytirish kerak.")
-            else:
-                audio_file = FSInputFile(path=audio_path)
-                await callback.message.answer_audio(audio=audio_file, caption=f"🎧 {title} — Audio (MP3)")
-
-        if not video_path and not audio_path:
+        result, delivery = await deliver_once(
+            download_flights,
+            (url_key, fetch_format),
+            lambda: download_video_and_audio(url, callback.message.chat.id, fetch_format),
+            lambda result: uploader(callback.message, result, timer),
+            lambda downloaded, media_type, file_id: send_media(callback.message, media_type, file_id, downloaded.title),
+        )
+        timer.merge(result.timer)
+
+        if delivery.errors and not delivery.sent:
+            # Hech narsa yetkazilmadi - odatdagi xato yo'li
+            raise next(iter(delivery.errors.values()))
+
+        if delivery.sent:
+            outcome = "completed"
+            writes.complete_download(download_id, delivery.size + from_cache.size)
+            for media_type, (file_id, size) in delivery.sent.items():
+                if file_id:
+                    await adb.cache_file(url_key, format_type, media_type, file_id, result.title, size)
+            # Qisman yetkazildi: yuborilmaganlari alohida xabar qilinadi
+            for media_type, error in delivery.errors.items():
+                messages = TOO_BIG_MESSAGES if isinstance(error, FileTooLargeError) else FAILED_MESSAGES
+                await callback.message.answer(messages[media_type])
+
+        if delivery.empty:
+            outcome = "empty"
             await callback.message.answer("⚠️ Fayl yuklab olinolib, lekin xatolik yuz berdi.")
-            db.fail_download(download_id, "File not created")
+            record_failure("File not created")
 
+        logger.info(
+            f"⏱️ Download {download_id} ({format_type}): {timer.summary()} trace={current_trace_id()}"
+        )
+
+    except FileTooLargeError as e:
+        # Pre-flight: hech narsa yuklanmasdan rad etildi
+        outcome = "too_large"
+        logger.info(f"Rejected before download: {url} ({e})")
+        record_failure(str(e))
+        await callback.message.answer(f"⚠️ {e}.\n\nTelegram orqali yuborib bo'lmaydi.")
     except DownloadError as e:
         logger.exception("Download failed: %s", e)
-        db.fail_download(download_id, str(e)[:200])
+        record_failure(str(e))
         error_msg = str(e)[:150]
         if "Sign in to confirm" in error_msg or "rate-limit" in error_msg.lower():
             await callback.message.answer(f"⚠️ Bot detection yoki rate-limit.\n\nKayni biroz o'yin qilib ko'ring.")
         else:
             await callback.message.answer(f"❌ Yuklab olish muvaffaqiyatsiz.\n\n{error_msg}")
     except Exception as e:
+        outcome = "error"
         logger.exception("Unexpected error: %s", e)
-        db.fail_download(download_id, str(e)[:200])
+        record_failure(str(e))
         await callback.message.answer("💥 Kutilmagan xatolik yuz berdi. Keyinroq urinib ko'ring.")
     finally:
-        with suppress(Exception):
-            if video_path and video_path.parent.exists():
-                cleanup_dir(video_path.parent)
-            elif audio_path and audio_path.parent.exists():
-                cleanup_dir(audio_path.parent)
-
-        db.update_user_activity(callback.from_user.id)
+        IN_FLIGHT.dec()
+        observe_download(timer, platform, format_type, outcome)
+        writes.update_user_activity(callback.from_user.id)
 
 
 
 async def main() -> None:
-    dp = Dispatcher()
+    # Bir nechta nusxada holat umumiy bazada bo'lishi kerak (FSM_STORAGE=sqlite)
+    dp = Dispatcher(storage=SQLiteStorage(adb) if FSM_STORAGE == "sqlite" else MemoryStorage())
 
     # Commands (BIRINCHI - highest priority)
     dp.message.register(handle_start, CommandStart())
@@ -323,10 +528,16 @@ async def main() -> None:
 
     await on_startup()
     try:
-        await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, allowed_updates=ALLOWED_UPDATES)
+        else:
+            # Oldin webhook o'rnatilgan bo'lsa getUpdates ishlamaydi
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
     finally:
-        await bot.session.close()
+        # Fon ishlari Bot API sessiyasi yopilishidan oldin to'xtatiladi
         await on_shutdown()
+        await bot.session.close()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,17 @@
 """
 Instrumentation va o'lchovlar
 """
+import asyncio
+import bisect
+import threading
 import time
+from contextlib import contextmanager
 from functools import wraps
-from typing import Callable, Any
+from typing import Awaitable, Callable, Any, Dict, Iterator, List, Optional, Sequence, Tuple
 import logging
 
+from app.tracing import annotate, span
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,22 +19,22 @@ def measure_time(func: Callable) -> Callable:
     """Funksiya bajarilish vaqtini o'lchash"""
     @wraps(func)
     async def async_wrapper(*args, **kwargs) -> Any:
-        start = time.time()
+        start = time.perf_counter()
         try:
             result = await func(*args, **kwargs)
             return result
         finally:
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
             logger.info(f"⏱️ {func.__name__} took {elapsed:.2f} seconds")
 
     @wraps(func)
     def sync_wrapper(*args, **kwargs) -> Any:
-        start = time.time()
+        start = time.perf_counter()
         try:
             result = func(*args, **kwargs)
             return result
         finally:
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
             logger.info(f"⏱️ {func.__name__} took {elapsed:.2f} seconds")
 
     if asyncio.iscoroutinefunction(func):
@@ -36,5 +42,306 @@ def measure_time(func: Callable) -> Callable:
     return sync_wrapper
 
 
-import asyncio
+class StageTimer:
+    """Ish bosqichlari davomiyligini yozib borish (bosqichlar parallel bo'lishi mumkin).
+
+    Trace ichida har bosqich span sifatida ham yoziladi.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Bosqichni o'lchash: with timer.stage("download"): ..."""
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    async def track(self, name: str, awaitable: Awaitable) -> Any:
+        """Korutinani bosqich sifatida o'lchab bajarish"""
+        with self.stage(name):
+            return await awaitable
+
+    def split(self, name: str, part: str, elapsed: float) -> None:
+        """Bosqichning bir qismini alohida bosqich sifatida ajratish"""
+        elapsed = min(elapsed, self.timings.get(name, 0.0))
+        if elapsed > 0:
+            self.timings[name] -= elapsed
+            self.timings[part] = self.timings.get(part, 0.0) + elapsed
+
+    def merge(self, other: "StageTimer") -> None:
+        """Boshqa taymerning bosqichlarini qo'shish"""
+        for name, elapsed in other.timings.items():
+            self.timings.setdefault(name, elapsed)
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        parts = [f"{name}={elapsed:.2f}s" for name, elapsed in self.timings.items()]
+        parts.append(f"total={self.total:.2f}s")
+        return " ".join(parts)
+
+
+
+# METRIKALAR REESTRI (Prometheus text format)
+
+# Soniyalar: tez DB so'rovlaridan uzoq yuklab olishlargacha
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Label lar bo'yicha qiymatlar; oqimlar orasida xavfsiz"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: label lar {self.labelnames} bo'lishi kerak, berildi {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """(nom qo'shimchasi, label matni, qiymat)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{labels} {_format_value(value)}"
+                     for suffix, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Faqat o'suvchi hisoblagich"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counter kamaytirilmaydi")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Gauge(Metric):
+    """Joriy qiymat; set_function bilan har scrape da hisoblanadi"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """Blok bajarilayotganda qiymat 1 ga oshadi"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """Qiymat scrape paytida olinadi (label siz gauge uchun)"""
+        self._function = function
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            yield "", "", self._function()
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    """Qat'iy bucket li gistogramma (perf_counter soniyalari)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label -> (har bucket dagi kuzatuvlar soni, [yig'indi])
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Blok davomiyligini o'lchash: with hist.time(stage="upload"): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], [0.0]))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield "_bucket", _format_labels(self.labelnames, key, le), cumulative
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    """Metrikalar to'plami va Prometheus matn formatida chiqarish"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metrika allaqachon ro'yxatda: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Yuklab olish yo'li
+DOWNLOADS = REGISTRY.counter(
+    "bot_downloads_total", "Yakunlangan yuklab olishlar", ("platform", "format", "outcome"))
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "bot_download_seconds", "So'rovdan yuborishgacha umumiy vaqt", ("platform", "outcome"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "bot_download_stage_seconds", "Yuklab olish bosqichlari davomiyligi", ("stage", "platform"))
+IN_FLIGHT = REGISTRY.gauge("bot_downloads_in_flight", "Bajarilayotgan yuklab olishlar")
+QUEUE_DEPTH = REGISTRY.gauge("bot_download_queue_depth", "Ishchi jarayon kutayotgan ishlar")
+WORKERS_ACTIVE = REGISTRY.gauge("bot_download_workers_active", "Band ishchi jarayonlar")
+
+# Tashqi chaqiruvlar
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "bot_db_query_seconds", "DB metodlari (navbatda kutish bilan)", ("method",))
+BOT_API_SECONDS = REGISTRY.histogram(
+    "bot_api_request_seconds", "Bot API so'rovlari", ("method", "outcome"))
+
+# StageTimer nomlari -> bosqich label i
+STAGE_LABELS = {
+    "extract": "extract",
+    "download": "download",
+    "image": "ffmpeg",
+    "animation": "ffmpeg",
+    "extract_audio": "ffmpeg",
+}
+
+
+def observe_download(timer: StageTimer, platform: str, format_type: str, outcome: str):
+    """Tugagan yuklab olishni yozish: natija, umumiy vaqt va bosqichlar (upload_* -> upload)"""
+    DOWNLOADS.inc(platform=platform, format=format_type, outcome=outcome)
+    annotate(platform=platform, format=format_type, outcome=outcome)
+    DOWNLOAD_SECONDS.observe(timer.total, platform=platform, outcome=outcome)
+    for name, elapsed in timer.timings.items():
+        stage = "upload" if name.startswith("upload_") else STAGE_LABELS.get(name, name)
+        STAGE_SECONDS.observe(elapsed, stage=stage, platform=platform)
+
 
+async def bot_api_middleware(make_request, bot, method):
+    """aiogram session middleware: har Bot API chaqiruvi davomiyligi"""
+    name = type(method).__name__
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with span(f"bot.{name}"):
+            response = await make_request(bot, method)
+        outcome = "ok"
+        return response
+    finally:
+        BOT_API_SECONDS.observe(time.perf_counter() - start, method=name, outcome=outcome)
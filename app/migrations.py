@@ -0,0 +1,405 @@
+"""
+Database sxemasi migratsiyalari (schema_version jadvali bilan)
+"""
+from __future__ import annotations
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# SQL matn yoki cursor qabul qiluvchi funksiya
+Step = Union[str, Callable[[sqlite3.Cursor], None]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Bitta versiya: tartib bilan bajariladigan qadamlar"""
+
+    version: int
+    description: str
+    steps: Sequence[Step]
+
+
+def ensure_column(cursor: sqlite3.Cursor, table: str, column: str, ddl: str):
+    """Jadvalda ustun bo'lmasa qo'shish"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+
+
+# Yuklab olish davomiyligi (soniya); row="" - oddiy so'rov, row="NEW." - trigger
+_SECONDS = (
+    "COALESCE(CAST((julianday({row}completion_time) - julianday({row}download_time)) * 86400 "
+    "AS INTEGER), 0)"
+)
+_DONE_AT = "COALESCE(NEW.completion_time, CURRENT_TIMESTAMP)"
+
+
+MIGRATIONS = (
+    Migration(1, "boshlang'ich sxema", (
+        # Users jadvali
+        '''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                is_admin BOOLEAN DEFAULT 0,
+                is_banned BOOLEAN DEFAULT 0,
+                join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                downloads_count INTEGER DEFAULT 0,
+                storage_used INTEGER DEFAULT 0
+            )
+        ''',
+
+        # Download history jadvali
+        '''
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                format TEXT NOT NULL,
+                title TEXT,
+                file_size INTEGER,
+                status TEXT,
+                download_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completion_time TIMESTAMP,
+                error_message TEXT,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''',
+
+        # Messages jadvali (broadcast uchun)
+        '''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender_id INTEGER NOT NULL,
+                message_text TEXT NOT NULL,
+                is_broadcast BOOLEAN DEFAULT 0,
+                target_users TEXT,
+                sent_count INTEGER DEFAULT 0,
+                failed_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (sender_id) REFERENCES users(user_id)
+            )
+        ''',
+
+        # Statistics jadvali
+        '''
+            CREATE TABLE IF NOT EXISTS statistics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date DATE DEFAULT CURRENT_DATE,
+                total_users INTEGER DEFAULT 0,
+                active_users INTEGER DEFAULT 0,
+                total_downloads INTEGER DEFAULT 0,
+                successful_downloads INTEGER DEFAULT 0,
+                failed_downloads INTEGER DEFAULT 0,
+                total_storage_used INTEGER DEFAULT 0,
+                avg_download_time REAL DEFAULT 0,
+                platforms_used TEXT
+            )
+        ''',
+
+        # Admin logs jadvali
+        '''
+            CREATE TABLE IF NOT EXISTS admin_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                target_user_id INTEGER,
+                details TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (admin_id) REFERENCES users(user_id),
+                FOREIGN KEY (target_user_id) REFERENCES users(user_id)
+            )
+        ''',
+
+        # Notifications jadvali
+        '''
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                notification_type TEXT,
+                is_read BOOLEAN DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                read_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''',
+
+        # Telegram file_id keshi (bir xil link qayta yuklanmasligi uchun)
+        '''
+            CREATE TABLE IF NOT EXISTS file_cache (
+                url_key TEXT NOT NULL,
+                format TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                title TEXT,
+                file_size INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_hit TIMESTAMP,
+                PRIMARY KEY (url_key, format, media_type)
+            )
+        ''',
+    )),
+    # Migratsiyalardan oldingi bazalarda ustun allaqachon bo'lishi mumkin
+    Migration(2, "downloads.cache_hit ustuni", (
+        lambda cursor: ensure_column(cursor, "downloads", "cache_hit", "BOOLEAN DEFAULT 0"),
+    )),
+    Migration(3, "hot-path indekslar", (
+        # get_user_downloads: user_id bo'yicha, download_time tartibida
+        'CREATE INDEX IF NOT EXISTS idx_downloads_user_time ON downloads (user_id, download_time)',
+        # get_statistics: status bo'yicha sanash va cache_hit yig'indisi
+        'CREATE INDEX IF NOT EXISTS idx_downloads_status ON downloads (status, cache_hit)',
+        # get_unread_notifications
+        'CREATE INDEX IF NOT EXISTS idx_notifications_user_unread '
+        'ON notifications (user_id, is_read, created_at)',
+        # Faol foydalanuvchilar (last_activity > ...)
+        'CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users (last_activity)',
+        # get_pending_messages
+        'CREATE INDEX IF NOT EXISTS idx_messages_pending ON messages (sent_count, created_at)',
+    )),
+    Migration(4, "statistika rollup lari", (
+        # Umumiy hisoblagichlar (bitta qator) - triggerlar orqali yangilanadi
+        '''
+            CREATE TABLE IF NOT EXISTS stats_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_users INTEGER DEFAULT 0,
+                successful_downloads INTEGER DEFAULT 0,
+                failed_downloads INTEGER DEFAULT 0,
+                total_storage_used INTEGER DEFAULT 0,
+                total_download_seconds INTEGER DEFAULT 0,
+                cache_hits INTEGER DEFAULT 0,
+                cache_misses INTEGER DEFAULT 0
+            )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_statistics_date ON statistics (date)',
+
+        # Mavjud tarixdan bir martalik to'ldirish
+        f'''
+            INSERT OR REPLACE INTO stats_totals
+            SELECT 1,
+                (SELECT COUNT(*) FROM users WHERE COALESCE(is_banned, 0) = 0),
+                (SELECT COUNT(*) FROM downloads WHERE status = 'completed'),
+                (SELECT COUNT(*) FROM downloads WHERE status = 'failed'),
+                (SELECT COALESCE(SUM(storage_used), 0) FROM users),
+                (SELECT COALESCE(SUM({_SECONDS.format(row="")}), 0)
+                 FROM downloads WHERE status = 'completed'),
+                (SELECT COUNT(*) FROM downloads WHERE status = 'completed' AND cache_hit = 1),
+                (SELECT COUNT(*) FROM downloads WHERE status = 'completed' AND COALESCE(cache_hit, 0) = 0)
+        ''',
+        f'''
+            INSERT OR IGNORE INTO statistics
+                (date, total_downloads, successful_downloads, failed_downloads,
+                 total_storage_used, avg_download_time)
+            SELECT date(download_time), COUNT(*),
+                SUM(status = 'completed'),
+                SUM(status = 'failed'),
+                SUM(CASE WHEN status = 'completed' THEN COALESCE(file_size, 0) ELSE 0 END),
+                COALESCE(AVG(CASE WHEN status = 'completed' THEN {_SECONDS.format(row="")} END), 0)
+            FROM downloads
+            WHERE download_time IS NOT NULL
+            GROUP BY date(download_time)
+        ''',
+
+        # Foydalanuvchilar
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_user_insert AFTER INSERT ON users
+            BEGIN
+                UPDATE stats_totals SET total_users = total_users + (COALESCE(NEW.is_banned, 0) = 0)
+                WHERE id = 1;
+                INSERT OR IGNORE INTO statistics (date) VALUES (date(NEW.last_activity));
+                UPDATE statistics
+                SET active_users = active_users + 1,
+                    total_users = (SELECT total_users FROM stats_totals WHERE id = 1)
+                WHERE date = date(NEW.last_activity);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_user_ban AFTER UPDATE OF is_banned ON users
+            WHEN COALESCE(OLD.is_banned, 0) != COALESCE(NEW.is_banned, 0)
+            BEGIN
+                UPDATE stats_totals
+                SET total_users = total_users + CASE WHEN COALESCE(NEW.is_banned, 0) = 0 THEN 1 ELSE -1 END
+                WHERE id = 1;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_user_delete AFTER DELETE ON users
+            BEGIN
+                UPDATE stats_totals SET total_users = total_users - (COALESCE(OLD.is_banned, 0) = 0)
+                WHERE id = 1;
+            END
+        ''',
+        # Kunlik faol foydalanuvchilar: kundagi birinchi faoliyat sanaladi
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_user_activity AFTER UPDATE OF last_activity ON users
+            WHEN date(NEW.last_activity) > COALESCE(date(OLD.last_activity), '')
+            BEGIN
+                INSERT OR IGNORE INTO statistics (date) VALUES (date(NEW.last_activity));
+                UPDATE statistics SET active_users = active_users + 1
+                WHERE date = date(NEW.last_activity);
+            END
+        ''',
+
+        # Yuklab olishlar
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_download_insert AFTER INSERT ON downloads
+            BEGIN
+                INSERT OR IGNORE INTO statistics (date) VALUES (date(NEW.download_time));
+                UPDATE statistics SET total_downloads = total_downloads + 1
+                WHERE date = date(NEW.download_time);
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_download_completed AFTER UPDATE OF status ON downloads
+            WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed'
+            BEGIN
+                UPDATE stats_totals
+                SET successful_downloads = successful_downloads + 1,
+                    total_storage_used = total_storage_used + COALESCE(NEW.file_size, 0),
+                    total_download_seconds = total_download_seconds + {_SECONDS.format(row="NEW.")},
+                    cache_hits = cache_hits + (NEW.cache_hit = 1),
+                    cache_misses = cache_misses + (COALESCE(NEW.cache_hit, 0) = 0)
+                WHERE id = 1;
+                INSERT OR IGNORE INTO statistics (date) VALUES (date({_DONE_AT}));
+                UPDATE statistics
+                SET avg_download_time = (avg_download_time * successful_downloads
+                                         + {_SECONDS.format(row="NEW.")}) / (successful_downloads + 1),
+                    successful_downloads = successful_downloads + 1,
+                    total_storage_used = total_storage_used + COALESCE(NEW.file_size, 0)
+                WHERE date = date({_DONE_AT});
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_download_failed AFTER UPDATE OF status ON downloads
+            WHEN NEW.status = 'failed' AND OLD.status IS NOT 'failed'
+            BEGIN
+                UPDATE stats_totals SET failed_downloads = failed_downloads + 1 WHERE id = 1;
+                INSERT OR IGNORE INTO statistics (date) VALUES (date({_DONE_AT}));
+                UPDATE statistics SET failed_downloads = failed_downloads + 1
+                WHERE date = date({_DONE_AT});
+            END
+        ''',
+    )),
+    Migration(5, "admin foydalanuvchilar ro'yxati indekslari", (
+        # Top-N: ORDER BY downloads_count DESC LIMIT k
+        'CREATE INDEX IF NOT EXISTS idx_users_downloads ON users (downloads_count DESC, user_id DESC)',
+        # Kichik qismlar uchun partial indekslar - sanash butun jadvalni o'qimaydi
+        'CREATE INDEX IF NOT EXISTS idx_users_admins ON users (user_id) WHERE is_admin = 1',
+        'CREATE INDEX IF NOT EXISTS idx_users_banned ON users (user_id) WHERE is_banned = 1',
+    )),
+    # Ommaviy bildirishnoma - user_id = 0 bo'lgan bitta qator, o'qilganlik alohida
+    Migration(6, "ommaviy bildirishnomalar uchun o'qilganlik belgilari", (
+        '''
+            CREATE TABLE IF NOT EXISTS notification_reads (
+                user_id INTEGER NOT NULL,
+                notification_id INTEGER NOT NULL,
+                read_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, notification_id)
+            ) WITHOUT ROWID
+        ''',
+    )),
+    Migration(7, "broadcast yetkazish holati", (
+        lambda cursor: ensure_column(cursor, 'messages', 'status', "TEXT DEFAULT 'pending'"),
+        lambda cursor: ensure_column(cursor, 'messages', 'copy_from_chat_id', 'INTEGER'),
+        lambda cursor: ensure_column(cursor, 'messages', 'copy_message_id', 'INTEGER'),
+        lambda cursor: ensure_column(cursor, 'messages', 'progress_chat_id', 'INTEGER'),
+        lambda cursor: ensure_column(cursor, 'messages', 'progress_message_id', 'INTEGER'),
+        lambda cursor: ensure_column(cursor, 'messages', 'finished_at', 'TIMESTAMP'),
+        # Eski xabarlar hech qachon yuborilmagan - qayta ishga tushganda hammaga ketmasin
+        "UPDATE messages SET status = 'done'",
+        'DROP INDEX IF EXISTS idx_messages_pending',
+        "CREATE INDEX IF NOT EXISTS idx_messages_pending ON messages (created_at) WHERE status = 'pending'",
+        # Har qabul qiluvchi holati: qayta ishga tushganda faqat pending lar yuboriladi.
+        # Keyset sahifalar PK bo'yicha davom etadi, alohida indeks kerak emas
+        '''
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending',
+                error TEXT,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (message_id, user_id)
+            ) WITHOUT ROWID
+        ''',
+    )),
+    # Bir bazadagi bir nechta nusxa id larni shu hisoblagichdan oraliq bilan band qiladi
+    Migration(8, "nusxalar uchun umumiy id hisoblagichlari", (
+        '''
+            CREATE TABLE IF NOT EXISTS id_sequences (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''',
+    )),
+    # Umumiy bazada tiklash faqat o'lgan nusxalarning ishlariga tegadi
+    Migration(9, "nusxalar heartbeat i va download egasi", (
+        lambda cursor: ensure_column(cursor, 'downloads', 'instance_id', 'TEXT'),
+        '''
+            CREATE TABLE IF NOT EXISTS instances (
+                instance_id TEXT PRIMARY KEY,
+                heartbeat_at TIMESTAMP NOT NULL
+            ) WITHOUT ROWID
+        ''',
+    )),
+    # FSM_STORAGE=sqlite: holat barcha nusxalar uchun umumiy
+    Migration(10, "FSM holatlari", (
+        '''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        ''',
+    )),
+)
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Bazadagi joriy sxema versiyasi (0 - hali migratsiya qilinmagan)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, migrations: Sequence[Migration] = MIGRATIONS) -> int:
+    """Qo'llanmagan migratsiyalarni tartib bilan bajarish.
+
+    Har bir migratsiya alohida tranzaksiyada: xatolikda o'sha versiya
+    to'liq bekor qilinadi. Yakuniy versiya qaytariladi.
+    """
+    version = current_version(conn)
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= version:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            for step in migration.steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (migration.version, migration.description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = migration.version
+        logger.info(f"🗄️ Migratsiya {version}: {migration.description}")
+    return version
@@ -0,0 +1,78 @@
+"""
+Bot API chegaralari uchun tezlik cheklovchi (global va chat bo'yicha)
+"""
+from __future__ import annotations
+import asyncio
+import time
+from typing import Callable, Dict, Optional
+
+# Chat vaqtlari lug'ati shu hajmdan oshsa eskirganlari tozalanadi
+_CHAT_PRUNE_SIZE = 10000
+
+
+class RateLimiter:
+    """Global token-bucket (GCRA) va har chat uchun minimal interval.
+
+    acquire() navbatdagi bo'sh vaqt oralig'ini band qiladi va o'sha vaqtgacha
+    kutadi, shuning uchun ko'p korutina bir vaqtda chaqirsa ham yuborishlar
+    `rate` ta/soniyadan oshmaydi. pause() - Telegram RetryAfter qaytarganda
+    barcha yuborishlarni to'xtatib turish.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, per_chat_interval: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.per_chat_interval = per_chat_interval
+        self._interval = 1 / rate
+        # Oldindan ruxsat etilgan "portlash" (burst) hajmi
+        self._tau = (max(burst, 1) - 1) * self._interval
+        self._clock = clock
+        # Keyingi so'rovning nazariy vaqti
+        self._tat = 0.0
+        self._paused_until = 0.0
+        self._chat_next: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: Optional[int] = None):
+        """Yuborishga ruxsat kutish"""
+        if chat_id is not None:
+            await self._acquire_chat(chat_id)
+
+        now = self._clock()
+        send_at = max(now, self._paused_until, self._tat - self._tau)
+        self._tat = max(self._tat, send_at) + self._interval
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    async def _acquire_chat(self, chat_id: int):
+        while True:
+            wait = self._chat_next.get(chat_id, 0.0) - self._clock()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        now = self._clock()
+        if len(self._chat_next) >= _CHAT_PRUNE_SIZE:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        self._chat_next[chat_id] = now + self.per_chat_interval
+
+    def pause(self, seconds: float):
+        """Barcha yuborishlarni `seconds` davomida to'xtatish (burst siz davom etadi)"""
+        until = self._clock() + seconds
+        self._paused_until = max(self._paused_until, until)
+        self._tat = max(self._tat, self._paused_until + self._tau)
+
+
+class Throttle:
+    """Amalni `interval` soniyada ko'pi bilan bir marta bajarish (progress tahrirlari)"""
+
+    def __init__(self, interval: float, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self._clock = clock
+        self._last: Optional[float] = None
+
+    def ready(self) -> bool:
+        """Vaqti kelgan bo'lsa True (va hisoblagich yangilanadi)"""
+        now = self._clock()
+        if self._last is not None and now - self._last < self.interval:
+            return False
+        self._last = now
+        return True
@@ -0,0 +1,142 @@
+"""
+Ishga tushganda to'satdan to'xtashdan qolgan ishlarni tiklash
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Collection, Dict, List, Optional
+
+from aiogram import Bot
+
+from app.broadcast import limiter
+from app.config import DATA_DIR, INSTANCE_LEASE_SECONDS
+from app.database import adb
+from app.diskcache import disk_cache
+
+logger = logging.getLogger(__name__)
+
+# fail - qolib ketgan downloadlar failed qilinadi;
+# notify - qo'shimcha ravishda foydalanuvchiga havolani qayta yuborish so'raladi
+RECOVERY_POLICY = os.getenv("RECOVERY_POLICY", "fail").lower()
+# notify: faqat shuncha soniya ichida boshlangan downloadlar haqida xabar beriladi
+RECOVERY_NOTIFY_WINDOW = int(os.getenv("RECOVERY_NOTIFY_WINDOW", "3600"))
+
+_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+
+# Xabarlar fonda yuboriladi, ishga tushish kutmaydi
+_notify_task: Optional[asyncio.Task] = None
+
+
+@dataclass
+class RecoveryReport:
+    """Tiklash natijasi"""
+
+    downloads: int = 0
+    notified: int = 0
+    workdirs: int = 0
+    bytes: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.downloads} ta download failed, {self.notified} ta foydalanuvchi xabardor qilinadi, "
+            f"{self.workdirs} ta katalog ({self.bytes / (1024 * 1024):.1f}MB) o'chirildi"
+        )
+
+
+def _remove_legacy_chat_dirs(data_dir: Path) -> Dict[str, int]:
+    """Eski data/chat_<id>/<uuid> tuzilmasidan qolgan kataloglar"""
+    removed = freed = 0
+    for chat_dir in data_dir.glob("chat_*"):
+        if not chat_dir.is_dir():
+            continue
+        for path in chat_dir.rglob("*"):
+            if path.is_file():
+                freed += path.stat().st_size
+        removed += sum(1 for path in chat_dir.iterdir() if path.is_dir())
+        shutil.rmtree(chat_dir, ignore_errors=True)
+    return {'workdirs': removed, 'bytes': freed}
+
+
+def _remove_dead_instances(work_root: Path, keep: Collection[str]) -> Dict[str, int]:
+    """O'lgan nusxalarning (va eski tuzilmadagi) work/<nom> kataloglari"""
+    removed = freed = 0
+    if not work_root.exists():
+        return {'workdirs': 0, 'bytes': 0}
+    for instance_dir in work_root.iterdir():
+        if not instance_dir.is_dir() or instance_dir.name in keep:
+            continue
+        for path in instance_dir.rglob("*"):
+            if path.is_file():
+                freed += path.stat().st_size
+        removed += 1
+        shutil.rmtree(instance_dir, ignore_errors=True)
+    return {'workdirs': removed, 'bytes': freed}
+
+
+def _reclaim_disk(alive: Collection[str]) -> Dict[str, int]:
+    """Yetim ish kataloglarini bitta o'tishda o'chirish (threadda).
+
+    Tirik nusxalarning kataloglariga tegilmaydi.
+    """
+    recovered = disk_cache.recover()
+    dead = _remove_dead_instances(disk_cache.root.parent, {disk_cache.root.name, *alive})
+    legacy = _remove_legacy_chat_dirs(DATA_DIR)
+    return {key: recovered[key] + dead[key] + legacy[key] for key in recovered}
+
+
+async def _notify(bot: Bot, rows: List[Dict]) -> int:
+    """Har foydalanuvchiga bitta xabar: to'xtatilgan havolalarni qayta yuborish"""
+    by_user: Dict[int, List[str]] = {}
+    for row in rows:
+        by_user.setdefault(row['user_id'], []).append(row['url'])
+
+    notified = 0
+    for user_id, urls in by_user.items():
+        text = (
+            "⚠️ Bot qayta ishga tushdi va yuklab olishingiz to'xtatildi.\n"
+            "Havolani qayta yuboring:\n\n" + "\n".join(urls[:5])
+        )
+        try:
+            await limiter.acquire(user_id)
+            await bot.send_message(user_id, text, disable_web_page_preview=True)
+            notified += 1
+        except Exception as e:
+            logger.warning(f"Recovery xabari {user_id} ga yuborilmadi: {e}")
+    logger.info(f"♻️ Recovery: {notified} ta foydalanuvchiga xabar yuborildi")
+    return notified
+
+
+async def recover_on_startup(bot: Bot) -> RecoveryReport:
+    """Qolib ketgan downloadlar va yetim kataloglarni tiklash.
+
+    Handlerlar ishga tushishidan oldin chaqiriladi: shu nusxaning shu paytgacha
+    boshlangan ishlari tirik emas. Baza va DATA_DIR umumiy bo'lsa boshqa
+    nusxalardan faqat heartbeat i INSTANCE_LEASE_SECONDS dan eskirganlari
+    (o'lganlari) tiklanadi.
+    """
+    global _notify_task
+    now = datetime.now(timezone.utc)
+    report = RecoveryReport()
+
+    await adb.heartbeat()
+    alive = await adb.live_instances(INSTANCE_LEASE_SECONDS)
+    rows = await adb.recover_stale_downloads(now.strftime(_TIMESTAMP), alive)
+    report.downloads = len(rows)
+
+    disk = await asyncio.to_thread(_reclaim_disk, alive)
+    report.workdirs, report.bytes = disk['workdirs'], disk['bytes']
+
+    if RECOVERY_POLICY == "notify":
+        since = (now - timedelta(seconds=RECOVERY_NOTIFY_WINDOW)).strftime(_TIMESTAMP)
+        recent = [row for row in rows if row['download_time'] >= since]
+        report.notified = len({row['user_id'] for row in recent})
+        if recent:
+            _notify_task = asyncio.create_task(_notify(bot, recent))
+
+    logger.info(f"♻️ Recovery: {report}")
+    return report
@@ -0,0 +1,252 @@
+"""
+Fon ishlari uchun nazorat qilinadigan scheduler (interval va cron)
+"""
+from __future__ import annotations
+import asyncio
+import functools
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Xato bergan ish qayta ishga tushirilishidan oldingi kutish (eksponensial)
+RESTART_BACKOFF_BASE = 5.0
+RESTART_BACKOFF_MAX = 600.0
+
+
+class Interval:
+    """Har `seconds` soniyada"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval musbat bo'lishi kerak")
+        self.seconds = seconds
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds)
+
+    def __repr__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+
+def _parse_field(text: str, low: int, high: int) -> Set[int]:
+    """Bitta cron maydoni: *, 5, 1-5, */15, 1-30/2, 1,15"""
+    values: Set[int] = set()
+    for part in text.split(","):
+        rng, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if rng == "*":
+            start, end = low, high
+        elif "-" in rng:
+            start, end = (int(v) for v in rng.split("-", 1))
+        else:
+            start = int(rng)
+            end = high if step_text else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Noto'g'ri cron maydoni: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """5 maydonli cron ifoda: minut soat kun oy hafta_kuni (0/7 - yakshanba).
+
+    Kun va hafta kuni ikkalasi ham berilsa, odatdagi cron kabi
+    ulardan biri mos kelishi yetarli.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron ifodada 5 ta maydon bo'lishi kerak: {expression}")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        # datetime: dushanba=0, cron: yakshanba=0
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_run(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = moment.replace(year=moment.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron ifoda hech qachon bajarilmaydi: {self.expression}")
+
+    def __repr__(self) -> str:
+        return f"cron '{self.expression}'"
+
+
+@dataclass
+class Job:
+    """Ro'yxatdan o'tgan ish va uning statistikasi"""
+
+    name: str
+    func: Callable[..., Any]
+    schedule: Any
+    timeout: Optional[float] = None
+    jitter: float = 0.0
+    # True - sinxron funksiya, alohida threadda bajariladi
+    blocking: bool = False
+    run_at_start: bool = False
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    total_duration: float = 0.0
+    last_duration: Optional[float] = None
+    last_run: Optional[datetime] = None
+    last_error: Optional[str] = None
+    next_run: Optional[datetime] = None
+    _thread_future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+    def stats(self) -> Dict:
+        return {
+            'schedule': repr(self.schedule),
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_duration': self.last_duration,
+            'avg_duration': self.total_duration / self.runs if self.runs else None,
+            'last_run': self.last_run,
+            'last_error': self.last_error,
+            'next_run': self.next_run,
+        }
+
+
+class Scheduler:
+    """Ishlarni jadval bo'yicha bajaradi va nazorat qiladi.
+
+    Har ish alohida task: xato yoki timeout bo'lsa eksponensial kutishdan
+    keyin qayta uriniladi, davomiylik va xatolar yoziladi. blocking=True
+    ishlar event loop ni band qilmasligi uchun alohida thread pool da bajariladi.
+    """
+
+    def __init__(self, max_threads: int = 2,
+                 backoff_base: float = RESTART_BACKOFF_BASE,
+                 backoff_max: float = RESTART_BACKOFF_MAX):
+        self.jobs: Dict[str, Job] = {}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._max_threads = max_threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, func: Callable[..., Any], *args,
+                every: Optional[float] = None, cron: Optional[str] = None,
+                timeout: Optional[float] = None, jitter: float = 0.0,
+                blocking: bool = False, run_at_start: bool = False) -> Job:
+        """Ish qo'shish: every (soniya) yoki cron dan bittasi"""
+        if (every is None) == (cron is None):
+            raise ValueError("every yoki cron dan faqat bittasi berilishi kerak")
+        if name in self.jobs:
+            raise ValueError(f"Ish allaqachon ro'yxatda: {name}")
+        schedule = Interval(every) if every is not None else Cron(cron)
+        if args:
+            func = functools.partial(func, *args)
+        job = Job(name, func, schedule, timeout, jitter, blocking, run_at_start)
+        self.jobs[name] = job
+        return job
+
+    async def start(self):
+        """Barcha ishlarni ishga tushirish"""
+        self._executor = ThreadPoolExecutor(max_workers=self._max_threads,
+                                            thread_name_prefix="scheduler")
+        self._tasks = [
+            asyncio.create_task(self._supervise(job), name=f"job:{job.name}")
+            for job in self.jobs.values()
+        ]
+        logger.info(f"🗓️ Scheduler: {', '.join(f'{j.name} ({j.schedule!r})' for j in self.jobs.values())}")
+
+    async def stop(self):
+        """Ishlarni bekor qilish va thread dagi ishlar tugashini kutish"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            executor, self._executor = self._executor, None
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, functools.partial(executor.shutdown, cancel_futures=True))
+
+    def stats(self) -> Dict[str, Dict]:
+        """Har ish bo'yicha bajarilishlar, davomiylik va xatolar"""
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    async def _supervise(self, job: Job):
+        job.next_run = datetime.now() if job.run_at_start else job.schedule.next_run(datetime.now())
+        while True:
+            delay = (job.next_run - datetime.now()).total_seconds()
+            if job.jitter:
+                delay += random.uniform(0, job.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            ok = await self._run_once(job)
+            scheduled = job.schedule.next_run(datetime.now())
+            if ok:
+                job.consecutive_failures = 0
+                job.next_run = scheduled
+            else:
+                backoff = min(self.backoff_base * 2 ** (job.consecutive_failures - 1), self.backoff_max)
+                job.next_run = min(scheduled, datetime.now() + timedelta(seconds=backoff))
+                logger.warning(f"🔁 {job.name} {job.next_run:%H:%M:%S} da qayta uriniladi")
+
+    async def _run_once(self, job: Job) -> bool:
+        """Ishni bir marta bajarish; muvaffaqiyatli bo'lsa True"""
+        if job._thread_future is not None and not job._thread_future.done():
+            # Oldingi timeout bo'lgan thread hali ishlayapti - ustma-ust ishga tushirilmaydi
+            logger.warning(f"⏭️ {job.name}: oldingi bajarilish hali tugamagan")
+            return False
+
+        job.last_run = datetime.now()
+        started = time.perf_counter()
+        try:
+            if job.blocking:
+                loop = asyncio.get_running_loop()
+                job._thread_future = loop.run_in_executor(self._executor, job.func)
+                # shield: timeout da thread natijasini kutish to'xtaydi, future saqlanadi
+                await asyncio.wait_for(asyncio.shield(job._thread_future), job.timeout)
+            else:
+                await asyncio.wait_for(job.func(), job.timeout)
+            job.last_error = None
+            return True
+        except asyncio.TimeoutError:
+            job.last_error = f"timeout ({job.timeout}s)"
+            logger.error(f"⏰ {job.name} {job.timeout}s ichida tugamadi")
+        except Exception as e:
+            job.last_error = str(e)
+            logger.error(f"❌ {job.name} xatosi: {e}", exc_info=True)
+        finally:
+            duration = time.perf_counter() - started
+            job.runs += 1
+            job.total_duration += duration
+            job.last_duration = duration
+            logger.debug(f"⏱️ {job.name} took {duration:.2f} seconds")
+
+        job.failures += 1
+        job.consecutive_failures += 1
+        return False
@@ -0,0 +1,345 @@
+"""
+user_id bo'yicha bir nechta SQLite faylga bo'lingan backend
+"""
+from __future__ import annotations
+import heapq
+import logging
+import threading
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import INSTANCE_ID
+from app.database import (
+    ARCHIVE_DIR, DOWNLOAD_ID_BLOCK, DOWNLOAD_RETENTION_DAYS, RETENTION_BATCH_SIZE, VACUUM_PAGES,
+    Database,
+)
+from app.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+def shard_path(db_path: Path, index: int) -> Path:
+    """data/bot.db -> data/bot.shard0.db"""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.shard{index}{db_path.suffix}")
+
+
+class ShardedDatabase(StorageBackend):
+    """users, downloads va notifications user_id % N bo'yicha N ta faylda.
+
+    Umumiy jadvallar (messages, admin_logs, file_cache) asosiy faylda qoladi.
+    Har shard o'z lock iga ega, shuning uchun turli foydalanuvchilarning
+    yozuvlari parallel bajariladi. Admin so'rovlari barcha shardlarga
+    yuboriladi va natijalar birlashtiriladi.
+
+    Id lar shard raqamini o'z ichiga oladi: id % N - shard. Download id lari
+    shardlarda shu ko'rinishda saqlanadi, notification id lari esa tashqariga
+    chiqishda kodlanadi.
+    """
+
+    def __init__(self, db_path: Path, shards: int, instance_id: str = INSTANCE_ID):
+        self.shard_count = shards
+        self.instance_id = instance_id
+        self.global_db = Database(db_path, instance_id)
+        self.shards = [Database(shard_path(db_path, i), instance_id) for i in range(shards)]
+        self._id_lock = threading.Lock()
+        # Band qilingan tartib raqamlari oralig'i: [_next_seq, _seq_end)
+        self._next_seq = self._seq_end = 0
+
+    def _all(self) -> List[Database]:
+        return [self.global_db, *self.shards]
+
+    def _user_shard(self, user_id: int) -> Database:
+        return self.shards[self.shard_for(user_id)]
+
+    def _id_shard(self, encoded_id: int) -> Database:
+        return self.shards[encoded_id % self.shard_count]
+
+    def _max_download_seq(self) -> int:
+        return max(shard.get_max_download_id() for shard in self.shards) // self.shard_count
+
+    def init_db(self):
+        for database in self._all():
+            database.init_db()
+
+    def close(self):
+        for database in self._all():
+            database.close()
+
+    # USER OPERATSIYALARI
+
+    def add_user(self, user_id: int, username: str = "", first_name: str = "",
+                 last_name: str = "", is_admin: bool = False) -> bool:
+        return self._user_shard(user_id).add_user(user_id, username, first_name, last_name, is_admin)
+
+    def get_user(self, user_id: int) -> Optional[Dict]:
+        return self._user_shard(user_id).get_user(user_id)
+
+    def get_all_users(self, is_admin: Optional[bool] = None,
+                      is_banned: Optional[bool] = None) -> List[Dict]:
+        users = chain.from_iterable(shard.get_all_users(is_admin, is_banned) for shard in self.shards)
+        return sorted(users, key=lambda u: u['user_id'])
+
+    def get_user_counts(self) -> Dict:
+        totals = {'total': 0, 'admins': 0, 'banned': 0, 'active': 0}
+        for shard in self.shards:
+            for key, value in shard.get_user_counts().items():
+                totals[key] += value
+        return totals
+
+    def get_top_users(self, limit: int = 5) -> List[Dict]:
+        # Har shard o'z top-N ini beradi, umumiy top-N shulardan olinadi
+        candidates = chain.from_iterable(shard.get_top_users(limit) for shard in self.shards)
+        return heapq.nlargest(limit, candidates, key=lambda u: (u['downloads_count'], u['user_id']))
+
+    def get_users_page(self, cursor_id: int = 0, direction: str = "next",
+                       limit: int = 10) -> Tuple[List[Dict], bool]:
+        users, has_more = [], False
+        for shard in self.shards:
+            page, more = shard.get_users_page(cursor_id, direction, limit)
+            users.extend(page)
+            has_more = has_more or more
+        users.sort(key=lambda u: u['user_id'])
+        if len(users) > limit:
+            has_more = True
+            # next - cursor ga eng yaqin boshidagilar, prev - oxiridagilar
+            users = users[:limit] if direction != "prev" else users[-limit:]
+        return users, has_more
+
+    def ban_user(self, user_id: int, reason: str = "") -> bool:
+        return self._user_shard(user_id).ban_user(user_id, reason)
+
+    def unban_user(self, user_id: int) -> bool:
+        return self._user_shard(user_id).unban_user(user_id)
+
+    def make_admin(self, user_id: int) -> bool:
+        return self._user_shard(user_id).make_admin(user_id)
+
+    def remove_admin(self, user_id: int) -> bool:
+        return self._user_shard(user_id).remove_admin(user_id)
+
+    def update_user_activity(self, user_id: int):
+        return self._user_shard(user_id).update_user_activity(user_id)
+
+    # DOWNLOAD OPERATSIYALARI
+
+    def allocate_download_id(self, user_id: int) -> int:
+        with self._id_lock:
+            if self._next_seq >= self._seq_end:
+                # Tartib raqamlari oralig'i asosiy faylda band qilinadi (barcha nusxalar uchun umumiy)
+                first = self.global_db.reserve_ids('download_seq', DOWNLOAD_ID_BLOCK, self._max_download_seq())
+                self._next_seq, self._seq_end = first, first + DOWNLOAD_ID_BLOCK
+            seq = self._next_seq
+            self._next_seq += 1
+        return seq * self.shard_count + self.shard_for(user_id)
+
+    def log_download(self, user_id: int, url: str, format_type: str,
+                     title: str = "", file_size: int = 0, status: str = "pending") -> int:
+        return self._user_shard(user_id).log_download(
+            user_id, url, format_type, title, file_size, status,
+            download_id=self.allocate_download_id(user_id),
+        )
+
+    def complete_download(self, download_id: int, file_size: int = 0,
+                          cache_hit: bool = False):
+        return self._id_shard(download_id).complete_download(download_id, file_size, cache_hit)
+
+    def fail_download(self, download_id: int, error_message: str = ""):
+        return self._id_shard(download_id).fail_download(download_id, error_message)
+
+    def recover_stale_downloads(self, started_before: str, alive: Sequence[str] = (),
+                                error_message: str = "Interrupted by restart") -> List[Dict]:
+        return list(chain.from_iterable(
+            shard.recover_stale_downloads(started_before, alive, error_message) for shard in self.shards
+        ))
+
+    def heartbeat(self):
+        return self.global_db.heartbeat()
+
+    def live_instances(self, lease_seconds: int) -> List[str]:
+        return self.global_db.live_instances(lease_seconds)
+
+    def apply_write_batch(self, inserts: List[Tuple], updates: List[Tuple],
+                          activity: List[Tuple[int, str]]) -> Tuple[List, List, List]:
+        """Partiyani shardlarga bo'lib yozish.
+
+        Har shard alohida tranzaksiya; faqat yozilmagan qatorlar qaytariladi,
+        ularni qayta urinish yoki tashlab yuborishni write-behind bufer hal qiladi.
+        """
+        parts: Dict[int, Tuple[List, List, List]] = {}
+        for row in inserts:
+            parts.setdefault(row[0] % self.shard_count, ([], [], []))[0].append(row)
+        for row in updates:
+            parts.setdefault(row[1] % self.shard_count, ([], [], []))[1].append(row)
+        for row in activity:
+            parts.setdefault(self.shard_for(row[0]), ([], [], []))[2].append(row)
+
+        failed: Tuple[List, List, List] = ([], [], [])
+        for index, part in parts.items():
+            for rows, left in zip(failed, self.shards[index].apply_write_batch(*part)):
+                rows.extend(left)
+        return failed
+
+    def get_user_downloads(self, user_id: int, limit: int = 10) -> List[Dict]:
+        return self._user_shard(user_id).get_user_downloads(user_id, limit)
+
+    def archive_downloads(self, older_than_days: int = DOWNLOAD_RETENTION_DAYS,
+                          archive_dir: Path = ARCHIVE_DIR,
+                          batch_size: int = RETENTION_BATCH_SIZE) -> int:
+        return sum(
+            shard.archive_downloads(older_than_days, archive_dir, batch_size)
+            for shard in self.shards
+        )
+
+    def incremental_vacuum(self, pages: int = VACUUM_PAGES) -> int:
+        return sum(database.incremental_vacuum(pages) for database in self._all())
+
+    def enable_incremental_vacuum(self) -> bool:
+        return all([database.enable_incremental_vacuum() for database in self._all()])
+
+    # FILE_ID KESH OPERATSIYALARI
+
+    def get_cached_files(self, url_key: str, format_type: str) -> Dict[str, Dict]:
+        return self.global_db.get_cached_files(url_key, format_type)
+
+    def cache_file(self, url_key: str, format_type: str, media_type: str,
+                   file_id: str, title: str = "", file_size: int = 0):
+        return self.global_db.cache_file(url_key, format_type, media_type, file_id, title, file_size)
+
+    def record_cache_hit(self, url_key: str, format_type: str):
+        return self.global_db.record_cache_hit(url_key, format_type)
+
+    def invalidate_cache(self, url_key: str, format_type: str,
+                         media_types: Optional[List[str]] = None):
+        return self.global_db.invalidate_cache(url_key, format_type, media_types)
+
+    # MESSAGE OPERATSIYALARI
+
+    def send_message(self, sender_id: int, message_text: str,
+                     target_users: Optional[List[int]] = None,
+                     is_broadcast: bool = False) -> int:
+        return self.global_db.send_message(sender_id, message_text, target_users, is_broadcast)
+
+    def get_pending_messages(self, limit: int = 10) -> List[Dict]:
+        return self.global_db.get_pending_messages(limit)
+
+    def update_message_status(self, message_id: int, sent_count: int, failed_count: int):
+        return self.global_db.update_message_status(message_id, sent_count, failed_count)
+
+    def create_broadcast(self, sender_id: int, message_text: str,
+                         copy_from_chat_id: Optional[int] = None,
+                         copy_message_id: Optional[int] = None,
+                         progress_chat_id: Optional[int] = None,
+                         progress_message_id: Optional[int] = None,
+                         user_ids: Optional[List[int]] = None) -> int:
+        # Foydalanuvchilar shardlarda, broadcast holati asosiy faylda
+        if user_ids is None:
+            user_ids = [user['user_id'] for user in self.get_all_users(is_banned=False)]
+        return self.global_db.create_broadcast(
+            sender_id, message_text, copy_from_chat_id, copy_message_id,
+            progress_chat_id, progress_message_id, user_ids,
+        )
+
+    def get_broadcast_recipients(self, message_id: int, after_user_id: int = 0,
+                                 limit: int = 500) -> List[int]:
+        return self.global_db.get_broadcast_recipients(message_id, after_user_id, limit)
+
+    def count_broadcast_pending(self, message_id: int) -> int:
+        return self.global_db.count_broadcast_pending(message_id)
+
+    def record_broadcast_results(self, message_id: int,
+                                 results: List[Tuple[int, str, Optional[str]]]) -> bool:
+        return self.global_db.record_broadcast_results(message_id, results)
+
+    def finish_broadcast(self, message_id: int):
+        return self.global_db.finish_broadcast(message_id)
+
+    # NOTIFICATION OPERATSIYALARI
+
+    def _encode(self, local_id: int, shard_index: int) -> int:
+        return local_id * self.shard_count + shard_index
+
+    def add_notification(self, user_id: int, message: str,
+                         notification_type: str = "info") -> int:
+        local_id = self._user_shard(user_id).add_notification(user_id, message, notification_type)
+        return self._encode(local_id, self.shard_for(user_id)) if local_id else 0
+
+    def broadcast_notification(self, message: str, notification_type: str = "info") -> int:
+        # Har shardda bitta qator - o'sha shard foydalanuvchilari uchun
+        ids = [shard.broadcast_notification(message, notification_type) for shard in self.shards]
+        return self._encode(ids[0], 0) if all(ids) else 0
+
+    def get_unread_notifications(self, user_id: int, limit: int = 50) -> List[Dict]:
+        index = self.shard_for(user_id)
+        notifications = self.shards[index].get_unread_notifications(user_id, limit)
+        for notification in notifications:
+            notification['id'] = self._encode(notification['id'], index)
+        return notifications
+
+    def mark_notifications_read(self, user_id: int, notification_ids: List[int]):
+        local_ids = [notification_id // self.shard_count for notification_id in notification_ids]
+        return self._user_shard(user_id).mark_notifications_read(user_id, local_ids)
+
+    # FSM OPERATSIYALARI (asosiy faylda)
+
+    def get_fsm_state(self, key: str) -> Optional[str]:
+        return self.global_db.get_fsm_state(key)
+
+    def set_fsm_state(self, key: str, state: Optional[str]):
+        return self.global_db.set_fsm_state(key, state)
+
+    def get_fsm_data(self, key: str) -> Dict:
+        return self.global_db.get_fsm_data(key)
+
+    def set_fsm_data(self, key: str, data: Dict):
+        return self.global_db.set_fsm_data(key, data)
+
+    # ADMIN LOG OPERATSIYALARI
+
+    def log_admin_action(self, admin_id: int, action: str,
+                         target_user_id: Optional[int] = None, details: str = ""):
+        return self.global_db.log_admin_action(admin_id, action, target_user_id, details)
+
+    def get_admin_logs(self, limit: int = 50) -> List[Dict]:
+        return self.global_db.get_admin_logs(limit)
+
+    # STATISTICS
+
+    def get_statistics(self) -> Dict:
+        parts = [shard.get_statistics() for shard in self.shards]
+        if not all(parts):
+            return {}
+        merged = {
+            key: sum(part[key] for part in parts)
+            for key in ('total_users', 'active_users', 'successful_downloads', 'failed_downloads',
+                        'total_storage_used', 'cache_hits', 'cache_misses')
+        }
+        successful = merged['successful_downloads']
+        merged['avg_download_time'] = (
+            sum(p['avg_download_time'] * p['successful_downloads'] for p in parts) / successful
+            if successful else 0
+        )
+        hits = sum(shard.user_cache.hits for shard in self.shards)
+        lookups = hits + sum(shard.user_cache.misses for shard in self.shards)
+        merged['user_cache_hit_ratio'] = hits / lookups if lookups else 0.0
+        return merged
+
+    def get_daily_statistics(self, days: int = 7) -> List[Dict]:
+        by_date: Dict[str, Dict] = {}
+        for shard in self.shards:
+            for row in shard.get_daily_statistics(days):
+                day = by_date.get(row['date'])
+                if day is None:
+                    by_date[row['date']] = dict(row)
+                    continue
+                total_successful = day['successful_downloads'] + row['successful_downloads']
+                if total_successful:
+                    day['avg_download_time'] = (
+                        day['avg_download_time'] * day['successful_downloads']
+                        + row['avg_download_time'] * row['successful_downloads']
+                    ) / total_successful
+                for key in ('total_users', 'active_users', 'total_downloads', 'successful_downloads',
+                            'failed_downloads', 'total_storage_used'):
+                    day[key] += row[key]
+        return sorted(by_date.values(), key=lambda d: d['date'], reverse=True)[:days]
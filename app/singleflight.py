@@ -0,0 +1,74 @@
+"""
+Bir xil parallel ishlarni birlashtirish (single-flight)
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """Bitta bajarilayotgan ish va uni kutayotganlar soni"""
+
+    __slots__ = ("task", "refs", "released")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.refs = 0
+        self.released = False
+
+
+class SingleFlight:
+    """Bir xil kalitli ishlarni bitta ishga birlashtiruvchi registr.
+
+    Birinchi so'rovchi ishni boshlaydi, keyingilari shu ishga ulanadi.
+    Natija oxirgi so'rovchi chiqqandan keyin on_release orqali bo'shatiladi.
+    """
+
+    def __init__(self, on_release: Optional[Callable[[Any], None]] = None):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._on_release = on_release
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    @asynccontextmanager
+    async def join(self, key: Hashable, factory: Callable[[], Awaitable[Any]]):
+        """Kalit bo'yicha ishga ulanish (yoki yangi ish boshlash)"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+        else:
+            logger.info(f"🔗 Bajarilayotgan ishga ulandi: {key} ({flight.refs + 1} kutmoqda)")
+
+        flight.refs += 1
+        try:
+            yield await asyncio.shield(flight.task)
+        finally:
+            flight.refs -= 1
+            if flight.refs == 0 and not flight.task.done():
+                # Hech kim kutmayapti - ishni to'xtatamiz
+                flight.task.cancel()
+            self._maybe_release(flight)
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        self._maybe_release(flight)
+
+    def _maybe_release(self, flight: _Flight) -> None:
+        if flight.refs or flight.released or not flight.task.done():
+            return
+        flight.released = True
+        if flight.task.cancelled() or flight.task.exception() is not None:
+            return
+        if self._on_release:
+            try:
+                self._on_release(flight.task.result())
+            except Exception as e:
+                logger.error(f"Single-flight natijasini bo'shatishda xatolik: {e}")
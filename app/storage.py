@@ -0,0 +1,210 @@
+"""
+Ma'lumotlar saqlash backend interfeysi
+"""
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class StorageBackend(ABC):
+    """Handlerlar ishlatadigan saqlash API si.
+
+    Database - bitta SQLite fayl, ShardedDatabase - user_id bo'yicha
+    bo'lingan bir nechta fayl. Handlerlar faqat shu metodlarga tayanadi.
+    """
+
+    # Nechta mustaqil fayl (parallel yozuvchilar soni)
+    shard_count: int = 1
+
+    def shard_for(self, user_id: int) -> int:
+        """Foydalanuvchi qatorlari saqlanadigan shard raqami"""
+        return user_id % self.shard_count
+
+    @abstractmethod
+    def init_db(self): ...
+
+    @abstractmethod
+    def close(self): ...
+
+    # USER OPERATSIYALARI
+
+    @abstractmethod
+    def add_user(self, user_id: int, username: str = "", first_name: str = "",
+                 last_name: str = "", is_admin: bool = False) -> bool: ...
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[Dict]: ...
+
+    @abstractmethod
+    def get_all_users(self, is_admin: Optional[bool] = None,
+                      is_banned: Optional[bool] = None) -> List[Dict]: ...
+
+    @abstractmethod
+    def get_user_counts(self) -> Dict: ...
+
+    @abstractmethod
+    def get_top_users(self, limit: int = 5) -> List[Dict]: ...
+
+    @abstractmethod
+    def get_users_page(self, cursor_id: int = 0, direction: str = "next",
+                       limit: int = 10) -> Tuple[List[Dict], bool]: ...
+
+    @abstractmethod
+    def ban_user(self, user_id: int, reason: str = "") -> bool: ...
+
+    @abstractmethod
+    def unban_user(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    def make_admin(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    def remove_admin(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    def update_user_activity(self, user_id: int): ...
+
+    # DOWNLOAD OPERATSIYALARI
+
+    @abstractmethod
+    def allocate_download_id(self, user_id: int) -> int:
+        """Yangi download id (nusxa band qilgan oraliqdan; tugasa bazadan yangisi)"""
+
+    @abstractmethod
+    def log_download(self, user_id: int, url: str, format_type: str,
+                     title: str = "", file_size: int = 0, status: str = "pending") -> int: ...
+
+    @abstractmethod
+    def complete_download(self, download_id: int, file_size: int = 0,
+                          cache_hit: bool = False): ...
+
+    @abstractmethod
+    def fail_download(self, download_id: int, error_message: str = ""): ...
+
+    @abstractmethod
+    def recover_stale_downloads(self, started_before: str, alive: Sequence[str] = (),
+                                error_message: str = "Interrupted by restart") -> List[Dict]: ...
+
+    @abstractmethod
+    def heartbeat(self):
+        """Shu nusxa tirikligini yozish"""
+
+    @abstractmethod
+    def live_instances(self, lease_seconds: int) -> List[str]:
+        """Heartbeat i yangi bo'lgan boshqa nusxalar"""
+
+    @abstractmethod
+    def apply_write_batch(self, inserts: List[Tuple], updates: List[Tuple],
+                          activity: List[Tuple[int, str]]) -> Tuple[List, List, List]: ...
+
+    @abstractmethod
+    def get_user_downloads(self, user_id: int, limit: int = 10) -> List[Dict]: ...
+
+    @abstractmethod
+    def archive_downloads(self, older_than_days: int, archive_dir: Path,
+                          batch_size: int) -> int: ...
+
+    @abstractmethod
+    def incremental_vacuum(self, pages: int) -> int: ...
+
+    @abstractmethod
+    def enable_incremental_vacuum(self) -> bool:
+        """Bir martalik to'liq VACUUM (bazani bloklaydi, faqat qo'lda)"""
+
+    # FILE_ID KESH OPERATSIYALARI
+
+    @abstractmethod
+    def get_cached_files(self, url_key: str, format_type: str) -> Dict[str, Dict]: ...
+
+    @abstractmethod
+    def cache_file(self, url_key: str, format_type: str, media_type: str,
+                   file_id: str, title: str = "", file_size: int = 0): ...
+
+    @abstractmethod
+    def record_cache_hit(self, url_key: str, format_type: str): ...
+
+    @abstractmethod
+    def invalidate_cache(self, url_key: str, format_type: str,
+                         media_types: Optional[List[str]] = None): ...
+
+    # MESSAGE OPERATSIYALARI
+
+    @abstractmethod
+    def send_message(self, sender_id: int, message_text: str,
+                     target_users: Optional[List[int]] = None,
+                     is_broadcast: bool = False) -> int: ...
+
+    @abstractmethod
+    def get_pending_messages(self, limit: int = 10) -> List[Dict]: ...
+
+    @abstractmethod
+    def update_message_status(self, message_id: int, sent_count: int, failed_count: int): ...
+
+    @abstractmethod
+    def create_broadcast(self, sender_id: int, message_text: str,
+                         copy_from_chat_id: Optional[int] = None,
+                         copy_message_id: Optional[int] = None,
+                         progress_chat_id: Optional[int] = None,
+                         progress_message_id: Optional[int] = None,
+                         user_ids: Optional[List[int]] = None) -> int: ...
+
+    @abstractmethod
+    def get_broadcast_recipients(self, message_id: int, after_user_id: int = 0,
+                                 limit: int = 500) -> List[int]: ...
+
+    @abstractmethod
+    def count_broadcast_pending(self, message_id: int) -> int: ...
+
+    @abstractmethod
+    def record_broadcast_results(self, message_id: int,
+                                 results: List[Tuple[int, str, Optional[str]]]) -> bool: ...
+
+    @abstractmethod
+    def finish_broadcast(self, message_id: int): ...
+
+    # NOTIFICATION OPERATSIYALARI
+
+    @abstractmethod
+    def add_notification(self, user_id: int, message: str,
+                         notification_type: str = "info") -> int: ...
+
+    @abstractmethod
+    def broadcast_notification(self, message: str, notification_type: str = "info") -> int: ...
+
+    @abstractmethod
+    def get_unread_notifications(self, user_id: int, limit: int = 50) -> List[Dict]: ...
+
+    @abstractmethod
+    def mark_notifications_read(self, user_id: int, notification_ids: List[int]): ...
+
+    # FSM OPERATSIYALARI
+
+    @abstractmethod
+    def get_fsm_state(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def set_fsm_state(self, key: str, state: Optional[str]): ...
+
+    @abstractmethod
+    def get_fsm_data(self, key: str) -> Dict: ...
+
+    @abstractmethod
+    def set_fsm_data(self, key: str, data: Dict): ...
+
+    # ADMIN LOG OPERATSIYALARI
+
+    @abstractmethod
+    def log_admin_action(self, admin_id: int, action: str,
+                         target_user_id: Optional[int] = None, details: str = ""): ...
+
+    @abstractmethod
+    def get_admin_logs(self, limit: int = 50) -> List[Dict]: ...
+
+    # STATISTICS
+
+    @abstractmethod
+    def get_statistics(self) -> Dict: ...
+
+    @abstractmethod
+    def get_daily_statistics(self, days: int = 7) -> List[Dict]: ...
@@ -1,97 +1,77 @@
 """
 Background tasks va scheduler
 """
-import asyncio
 import logging
-from datetime import datetime, timedelta
-from app.database import db
 
-logger = logging.getLogger(__name__)
-
-
-async def broadcast_scheduler():
-    """Pending xabarlarni yuborish scheduleri"""
-    while True:
-        try:
-            pending_messages = db.get_pending_messages(limit=10)
-
-            for msg in pending_messages:
-                # Xabar yuborish logikasi
-                users = db.get_all_users(is_banned=False)
-                sent = 0
-                failed = 0
-
-                for user in users:
-                    try:
-                        # Bot orqali xabar yuborish
-                        # await bot.send_message(user['user_id'], msg['message_text'])
-                        sent += 1
-                    except Exception as e:
-                        logger.error(f"Xabar yuborish xatosi: {e}")
-                        failed += 1
-
-                db.update_message_status(msg['id'], sent, failed)
-                logger.info(f"✅ Broadcast tugallandi: {sent} sent, {failed} failed")
+from aiogram import Bot
 
-            await asyncio.sleep(60)  # Har 1 daqiqa tekshir
+from app.broadcast import broadcasts
+from app.config import INSTANCE_LEASE_SECONDS
+from app.database import adb, db
+from app.diskcache import disk_cache
+from app.scheduler import Scheduler
 
-        except Exception as e:
-            logger.error(f"Broadcast scheduler xatosi: {e}")
-            await asyncio.sleep(60)
-
-
-async def cleanup_old_files():
-    """Eski fayllarni o'chirish"""
-    while True:
-        try:
-            import shutil
-            from pathlib import Path
-
-            data_dir = Path("data")
-            cutoff_time = datetime.now() - timedelta(days=7)
-
-            for user_dir in data_dir.glob("chat_*"):
-                for subdir in user_dir.glob("*"):
-                    if subdir.is_dir():
-                        mtime = datetime.fromtimestamp(subdir.stat().st_mtime)
-                        if mtime < cutoff_time:
-                            shutil.rmtree(subdir, ignore_errors=True)
-                            logger.info(f"🗑️ Eski fayl o'chirildi: {subdir}")
+logger = logging.getLogger(__name__)
 
-            await asyncio.sleep(3600)  # Har 1 soat
 
-        except Exception as e:
-            logger.error(f"Cleanup xatosi: {e}")
-            await asyncio.sleep(3600)
+async def resume_broadcasts(bot: Bot):
+    """Tugallanmagan broadcastlarni davom ettirish"""
+    started = await broadcasts.start_pending(bot)
+    if started:
+        logger.info(f"📢 {started} ta broadcast davom ettirildi")
 
 
 async def update_statistics():
-    """Har kuni statistikani yangilash"""
-    while True:
-        try:
-            stats = db.get_statistics()
-
-            # Log statistika
-            logger.info(
-                f"📊 Daily stats - "
-                f"Users: {stats['total_users']}, "
-                f"Downloads: {stats['successful_downloads']}, "
-                f"Storage: {stats['total_storage_used'] / (1024*1024):.1f}MB"
-            )
-
-            await asyncio.sleep(86400)  # Har 24 soat
-
-        except Exception as e:
-            logger.error(f"Statistics update xatosi: {e}")
-            await asyncio.sleep(86400)
-
-
-async def start_background_tasks():
-    """Barcha background tasklarni ishga tushirish"""
-    tasks = [
-        broadcast_scheduler(),
-        cleanup_old_files(),
-        update_statistics(),
-    ]
-    await asyncio.gather(*tasks)
-
+    """Kunlik statistikani log qilish"""
+    stats = await adb.get_statistics()
+
+    # Log statistika
+    logger.info(
+        f"📊 Daily stats - "
+        f"Users: {stats['total_users']}, "
+        f"Downloads: {stats['successful_downloads']}, "
+        f"Storage: {stats['total_storage_used'] / (1024*1024):.1f}MB"
+    )
+    for day in await adb.get_daily_statistics(days=1):
+        logger.info(
+            f"📅 {day['date']} - "
+            f"Active: {day['active_users']}, "
+            f"Downloads: {day['successful_downloads']}/{day['total_downloads']}, "
+            f"Failed: {day['failed_downloads']}"
+        )
+
+
+def download_retention():
+    """Eski download tarixini arxivlash va bo'sh joyni qaytarish.
+
+    Scheduler threadida o'z ulanishi bilan ishlaydi: AsyncDatabase
+    executori foydalanuvchi so'rovlari uchun bo'sh qoladi.
+    """
+    archived = db.archive_downloads()
+    freed = db.incremental_vacuum()
+    logger.info(f"🗄️ Retention: {archived} arxivlandi, {freed} sahifa bo'shatildi")
+
+
+scheduler = Scheduler()
+
+
+async def start_background_tasks(bot: Bot):
+    """Ishlarni ro'yxatdan o'tkazish va schedulerni ishga tushirish"""
+    # Boshqa nusxalar bu nusxani o'lgan deb ishlarini tiklab yubormasligi uchun
+    scheduler.add_job("instance_heartbeat", adb.heartbeat, every=INSTANCE_LEASE_SECONDS / 3,
+                      timeout=10, run_at_start=True)
+    scheduler.add_job("resume_broadcasts", resume_broadcasts, bot, every=60, timeout=30,
+                      jitter=5, run_at_start=True)
+    # Indeks bo'yicha tozalash: kataloglar qayta skanerlanmaydi
+    scheduler.add_job("disk_cache", disk_cache.maintain, every=60, timeout=600,
+                      jitter=5, blocking=True)
+    scheduler.add_job("update_statistics", update_statistics, cron="5 0 * * *", timeout=60)
+    # Kam trafik vaqtida; partiyalar yozish lockini qisqa ushlaydi
+    scheduler.add_job("download_retention", download_retention, cron="30 3 * * *",
+                      timeout=1800, jitter=300, blocking=True)
+    await scheduler.start()
+
+
+async def stop_background_tasks():
+    """Ishlarni to'xtatish (ulanishlar yopilishidan oldin)"""
+    await scheduler.stop()
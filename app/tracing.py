@@ -0,0 +1,242 @@
+"""
+Har ish uchun tracing: ichma-ich spanlar va JSONL eksport.
+
+Har qator - bitta tugagan trace, Chrome trace-event formatida
+({"traceEvents": [...]}): qatorni alohida faylga saqlab chrome://tracing
+yoki ui.perfetto.dev da ochish mumkin.
+"""
+from __future__ import annotations
+import asyncio
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Bo'sh bo'lsa tracing o'chirilgan
+TRACE_FILE = os.getenv("TRACE_FILE", str(DATA_DIR / "traces" / "traces.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+# Faqat shundan uzun trace lar yoziladi (0 - hammasi)
+TRACE_MIN_SECONDS = float(os.getenv("TRACE_MIN_SECONDS", "0"))
+
+
+@dataclass
+class Span:
+    """Trace ichidagi bitta o'lchangan oraliq (perf_counter soniyalari)"""
+
+    name: str
+    trace: "Trace"
+    start: float
+    end: Optional[float] = None
+    # Bir task dagi spanlar doim ichma-ich: viewer da task - alohida qator
+    lane: int = 0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Trace:
+    """Bitta ish (masalan, yuklab olish) spanlari"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        # task -> qator raqami va nomi
+        self._lanes: Dict[int, int] = {}
+        self.lane_names: Dict[int, str] = {}
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            return 0
+        lane = self._lanes.get(id(task))
+        if lane is None:
+            lane = self._lanes[id(task)] = len(self._lanes) + 1
+            self.lane_names[lane] = task.get_name()
+        return lane
+
+    def add(self, name: str, start: float, end: Optional[float] = None, **attrs) -> Span:
+        span = Span(name, self, start, end, self._lane(), attrs)
+        self.spans.append(span)
+        return span
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    @property
+    def duration(self) -> float:
+        root = self.root
+        return (root.end or time.perf_counter()) - root.start
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Chrome trace-event formati: X hodisalar, vaqt mikrosoniyada"""
+        def micros(moment: float) -> int:
+            return int((self.started_at + moment - self.started) * 1_000_000)
+
+        finished = self.root.end or time.perf_counter()
+        events: List[Dict[str, Any]] = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": lane,
+             "args": {"name": task_name}}
+            for lane, task_name in self.lane_names.items()
+        ]
+        for span in self.spans:
+            args = dict(span.attrs)
+            if span.end is None:
+                # Trace tugaganda hali ochiq (masalan, bekor qilingan fon ishi)
+                args["unfinished"] = True
+            start = micros(span.start)
+            events.append({
+                "name": span.name, "cat": self.name, "ph": "X", "pid": 1, "tid": span.lane,
+                "ts": start, "dur": max(micros(span.end or finished) - start, 0), "args": args,
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.trace_id, "name": self.name,
+                          "duration": round(self.duration, 6), **self.root.attrs},
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    """Joriy trace ID (trace tashqarisida None)"""
+    current = _current.get()
+    return current.trace.trace_id if current else None
+
+
+def annotate(**attrs):
+    """Joriy trace ning asosiy spaniga atributlar qo'shish (platforma, natija...)"""
+    current = _current.get()
+    if current:
+        current.trace.root.set(**attrs)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[Span]]:
+    """Ichki span: with span("db.get_user"): ... (trace tashqarisida hech narsa qilmaydi)"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    current = parent.trace.add(name, time.perf_counter(), **attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current.reset(token)
+
+
+def record_span(name: str, start: float, end: float, **attrs):
+    """Boshqa joyda o'lchangan oraliqni qo'shish (masalan, ishchi jarayondagi bosqich)"""
+    current = _current.get()
+    if current is not None and end > start:
+        current.trace.add(name, start, end, **attrs)
+
+
+def traced(name: str) -> Callable:
+    """Async funksiyani span ichida bajarish"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Tracer:
+    """Trace larni ochish va tugaganlarini fayl ga yozish.
+
+    Yozish alohida oqimda (QueueListener): event loop disk kutmaydi.
+    Fayl TRACE_MAX_BYTES dan oshsa aylantiriladi (traces.jsonl.1, ...).
+    """
+
+    def __init__(self, path: Optional[Path], max_bytes: int = TRACE_MAX_BYTES,
+                 backups: int = TRACE_BACKUPS, min_seconds: float = TRACE_MIN_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.min_seconds = min_seconds
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self):
+        """Yozuvchi oqimni ishga tushirish"""
+        if not self.path or self._listener:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backups,
+            encoding="utf-8", delay=True,
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+        logger.info(f"🧭 Tracing: {self.path}")
+
+    def stop(self):
+        """Navbatdagi trace larni yozib, faylni yopish"""
+        if not self._listener:
+            return
+        listener, self._listener = self._listener, None
+        self._queue = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+    @contextmanager
+    def trace(self, name: str, **attrs) -> Iterator[Span]:
+        """Yangi trace: ichidagi span() lar shu trace ga yoziladi"""
+        root = Trace(name).add(name, time.perf_counter(), **attrs)
+        token = _current.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.set(error=type(e).__name__)
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _current.reset(token)
+            self.export(root.trace)
+
+    def export(self, trace: Trace):
+        """Tugagan trace ni yozish navbatiga qo'yish"""
+        if self._queue is None or trace.duration < self.min_seconds:
+            return
+        try:
+            line = json.dumps(trace.to_chrome(), ensure_ascii=False, default=str)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Trace {trace.trace_id} yozilmadi: {e}")
+            return
+        self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+
+
+tracer = Tracer(Path(TRACE_FILE) if TRACE_FILE else None)
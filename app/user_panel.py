@@ -8,7 +8,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from app.database import db
+from app.database import adb, writes
 
 logger_router = Router()
 
@@ -20,19 +20,19 @@ class UserState(StatesGroup):
 @logger_router.message(Command("profile"))
 async def show_profile(msg: Message):
     """Foydalanuvchi profili"""
-    user = db.get_user(msg.from_user.id)
+    user = await adb.get_user(msg.from_user.id)
 
     if not user:
         # Yangi foydalanuvchi qo'shish
-        db.add_user(
+        await adb.add_user(
             msg.from_user.id,
             username=msg.from_user.username or "No username",
             first_name=msg.from_user.first_name or "",
             last_name=msg.from_user.last_name or "",
         )
-        user = db.get_user(msg.from_user.id)
+        user = await adb.get_user(msg.from_user.id)
 
-    downloads = db.get_user_downloads(msg.from_user.id, limit=5)
+    downloads = await adb.get_user_downloads(msg.from_user.id, limit=5)
 
     storage_mb = user['storage_used'] / (1024 * 1024)
 
@@ -61,20 +61,22 @@ async def show_profile(msg: Message):
     ])
 
     await msg.answer(text, reply_markup=keyboard)
-    db.update_user_activity(msg.from_user.id)
+    writes.update_user_activity(msg.from_user.id)
 
 
 @logger_router.callback_query(F.data == "user_notifications")
 async def show_notifications(callback: CallbackQuery):
     """Bildirishnomalarni ko'rish"""
-    notifications = db.get_unread_notifications(callback.from_user.id)
+    notifications = await adb.get_unread_notifications(callback.from_user.id, limit=10)
 
     if not notifications:
         text = "✅ Yangi bildirishnomalar yo'q"
     else:
         text = "<b>📬 Sizning Bildirishnomalaringiz</b>\n\n"
-        for notif in notifications[:10]:
+        for notif in notifications:
             text += f"• {notif['message']}\n   {notif['created_at']}\n\n"
+        # Ko'rsatilganlar bitta so'rovda o'qilgan deb belgilanadi
+        await adb.mark_notifications_read(callback.from_user.id, [n['id'] for n in notifications])
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔙 Orqaga", callback_data="user_back")],
@@ -87,7 +89,7 @@ async def show_notifications(callback: CallbackQuery):
 @logger_router.callback_query(F.data == "user_history")
 async def show_history(callback: CallbackQuery):
     """Download tarixini ko'rish"""
-    downloads = db.get_user_downloads(callback.from_user.id, limit=20)
+    downloads = await adb.get_user_downloads(callback.from_user.id, limit=20)
 
     if not downloads:
         text = "📜 Hali hech qanday yuklab olish yo'q"
@@ -134,13 +136,13 @@ async def show_support(callback: CallbackQuery):
 @logger_router.callback_query(F.data == "user_back")
 async def user_back(callback: CallbackQuery):
     """Profillga qaytish"""
-    user = db.get_user(callback.from_user.id)
+    user = await adb.get_user(callback.from_user.id)
 
     if not user:
         await callback.answer("❌ Profil topilmadi", show_alert=True)
         return
 
-    downloads = db.get_user_downloads(callback.from_user.id, limit=5)
+    downloads = await adb.get_user_downloads(callback.from_user.id, limit=5)
     storage_mb = user['storage_used'] / (1024 * 1024)
 
     text = (
@@ -166,7 +168,7 @@ async def user_back(callback: CallbackQuery):
 @logger_router.message(Command("mydownloads"))
 async def show_my_downloads(msg: Message):
     """O'zimning yuklab olishlari"""
-    downloads = db.get_user_downloads(msg.from_user.id, limit=50)
+    downloads = await adb.get_user_downloads(msg.from_user.id, limit=50)
 
     if not downloads:
         await msg.answer("📜 Hali hech qanday yuklab olish yo'q")
@@ -190,13 +192,13 @@ async def show_my_downloads(msg: Message):
 @logger_router.message(Command("stats"))
 async def show_user_stats(msg: Message):
     """Foydalanuvchi statistikasi"""
-    user = db.get_user(msg.from_user.id)
+    user = await adb.get_user(msg.from_user.id)
 
     if not user:
-        db.add_user(msg.from_user.id)
-        user = db.get_user(msg.from_user.id)
+        await adb.add_user(msg.from_user.id)
+        user = await adb.get_user(msg.from_user.id)
 
-    downloads = db.get_user_downloads(msg.from_user.id, limit=100)
+    downloads = await adb.get_user_downloads(msg.from_user.id, limit=100)
 
     completed = len([d for d in downloads if d['status'] == 'completed'])
     failed = len([d for d in downloads if d['status'] == 'failed'])
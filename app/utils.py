@@ -1,15 +1,31 @@
 from __future__ import annotations
 import asyncio
-import os
-import shutil
-import uuid
+import logging
+import time
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Optional, Set
 
 from yt_dlp import YoutubeDL
 
-DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+from app.config import (
+    AUDIO_BITRATE, AUDIO_FORCE_MP3, DISK_JOB_RESERVE_BYTES, DOWNLOAD_TIMEOUT, DOWNLOAD_WORKERS,
+    MAX_UPLOAD_BYTES,
+)
+from app.diskcache import DiskFullError, disk_cache
+from app.formats import (
+    GIF_MAX_DURATION, GIF_MAX_HEIGHT, IMAGE_FALLBACK_FORMAT,
+    DownloadPlan, FileTooLargeError, plan_download, select_format,
+)
+from app.metrics import QUEUE_DEPTH, WORKERS_ACTIVE, StageTimer
+from app.tracing import record_span, traced
+from app.workers import WorkerPool, WorkerTimeout
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp ishlari event loop ni bloklamasligi uchun alohida jarayonlarda
+download_pool = WorkerPool(DOWNLOAD_WORKERS)
+QUEUE_DEPTH.set_function(lambda: download_pool.waiting)
+WORKERS_ACTIVE.set_function(lambda: download_pool.active)
 
 
 class DownloadError(Exception):
@@ -35,68 +51,287 @@ def _ydl(opts: dict) -> YoutubeDL:
     return YoutubeDL(base)
 
 
-def ensure_chat_dir(chat_id: int) -> Path:
-    d = DATA_DIR / f"chat_{chat_id}"
-    d.mkdir(parents=True, exist_ok=True)
-    return d
+def cleanup_dir(path: Path) -> None:
+    """Ish katalogini o'chirish va disk kesh indeksidan chiqarish"""
+    disk_cache.release(path)
 
 
-def cleanup_dir(path: Path) -> None:
-    if path.exists():
-        shutil.rmtree(path, ignore_errors=True)
+def _extract_job(url: str, opts: dict, plan: Optional[DownloadPlan] = None,
+                 max_bytes: int = 0) -> dict:
+    """Ishchi jarayonda: pre-flight extraction, format tanlash, download.
+
+    Sahifa faqat bir marta extract qilinadi: tanlangan format bilan
+    o'sha info qayta ishlanib yuklanadi.
+    """
+    started = time.perf_counter()
+    with _ydl(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    extract_seconds = time.perf_counter() - started
+
+    selected = None
+    if plan is not None and info.get("_type", "video") == "video":
+        selected = select_format(info, plan, max_bytes)
+        if selected:
+            opts = {**opts, "format": selected.format_id}
+
+    with _ydl(opts) as ydl:
+        info = ydl.process_ie_result(info, download=True)
+    return {
+        "title": info.get("title") or "Video",
+        "vcodec": info.get("vcodec") or "",
+        "format_id": selected.format_id if selected else info.get("format_id"),
+        "extract_started": started,
+        "extract_seconds": extract_seconds,
+    }
 
 
-async def download_video_and_audio(url: str, chat_id: int) -> Tuple[Path, Path, str]:
+class DownloadResult:
+    """Yuklab olish natijasi: media turi -> fayl.
+
+    pending - hali tayyorlanayotgan fayllar (masalan, audio ajratish);
+    ular tayyor fayllarni yuklash bilan parallel bajariladi.
     """
-    Returns: (video_path, audio_path, title)
-    Raises: DownloadError
+
+    def __init__(self, workdir: Path, title: str, files: Dict[str, Path],
+                 pending: Optional[Dict[str, asyncio.Future]] = None,
+                 timer: Optional[StageTimer] = None):
+        self.workdir = workdir
+        self.title = title
+        self.files = files
+        self.pending = pending or {}
+        self.timer = timer or StageTimer()
+
+    @property
+    def media_types(self) -> Set[str]:
+        return set(self.files) | set(self.pending)
+
+    def get(self, media_type: str) -> Optional[Path]:
+        path = self.files.get(media_type)
+        return path if path and path.exists() else None
+
+    async def wait(self, media_type: str) -> Optional[Path]:
+        """Fayl tayyor bo'lishini kutish (tayyor bo'lsa darhol)"""
+        task = self.pending.get(media_type)
+        if task is not None:
+            self.files[media_type] = await asyncio.shield(task)
+        return self.get(media_type)
+
+    def close(self) -> None:
+        """Tugallanmagan bosqichlarni to'xtatib, ishchi katalogni o'chirish"""
+        for task in self.pending.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # "never retrieved" ogohlantirishi bo'lmasin
+        cleanup_dir(self.workdir)
+
+
+async def run_ffmpeg(*args: str, timeout: float = DOWNLOAD_TIMEOUT) -> int:
+    """ffmpeg ni ishga tushirish; timeout yoki bekor qilinganda o'ldiriladi"""
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        return await asyncio.wait_for(proc.wait(), timeout)
+    except asyncio.TimeoutError:
+        raise DownloadError(f"ffmpeg timed out after {timeout}s")
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+async def _run_ydl(url: str, opts: dict, plan: Optional[DownloadPlan] = None) -> dict:
+    """yt-dlp ni ishchi jarayonlar pulida bajarish"""
+    try:
+        return await download_pool.run(
+            _extract_job, url, opts, plan, MAX_UPLOAD_BYTES, timeout=DOWNLOAD_TIMEOUT
+        )
+    except WorkerTimeout:
+        raise DownloadError(f"Yuklab olish {DOWNLOAD_TIMEOUT} soniyadan oshdi")
+
+
+def _find_output(workdir: Path, stem: str) -> Optional[Path]:
+    """yt-dlp yaratgan faylni topish (vaqtinchalik fayllarsiz)"""
+    for path in sorted(workdir.glob(f"{stem}.*")):
+        if path.suffix not in {".part", ".ytdl", ".temp"}:
+            return path
+    return None
+
+
+# Qayta kodlashsiz (stream copy) saqlanadigan audio kodeklar -> konteyner
+AUDIO_COPY_CONTAINERS = {
+    "aac": "m4a",
+    "mp3": "mp3",
+    "opus": "ogg",
+    "vorbis": "ogg",
+}
+
+
+async def probe_audio_codec(path: Path, timeout: float = 30) -> Optional[str]:
+    """ffprobe bilan birinchi audio oqim kodekini aniqlash"""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name", "-of", "default=nw=1:nk=1", str(path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    codec = stdout.decode(errors="ignore").strip().lower()
+    return codec or None
+
+
+async def extract_audio(source: Path, workdir: Path) -> Path:
+    """Yuklangan fayldan audio ajratish.
+
+    Telegram o'ynata oladigan kodeklar remux qilinadi; MP3 ga qayta
+    kodlash faqat AUDIO_FORCE_MP3 yoki noma'lum kodek bo'lganda.
     """
-    workdir = ensure_chat_dir(chat_id) / uuid.uuid4().hex
-    workdir.mkdir(parents=True, exist_ok=True)
+    codec = None if AUDIO_FORCE_MP3 else await probe_audio_codec(source)
+    container = AUDIO_COPY_CONTAINERS.get(codec)
+
+    if container:
+        audio_path = workdir / f"audio.{container}"
+        extra = ["-movflags", "+faststart"] if container == "m4a" else []
+        returncode = await run_ffmpeg(
+            "-i", str(source), "-vn", "-acodec", "copy", *extra, str(audio_path)
+        )
+        if returncode == 0 and audio_path.exists():
+            return audio_path
+        logger.warning(f"Audio remux failed ({codec}), falling back to MP3")
 
-    video_path = workdir / "video.mp4"
     audio_path = workdir / "audio.mp3"
+    returncode = await run_ffmpeg(
+        "-i", str(source), "-vn", "-acodec", "libmp3lame", "-b:a", AUDIO_BITRATE, str(audio_path)
+    )
+    if returncode != 0 or not audio_path.exists():
+        raise DownloadError("ffmpeg failed to extract audio.")
+    return audio_path
 
-    # 1) Fetch best MP4 video (merge if needed)
-    ydl_video_opts = {
-        "outtmpl": str(video_path.with_suffix(".%(ext)s")),
-        # Prefer mp4 output; fallback to best
-        "format": "bv*+ba/b[ext=mp4]/b",
-        "merge_output_format": "mp4",
-    }
 
-    title = ""
+async def make_animation(source: Path, workdir: Path, vcodec: str) -> Path:
+    """Ovozsiz, qisqa MP4 animatsiya (Telegram GIF sifatida ko'rsatadi)"""
+    animation_path = workdir / "animation.mp4"
+    if vcodec.startswith(("avc1", "h264")):
+        # H.264 bo'lsa faqat remux - qayta kodlash shart emas
+        codec_args = ["-c:v", "copy"]
+    else:
+        codec_args = [
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-vf", f"scale=-2:'min({GIF_MAX_HEIGHT},ih)'",
+        ]
+    returncode = await run_ffmpeg(
+        "-i", str(source), "-an", "-t", str(GIF_MAX_DURATION), *codec_args,
+        "-movflags", "+faststart", str(animation_path)
+    )
+    if returncode != 0 or not animation_path.exists():
+        raise DownloadError("ffmpeg failed to create animation.")
+    return animation_path
+
+
+async def make_image(url: str, workdir: Path) -> Path:
+    """Thumbnail dan rasm; thumbnail bo'lmasa past sifatli oqimdan kadr"""
+    image_path = workdir / "image.jpg"
+    thumbnail = _find_output(workdir, "media")
+
+    if thumbnail is None:
+        await _run_ydl(url, {
+            "outtmpl": str(workdir / "frame.%(ext)s"),
+            "format": IMAGE_FALLBACK_FORMAT,
+        })
+        source = _find_output(workdir, "frame")
+        if source is None:
+            raise DownloadError("Could not locate downloaded image.")
+        returncode = await run_ffmpeg("-ss", "1", "-i", str(source), "-frames:v", "1", str(image_path))
+        if returncode != 0 or not image_path.exists():
+            returncode = await run_ffmpeg("-i", str(source), "-frames:v", "1", str(image_path))
+    elif thumbnail.suffix.lower() in {".jpg", ".jpeg"}:
+        thumbnail.rename(image_path)
+        returncode = 0
+    else:
+        returncode = await run_ffmpeg("-i", str(thumbnail), str(image_path))
+
+    if returncode != 0 or not image_path.exists():
+        raise DownloadError("Could not create image.")
+    return image_path
+
+
+@traced("download_video_and_audio")
+async def download_video_and_audio(url: str, chat_id: int,
+                                   format_type: str = "both") -> DownloadResult:
+    """
+    Format turiga mos rejani bajaradi (faqat kerakli oqimlar yuklanadi).
+    Asosiy fayl tayyor bo'lishi bilan qaytadi; unga bog'liq bo'lmagan
+    bosqichlar (video + audio da audio ajratish) fonda davom etadi.
+    Returns: DownloadResult
+    Raises: DownloadError
+    """
+    plan = plan_download(format_type)
+    timer = StageTimer()
     try:
-        with _ydl(ydl_video_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get("title") or "Video"
-
-        # If yt-dlp chose non-mp4, move/rename to video.mp4 if possible
-        # (yt-dlp respects merge_output_format=mp4)
-        if not video_path.exists():
-            # Find produced file (wildcard)
-            produced = list(workdir.glob("video.*"))
-            if produced:
-                produced[0].rename(video_path)
-
-        if not video_path.exists():
-            raise DownloadError("Could not locate downloaded video file.")
-
-        # 2) Extract audio from the downloaded video using ffmpeg
-        # Avoid re-downloading from source
-        proc = await asyncio.create_subprocess_exec(
-            "ffmpeg", "-y", "-i", str(video_path), "-vn", "-acodec", "libmp3lame", "-b:a", "192k", str(audio_path),
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        await proc.wait()
-        if proc.returncode != 0 or not audio_path.exists():
-            raise DownloadError("ffmpeg failed to extract audio.")
+        # Joy yetmasa eski kataloglar tozalanadi; baribir yetmasa ish boshlanmaydi
+        workdir = await disk_cache.admit(DISK_JOB_RESERVE_BYTES)
+    except DiskFullError as e:
+        logger.error(f"💾 Chat {chat_id}: {e}")
+        raise DownloadError("Serverda vaqtincha joy yetarli emas, keyinroq urinib ko'ring")
+
+    try:
+        queued = time.perf_counter()
+        with timer.stage("download"):
+            info = await _run_ydl(url, plan.ydl_options(str(workdir / "media.%(ext)s")), plan)
+        # Ishchi jarayonda o'lchangan sahifa extract qilish vaqti alohida bosqich
+        timer.split("download", "extract", info.get("extract_seconds", 0.0))
+        # perf_counter (CLOCK_MONOTONIC) jarayonlar orasida umumiy: bo'sh ishchi
+        # kutish va extract ni download spani ichida ko'rsatish mumkin
+        extract_started = info.get("extract_started", queued)
+        record_span("worker_wait", queued, extract_started)
+        record_span("extract", extract_started, extract_started + info.get("extract_seconds", 0.0))
+        title = info["title"]
+        files: Dict[str, Path] = {}
+        pending: Dict[str, asyncio.Future] = {}
 
-        return video_path, audio_path, title
+        if "photo" in plan.outputs:
+            with timer.stage("image"):
+                files["photo"] = await make_image(url, workdir)
+        else:
+            source = _find_output(workdir, "media")
+            if source is None:
+                raise DownloadError("Could not locate downloaded file.")
 
+            if "video" in plan.outputs:
+                video_path = workdir / "video.mp4"
+                source.rename(video_path)
+                files["video"] = source = video_path
+
+            if "animation" in plan.outputs:
+                with timer.stage("animation"):
+                    files["animation"] = await make_animation(source, workdir, info["vcodec"])
+
+            # Avoid re-downloading from source
+            if "audio" in plan.outputs:
+                extraction = timer.track("extract_audio", extract_audio(source, workdir))
+                if files:
+                    # Video yuklanayotganda audio parallel ajratiladi
+                    pending["audio"] = asyncio.ensure_future(extraction)
+                else:
+                    files["audio"] = await extraction
+
+        disk_cache.commit(workdir)
+        return DownloadResult(workdir, title, files, pending, timer)
+
+    except (asyncio.CancelledError, FileTooLargeError):
+        # Bekor qilinganda ham ishchi katalog tozalanadi
+        cleanup_dir(workdir)
+        raise
     except Exception as e:
-        # Clean the workspace but preserve parent chat dir
         cleanup_dir(workdir)
         raise DownloadError(str(e))
-
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 
 SUPPORTED_DOMAINS = {
     # TikTok
@@ -92,4 +92,75 @@ def is_supported_url(text: str) -> bool:
         host = (parsed.netloc or "").lower()
         return any(host.endswith(d) for d in SUPPORTED_DOMAINS)
     except Exception:
-        return False
\ No newline at end of file
+        return False
+
+# Kontentni o'zgartirmaydigan (tracking/share) query parametrlari
+TRACKING_PARAMS = {
+    "igsh", "igshid", "si", "feature", "is_from_webapp", "sender_device",
+    "sender_web_id", "share_app_id", "share_link_id", "_r", "_t", "ref",
+    "ref_src", "s", "fbclid", "mibextid", "rdid", "utm_source", "utm_medium",
+    "utm_campaign", "utm_term", "utm_content",
+}
+
+
+def normalize_url(text: str) -> str:
+    """URL ni kesh kaliti uchun kanonik ko'rinishga keltirish"""
+    parsed = urlparse(text.strip())
+    host = (parsed.hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+
+    path = parsed.path.rstrip("/") or "/"
+    query = [
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=False)
+        if k.lower() not in TRACKING_PARAMS
+    ]
+
+    # youtu.be/<id> -> youtube.com/watch?v=<id>
+    if host == "youtu.be" and path != "/":
+        query.insert(0, ("v", path.lstrip("/")))
+        host, path = "youtube.com", "/watch"
+
+    return urlunparse(("https", host, path, "", urlencode(sorted(query)), ""))
+
+
+# Metrika label lari uchun: asosiy domen -> platforma
+PLATFORMS = {
+    "tiktok.com": "tiktok",
+    "instagram.com": "instagram",
+    "youtube.com": "youtube",
+    "youtu.be": "youtube",
+    "facebook.com": "facebook",
+    "fb.watch": "facebook",
+    "twitter.com": "twitter",
+    "x.com": "twitter",
+    "twitch.tv": "twitch",
+    "pinterest.com": "pinterest",
+    "pin.it": "pinterest",
+    "reddit.com": "reddit",
+    "snap.com": "snapchat",
+    "snapchat.com": "snapchat",
+    "dailymotion.com": "dailymotion",
+    "dai.ly": "dailymotion",
+    "vimeo.com": "vimeo",
+    "bsky.app": "bluesky",
+    "linkedin.com": "linkedin",
+    "t.me": "telegram",
+    "telegram.me": "telegram",
+    "soundcloud.com": "soundcloud",
+    "spotify.com": "spotify",
+}
+
+
+def platform_of(text: str) -> str:
+    """URL qaysi platformaga tegishli (noma'lum bo'lsa "other")"""
+    host = (urlparse(text.strip()).hostname or "").lower()
+    parts = host.split(".")
+    # vt.tiktok.com -> tiktok.com, open.spotify.com -> spotify.com
+    for i in range(len(parts) - 1):
+        platform = PLATFORMS.get(".".join(parts[i:]))
+        if platform:
+            return platform
+    return "other"
@@ -0,0 +1,106 @@
+"""
+Webhook rejimi: Telegram update larini aiohttp server orqali qabul qilish.
+Shuningdek Prometheus uchun /metrics server.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import hmac
+import logging
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from app.config import (
+    BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS,
+    WEBAPP_HOST, WEBAPP_PORT, WEBAPP_BACKLOG,
+)
+from app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Update JSON lari kichik - katta body larni darhol rad etamiz
+MAX_UPDATE_BYTES = 1024 * 1024
+
+
+def webhook_secret() -> str:
+    """Telegram secret_token: WEBHOOK_SECRET yoki BOT_TOKEN dan hosil qilingan.
+
+    Hosil qilingan qiymat har nusxada bir xil - load balancer ortidagi
+    nusxalar bir-birining set_webhook idagi secret ini buzmaydi.
+    """
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hmac.new(BOT_TOKEN.encode(), b"webhook-secret-token", hashlib.sha256).hexdigest()
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """Load balancer uchun health check"""
+    return web.Response(text="ok")
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Prometheus text exposition formatidagi metrikalar"""
+    return web.Response(
+        body=REGISTRY.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """/metrics serverini alohida portda ishga tushirish (port 0 - o'chirilgan)"""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", handle_health)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📊 Metrics server: {host}:{port}/metrics")
+    return runner
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, secret_token: str) -> web.Application:
+    """Webhook aiohttp ilovasi"""
+    app = web.Application(client_max_size=MAX_UPDATE_BYTES)
+    # handle_in_background: handler fonda ishlaydi, Telegram ga darhol 200 qaytadi,
+    # shuning uchun uzoq yuklab olishlar update qayta yuborilishiga olib kelmaydi
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", handle_health)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: List[str]) -> None:
+    """Webhook o'rnatib, aiohttp serverni ishga tushirish (to'xtatilguncha)"""
+    if not WEBHOOK_URL:
+        raise SystemExit("❌ BOT_MODE=webhook uchun WEBHOOK_URL .env da bo'lishi kerak")
+
+    secret_token = webhook_secret()
+    app = build_webhook_app(dp, bot, secret_token)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT, backlog=WEBAPP_BACKLOG)
+    await site.start()
+    logger.info(f"🌐 Webhook server: {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=secret_token,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=allowed_updates,
+    )
+    logger.info(f"✅ Webhook o'rnatildi: {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
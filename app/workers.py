@@ -0,0 +1,138 @@
+"""
+Og'ir (bloklovchi) ishlarni alohida jarayonlarda bajarish
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# fork ko'p oqimli jarayonda xavfli (bola boshqa oqim ushlab turgan lock da
+# qotib qolishi mumkin). forkserver toza server jarayonidan fork qiladi;
+# Windows/macOS ning ba'zilarida faqat spawn bor
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+class WorkerTimeout(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def _worker_main(conn, func: Callable, args: tuple, kwargs: dict) -> None:
+    """Ishchi jarayon ichida funksiyani bajarish va natijani qaytarish"""
+    # Yangi sessiya: bekor qilinganda ffmpeg kabi bolalar ham o'ldiriladi
+    if hasattr(os, "setsid"):
+        os.setsid()
+    try:
+        result = (True, func(*args, **kwargs))
+    except BaseException as e:
+        try:
+            pickle.dumps(e)
+            result = (False, e)
+        except Exception:
+            result = (False, RuntimeError(f"{type(e).__name__}: {e}"))
+    try:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+class WorkerPool:
+    """Cheklangan o'lchamli jarayonlar puli (har ish uchun alohida jarayon).
+
+    Ishlar (func) pickle qilinadigan modul darajasidagi funksiyalar bo'lishi kerak.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+
+    def start(self) -> None:
+        """Semaforni joriy loop da yaratish va forkserver ni oldindan ishga tushirish.
+
+        Iloji boricha boshqa oqimlar paydo bo'lishidan oldin chaqiriladi.
+        """
+        if self._semaphore is not None:
+            return
+        self._semaphore = asyncio.Semaphore(self.size)
+        if _MP_CONTEXT.get_start_method() == "forkserver":
+            from multiprocessing import forkserver
+            forkserver.ensure_running()
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """func(*args) ni ishchi jarayonda bajarish.
+
+        Timeout yoki bekor qilinganda jarayon (va uning bolalari) o'ldiriladi.
+        """
+        self.start()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            return await self._run_process(func, args, kwargs, timeout)
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    async def _run_process(self, func: Callable, args: tuple, kwargs: dict,
+                           timeout: Optional[float]) -> Any:
+        loop = asyncio.get_running_loop()
+        reader, writer = _MP_CONTEXT.Pipe(duplex=False)
+        proc = _MP_CONTEXT.Process(
+            target=_worker_main, args=(writer, func, args, kwargs), daemon=True
+        )
+        proc.start()
+        writer.close()
+
+        ready = loop.create_future()
+        loop.add_reader(reader.fileno(), lambda: ready.done() or ready.set_result(None))
+        finished = False
+        try:
+            try:
+                await asyncio.wait_for(ready, timeout)
+            except asyncio.TimeoutError:
+                raise WorkerTimeout(f"Worker timed out after {timeout}s")
+
+            try:
+                ok, value = reader.recv()
+            except EOFError:
+                raise WorkerCrashed(f"Worker exited with code {proc.exitcode}")
+            finished = True
+            if not ok:
+                raise value
+            return value
+        finally:
+            loop.remove_reader(reader.fileno())
+            reader.close()
+            await self._reap(proc, graceful=finished)
+
+    @staticmethod
+    async def _reap(proc, graceful: bool) -> None:
+        """Jarayonni tugatish; ish tugamagan bo'lsa majburan o'ldirish"""
+        loop = asyncio.get_running_loop()
+        if graceful:
+            await loop.run_in_executor(None, proc.join, 5)
+        if proc.is_alive():
+            logger.warning(f"🔪 Worker {proc.pid} o'ldirilmoqda")
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (AttributeError, ProcessLookupError):
+                # Windows yoki setsid hali bajarilmagan
+                proc.kill()
+            await loop.run_in_executor(None, proc.join, 5)
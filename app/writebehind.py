@@ -0,0 +1,154 @@
+"""
+Kichik yozuvlarni xotirada yig'ib, bitta tranzaksiyada yozish (write-behind)
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+from app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_INTERVAL_MS", "500"))
+WRITE_BEHIND_MAX_RECORDS = int(os.getenv("WRITE_BEHIND_MAX_RECORDS", "200"))
+# Shuncha flush da yozilmagan qator tashlab yuboriladi
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+
+WRITES_DROPPED = REGISTRY.counter(
+    "bot_write_behind_dropped_total", "Qayta urinishlardan keyin ham yozilmagan qatorlar", ("kind",))
+
+
+def _now() -> str:
+    """SQLite CURRENT_TIMESTAMP bilan bir xil formatdagi UTC vaqt"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WriteBehindBuffer:
+    """Download log va faoliyat yozuvlari uchun write-behind bufer.
+
+    Yozuvlar xotirada yig'iladi va har `interval` ms da yoki `max_records`
+    ta yig'ilganda AsyncDatabase orqali bitta tranzaksiyada yoziladi.
+    Download id lari backend hisoblagichidan (nusxaga band qilingan oraliqdan)
+    ajratiladi, shuning uchun log_download darhol id qaytaradi.
+    """
+
+    def __init__(self, adb, interval_ms: int = WRITE_BEHIND_INTERVAL_MS,
+                 max_records: int = WRITE_BEHIND_MAX_RECORDS,
+                 max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS):
+        self.adb = adb
+        self.interval = interval_ms / 1000
+        self.max_records = max_records
+        self.max_attempts = max_attempts
+        # Yozilmay qaytgan qator -> urinishlar soni
+        self._attempts: Dict[Tuple, int] = {}
+        self._inserts: List[Tuple] = []
+        self._updates: List[Tuple] = []
+        # user_id -> oxirgi faoliyat vaqti (har flush da bitta qator)
+        self._activity: Dict[int, str] = {}
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._inserts) + len(self._updates) + len(self._activity)
+
+    async def start(self):
+        """Fon flush siklini boshlash"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Siklni to'xtatib, qolgan yozuvlarni yozish"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def log_download(self, user_id: int, url: str, format_type: str,
+                     title: str = "", file_size: int = 0, status: str = "pending") -> int:
+        """Download logni navbatga qo'yish; ajratilgan id qaytariladi"""
+        # Id backend hisoblagichidan: to'g'ridan-to'g'ri log_download bilan to'qnashmaydi
+        download_id = self.adb.database.allocate_download_id(user_id)
+        self._inserts.append((download_id, user_id, url, format_type, title, file_size, status, _now()))
+        self._added()
+        return download_id
+
+    def complete_download(self, download_id: int, file_size: int = 0, cache_hit: bool = False):
+        """Download tugallanganini navbatga qo'yish"""
+        self._updates.append(("completed", download_id, file_size, bool(cache_hit), None, _now()))
+        self._added()
+
+    def fail_download(self, download_id: int, error_message: str = ""):
+        """Download xatosini navbatga qo'yish"""
+        self._updates.append(("failed", download_id, 0, False, error_message, _now()))
+        self._added()
+
+    def update_user_activity(self, user_id: int):
+        """Faoliyatni yangilash (bir flush ichida foydalanuvchiga bitta qator)"""
+        self._activity[user_id] = _now()
+        self._added()
+
+    def _added(self):
+        if len(self) >= self.max_records:
+            self._wakeup.set()
+
+    async def flush(self) -> bool:
+        """Yig'ilgan yozuvlarni bitta tranzaksiyada yozish.
+
+        Yozilmagan qatorlar keyingi flush da qayta yoziladi; max_attempts
+        marta yozilmagan qator log va metrika bilan tashlab yuboriladi.
+        """
+        async with self._lock:
+            if not len(self):
+                return True
+            inserts, self._inserts = self._inserts, []
+            updates, self._updates = self._updates, []
+            activity, self._activity = self._activity, {}
+
+            batch = (inserts, updates, list(activity.items()))
+            failed = await self.adb.apply_write_batch(*batch)
+            if self._attempts:
+                left = set(chain.from_iterable(failed))
+                for row in chain.from_iterable(batch):
+                    if row not in left:
+                        self._attempts.pop(row, None)
+            if not any(failed):
+                return True
+
+            retry: Tuple[List, List, List] = ([], [], [])
+            for kind, rows, pending in zip(("insert", "update", "activity"), failed, retry):
+                for row in rows:
+                    attempts = self._attempts.get(row, 0) + 1
+                    if attempts < self.max_attempts:
+                        self._attempts[row] = attempts
+                        pending.append(row)
+                        continue
+                    self._attempts.pop(row, None)
+                    WRITES_DROPPED.inc(kind=kind)
+                    logger.error(f"🗑️ Write-behind {kind} {attempts} urinishda yozilmadi, tashlandi: {row}")
+
+            # Keyingi flush da qayta urinish (tartib saqlanadi)
+            self._inserts[:0] = retry[0]
+            self._updates[:0] = retry[1]
+            for user_id, ts in retry[2]:
+                self._activity.setdefault(user_id, ts)
+            return False
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush xatosi: {e}")
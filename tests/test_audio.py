@@ -0,0 +1,136 @@
+"""
+Audio ajratish testlari: asl kodekda remux yoki MP3 ga qayta kodlash
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app import utils
+from app.utils import DownloadError, extract_audio, probe_audio_codec
+
+
+class FakeFfmpeg:
+    """run_ffmpeg o'rnida: argumentlarni yozadi va chiqish faylini yaratadi"""
+
+    def __init__(self, *returncodes):
+        self.returncodes = list(returncodes)
+        self.calls = []
+
+    async def __call__(self, *args, timeout=None):
+        self.calls.append(args)
+        returncode = self.returncodes.pop(0) if self.returncodes else 0
+        if returncode == 0:
+            Path(args[-1]).write_bytes(b"audio")
+        return returncode
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    fake = FakeFfmpeg()
+    monkeypatch.setattr(utils, "run_ffmpeg", fake)
+    monkeypatch.setattr(utils, "AUDIO_FORCE_MP3", False)
+    return fake
+
+
+def probe_returns(monkeypatch, codec):
+    probed = []
+
+    async def probe(path, timeout=30):
+        probed.append(path)
+        return codec
+
+    monkeypatch.setattr(utils, "probe_audio_codec", probe)
+    return probed
+
+
+def extract(tmp_path):
+    source = tmp_path / "media.mp4"
+    source.write_bytes(b"video")
+    return asyncio.run(extract_audio(source, tmp_path))
+
+
+class TestExtractAudio:
+    """Kodek bo'yicha ffmpeg argumentlari va chiqish kengaytmasi"""
+
+    @pytest.mark.parametrize("codec, name", [
+        ("aac", "audio.m4a"),
+        ("mp3", "audio.mp3"),
+        ("opus", "audio.ogg"),
+        ("vorbis", "audio.ogg"),
+    ])
+    def test_known_codec_is_copied(self, monkeypatch, tmp_path, ffmpeg, codec, name):
+        """Telegram o'ynata oladigan kodek qayta kodlanmaydi"""
+        probe_returns(monkeypatch, codec)
+        path = extract(tmp_path)
+
+        assert path.name == name
+        [args] = ffmpeg.calls
+        assert args[args.index("-acodec") + 1] == "copy"
+        assert ("+faststart" in args) == (name == "audio.m4a")
+
+    @pytest.mark.parametrize("codec", [None, "pcm_s16le", "flac"])
+    def test_unknown_codec_is_encoded_to_mp3(self, monkeypatch, tmp_path, ffmpeg, codec):
+        """Noma'lum yoki aniqlanmagan kodek - bitta MP3 kodlash"""
+        probe_returns(monkeypatch, codec)
+        path = extract(tmp_path)
+
+        assert path.name == "audio.mp3"
+        [args] = ffmpeg.calls
+        assert args[args.index("-acodec") + 1] == "libmp3lame"
+        assert args[args.index("-b:a") + 1] == utils.AUDIO_BITRATE
+
+    def test_failed_copy_falls_back_to_mp3(self, monkeypatch, tmp_path, ffmpeg):
+        """Remux xato bersa MP3 ga qayta kodlanadi"""
+        probe_returns(monkeypatch, "aac")
+        ffmpeg.returncodes = [1, 0]
+        path = extract(tmp_path)
+
+        assert path.name == "audio.mp3"
+        assert [args[args.index("-acodec") + 1] for args in ffmpeg.calls] == ["copy", "libmp3lame"]
+
+    def test_force_mp3_skips_probe(self, monkeypatch, tmp_path, ffmpeg):
+        """AUDIO_FORCE_MP3 - ffprobe chaqirilmaydi, har doim MP3"""
+        monkeypatch.setattr(utils, "AUDIO_FORCE_MP3", True)
+        probed = probe_returns(monkeypatch, "aac")
+        path = extract(tmp_path)
+
+        assert probed == []
+        assert path.name == "audio.mp3"
+        [args] = ffmpeg.calls
+        assert args[args.index("-acodec") + 1] == "libmp3lame"
+
+    def test_failed_encode_raises(self, monkeypatch, tmp_path, ffmpeg):
+        """MP3 kodlash ham xato bersa DownloadError"""
+        probe_returns(monkeypatch, None)
+        ffmpeg.returncodes = [1]
+        with pytest.raises(DownloadError):
+            extract(tmp_path)
+
+
+class FakeProcess:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.returncode = None
+
+    async def communicate(self):
+        self.returncode = 0
+        return self.stdout, b""
+
+
+class TestProbeAudioCodec:
+    """ffprobe chiqishini o'qish"""
+
+    @pytest.mark.parametrize("stdout, codec", [(b"AAC\n", "aac"), (b"", None)])
+    def test_parses_codec_name(self, monkeypatch, tmp_path, stdout, codec):
+        """Kodek nomi kichik harfda; audio oqim yo'q bo'lsa None"""
+        calls = []
+
+        async def spawn(*args, **kwargs):
+            calls.append(args)
+            return FakeProcess(stdout)
+
+        monkeypatch.setattr(utils.asyncio, "create_subprocess_exec", spawn)
+        assert asyncio.run(probe_audio_codec(tmp_path / "media.mp4")) == codec
+        [args] = calls
+        assert args[0] == "ffprobe" and args[args.index("-select_streams") + 1] == "a:0"
@@ -0,0 +1,142 @@
+"""
+Broadcast yetkazish testlari (soxta bot bilan)
+"""
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app import broadcast
+from app.database import AsyncDatabase, Database
+from app.ratelimit import RateLimiter
+
+
+class RecordingLimiter(RateLimiter):
+    """Kutmaydigan cheklovchi: pause() chaqiruvlari yoziladi"""
+
+    def __init__(self):
+        super().__init__(rate=10_000, per_chat_interval=0)
+        self.pauses = []
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+class FakeBot:
+    """send_message: user_id uchun navbatdagi xatoni ko'taradi yoki yuborilgan deb yozadi"""
+
+    def __init__(self, errors=None, hang=()):
+        self.errors = {user_id: list(items) for user_id, items in (errors or {}).items()}
+        self.hang = set(hang)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.hang:
+            await asyncio.Event().wait()
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+def retry_after(seconds):
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Flood control", seconds)
+
+
+def forbidden():
+    return TelegramForbiddenError(SendMessage(chat_id=1, text="x"), "bot was blocked by the user")
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = Database(tmp_path / "bot.db")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RecordingLimiter()
+    monkeypatch.setattr(broadcast, "limiter", limiter)
+    return limiter
+
+
+def run_broadcast(monkeypatch, database, bot, message_id, cancel_after=None):
+    """BroadcastRun ni bajarish; cancel_after - shuncha soniyadan keyin to'xtatish (restart)"""
+    async def main():
+        adb = AsyncDatabase(database)
+        monkeypatch.setattr(broadcast, "adb", adb)
+        try:
+            [message] = [m for m in await adb.get_pending_messages() if m['id'] == message_id]
+            task = asyncio.create_task(
+                broadcast.BroadcastRun(bot, message, concurrency=1, batch_size=2).run()
+            )
+            if cancel_after is None:
+                await task
+            else:
+                await asyncio.sleep(cancel_after)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        finally:
+            adb._executor.shutdown(wait=True)
+
+    asyncio.run(main())
+
+
+def recipient_states(database, message_id):
+    rows = database.get_connection().execute(
+        'SELECT user_id, status FROM broadcast_recipients WHERE message_id = ? ORDER BY user_id',
+        (message_id,)
+    )
+    return {user_id: status for user_id, status in rows}
+
+
+class TestBroadcastRun:
+    """Natijalar, RetryAfter va qayta ishga tushishdan keyin davom etish"""
+
+    def test_retry_after_pauses_and_retries(self, monkeypatch, database, limiter):
+        """RetryAfter - butun bot to'xtatiladi va xabar qayta yuboriladi"""
+        message_id = database.create_broadcast(1, "salom", user_ids=[1, 2])
+        bot = FakeBot(errors={2: [retry_after(3)]})
+
+        run_broadcast(monkeypatch, database, bot, message_id)
+
+        assert limiter.pauses == [3]
+        assert bot.sent == [1, 2]
+        assert recipient_states(database, message_id) == {1: "sent", 2: "sent"}
+        assert database.get_pending_messages() == []
+
+    def test_recipient_states_are_persisted(self, monkeypatch, database, limiter):
+        """Bloklagan foydalanuvchi blocked, qolganlari sent; hisoblagichlar yoziladi"""
+        message_id = database.create_broadcast(1, "salom", user_ids=[1, 2, 3])
+        bot = FakeBot(errors={2: [forbidden()]})
+
+        run_broadcast(monkeypatch, database, bot, message_id)
+
+        assert recipient_states(database, message_id) == {1: "sent", 2: "blocked", 3: "sent"}
+        message = database.get_connection().execute(
+            'SELECT sent_count, failed_count, status FROM messages WHERE id = ?', (message_id,)
+        ).fetchone()
+        assert tuple(message) == (2, 1, "done")
+
+    def test_resume_skips_already_sent(self, monkeypatch, database, limiter):
+        """To'xtatilgan broadcast qayta ishga tushganda faqat pending larga yuboradi"""
+        message_id = database.create_broadcast(1, "salom", user_ids=[1, 2, 3, 4])
+        # 3-foydalanuvchida jarayon "o'ladi"
+        first = FakeBot(hang={3})
+        run_broadcast(monkeypatch, database, first, message_id, cancel_after=0.3)
+
+        assert first.sent == [1, 2]
+        assert recipient_states(database, message_id) == {1: "sent", 2: "sent", 3: "pending", 4: "pending"}
+        assert [m['id'] for m in database.get_pending_messages()] == [message_id]
+
+        second = FakeBot()
+        run_broadcast(monkeypatch, database, second, message_id)
+
+        assert second.sent == [3, 4]
+        assert set(recipient_states(database, message_id).values()) == {"sent"}
+        assert database.get_pending_messages() == []
@@ -0,0 +1,403 @@
+"""
+Database testlari
+"""
+import asyncio
+import gzip
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from app.database import AsyncDatabase, Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = Database(tmp_path / "bot.db")
+    yield db
+    db.close()
+
+
+class TestConnections:
+    """Ulanishlarni boshqarish"""
+
+    def test_connection_reused_per_thread(self, database):
+        """Bir oqimda ulanish qayta ishlatiladi, boshqa oqimda alohida"""
+        assert database.get_connection() is database.get_connection()
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(database.get_connection()))
+        thread.start()
+        thread.join()
+        assert other[0] is not database.get_connection()
+
+    def test_wal_and_pragmas(self, database):
+        """WAL va synchronous=NORMAL yoqilgan"""
+        conn = database.get_connection()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+    def test_failed_write_is_rolled_back(self, database):
+        """Xatolikda tranzaksiya bekor qilinadi, ulanish ishlashda davom etadi"""
+        with pytest.raises(Exception):
+            with database.get_connection() as conn:
+                conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'a')")
+                conn.execute("INSERT INTO no_such_table VALUES (1)")
+        assert database.get_user(1) is None
+        assert database.add_user(1, username="a")
+        assert database.get_user(1)['username'] == 'a'
+
+
+class TestDownloads:
+    """Yuklab olish yozuvlari"""
+
+    def test_download_lifecycle(self, database):
+        """log -> complete foydalanuvchi statistikasini yangilaydi"""
+        database.add_user(7, username="u")
+        download_id = database.log_download(7, "https://x.com/a/status/1", "video", status="processing")
+        database.complete_download(download_id, 1024)
+
+        user = database.get_user(7)
+        assert user['downloads_count'] == 1
+        assert user['storage_used'] == 1024
+        assert database.get_user_downloads(7)[0]['status'] == 'completed'
+
+    def test_recover_stale_downloads(self, database):
+        """Jarayon boshlanishidan oldingi processing qatorlar failed bo'ladi"""
+        database.add_user(7)
+        stale = database.log_download(7, "https://x.com/a/status/1", "video", status="processing")
+        done = database.log_download(7, "https://x.com/a/status/2", "video", status="processing")
+        database.complete_download(done, 10)
+
+        assert database.recover_stale_downloads("2000-01-01 00:00:00") == []
+        [row] = database.recover_stale_downloads("2999-01-01 00:00:00")
+        assert row['id'] == stale and row['url'].endswith("/1")
+
+        statuses = {d['id']: d['status'] for d in database.get_user_downloads(7)}
+        assert statuses == {stale: 'failed', done: 'completed'}
+        assert database.get_statistics()['failed_downloads'] == 1
+
+    def test_instances_on_one_file_get_distinct_ids(self, database, tmp_path):
+        """Bir bazadagi ikki nusxa id larni alohida oraliqlardan oladi"""
+        other = Database(tmp_path / "bot.db")
+        try:
+            database.add_user(7)
+            ids = []
+            for _ in range(3):
+                ids.append(database.log_download(7, "https://x.com/a/status/1", "video"))
+                ids.append(other.log_download(7, "https://x.com/a/status/2", "video"))
+        finally:
+            other.close()
+        assert 0 not in ids
+        assert len(set(ids)) == 6
+        assert len(database.get_user_downloads(7)) == 6
+
+    def test_update_before_insert_is_held_back(self, database):
+        """Qatori yozilmagan download update i qo'llanmaydi, qaytariladi"""
+        database.add_user(7)
+        download_id = database.allocate_download_id(7)
+        insert = (download_id, 7, "u", "video", "", 0, "processing", "2024-01-01 10:00:00")
+        update = ("completed", download_id, 5, False, None, "2024-01-01 10:00:05")
+
+        assert database.apply_write_batch([], [update], []) == ([], [update], [])
+        assert database.get_user(7)['downloads_count'] == 0
+
+        assert database.apply_write_batch([insert], [update], []) == ([], [], [])
+        assert database.get_user_downloads(7)[0]['status'] == 'completed'
+        assert database.get_user(7)['downloads_count'] == 1
+
+
+class TestFileCache:
+    """file_id keshi"""
+
+    def test_invalidate_only_rejected_media(self, database):
+        """Faqat rad etilgan media turi keshdan o'chiriladi"""
+        database.cache_file("key", "both", "video", "video-id", "T", 10)
+        database.cache_file("key", "both", "audio", "audio-id", "T", 5)
+
+        database.invalidate_cache("key", "both", ["audio"])
+        assert set(database.get_cached_files("key", "both")) == {"video"}
+
+        database.invalidate_cache("key", "both")
+        assert database.get_cached_files("key", "both") == {}
+
+
+class TestAsyncDatabase:
+    """Asinxron fasad"""
+
+    def test_calls_run_on_single_db_thread(self, database):
+        """Metodlar event loop oqimida emas, bitta DB oqimida bajariladi"""
+        adb = AsyncDatabase(database)
+
+        async def scenario():
+            await adb.add_user(7, username="u")
+            loop = asyncio.get_running_loop()
+            threads = await asyncio.gather(*(
+                loop.run_in_executor(adb._executor, threading.get_ident) for _ in range(5)
+            ))
+            user = await adb.get_user(7)
+            await adb.close()
+            return threads, user
+
+        threads, user = asyncio.run(scenario())
+        assert user['username'] == "u"
+        assert len(set(threads)) == 1
+        assert threads[0] != threading.get_ident()
+
+
+class TestStatistics:
+    """Trigger orqali yuritiladigan statistika"""
+
+    def test_counters_follow_download_lifecycle(self, database):
+        """Tugallangan/xato yuklab olishlar va kesh hisoblagichlari"""
+        database.add_user(7, username="u")
+        database.add_user(8, username="v")
+        first = database.log_download(7, "https://x.com/a/status/1", "video", status="processing")
+        second = database.log_download(7, "https://x.com/a/status/2", "video", status="processing")
+        third = database.log_download(8, "https://x.com/a/status/3", "video", status="processing")
+        database.complete_download(first, 1000)
+        database.complete_download(second, 500, cache_hit=True)
+        database.fail_download(third, "boom")
+
+        stats = database.get_statistics()
+        assert stats['total_users'] == 2
+        assert stats['successful_downloads'] == 2
+        assert stats['failed_downloads'] == 1
+        assert stats['total_storage_used'] == 1500
+        assert (stats['cache_hits'], stats['cache_misses']) == (1, 1)
+
+        today = database.get_daily_statistics(days=1)[0]
+        assert today['total_downloads'] == 3
+        assert today['successful_downloads'] == 2
+        assert today['failed_downloads'] == 1
+        assert today['active_users'] == 2
+
+    def test_ban_updates_total_users(self, database):
+        """Ban qilingan foydalanuvchi jami hisobdan chiqadi va qaytadi"""
+        database.add_user(7)
+        database.ban_user(7)
+        assert database.get_statistics()['total_users'] == 0
+        database.unban_user(7)
+        database.unban_user(7)
+        assert database.get_statistics()['total_users'] == 1
+
+    def test_existing_history_is_backfilled(self, tmp_path):
+        """Rollup migratsiyasi mavjud yozuvlardan to'ldiriladi"""
+        from app.migrations import MIGRATIONS, migrate
+
+        path = tmp_path / "bot.db"
+        conn = sqlite3.connect(path)
+        migrate(conn, [m for m in MIGRATIONS if m.version < 4])
+        conn.execute("INSERT INTO users (user_id, storage_used) VALUES (7, 300)")
+        conn.execute('''
+            INSERT INTO downloads (user_id, url, format, file_size, status, download_time, completion_time)
+            VALUES (7, 'u', 'video', 300, 'completed', '2024-01-01 10:00:00', '2024-01-01 10:00:10')
+        ''')
+        conn.commit()
+        conn.close()
+
+        db = Database(path)
+        try:
+            stats = db.get_statistics()
+            assert stats['successful_downloads'] == 1
+            assert stats['total_storage_used'] == 300
+            assert stats['avg_download_time'] == 10
+            assert db.get_daily_statistics()[0]['date'] == '2024-01-01'
+        finally:
+            db.close()
+
+
+class TestUserCache:
+    """Foydalanuvchi qatorlari keshi"""
+
+    def test_repeated_get_user_hits_cache(self, database):
+        """Qaytgan foydalanuvchi uchun SELECT takrorlanmaydi"""
+        database.add_user(7, username="u")
+        database.get_user(7)
+        database.get_user(7)
+        stats = database.user_cache.stats()
+        assert (stats['hits'], stats['misses']) == (1, 1)
+
+    def test_returned_row_is_a_copy(self, database):
+        """Qaytgan dict ni o'zgartirish keshni buzmaydi"""
+        database.add_user(7, username="u")
+        database.get_user(7)['username'] = "changed"
+        assert database.get_user(7)['username'] == "u"
+
+    def test_mutators_keep_cache_fresh(self, database):
+        """ban/admin va download tugallash keshdagi qatorni yangilaydi"""
+        database.add_user(7, username="u")
+        database.get_user(7)
+        database.ban_user(7)
+        database.make_admin(7)
+        user = database.get_user(7)
+        assert user['is_banned'] and user['is_admin']
+
+        download_id = database.log_download(7, "https://x.com/a/status/1", "video")
+        database.complete_download(download_id, 100)
+        assert database.get_user(7)['downloads_count'] == 1
+
+    def test_lru_eviction_and_ttl(self):
+        """Hajm oshganda eng eskisi, muddati o'tganda qator chiqariladi"""
+        from app.database import UserCache
+
+        cache = UserCache(maxsize=2, ttl=60)
+        cache.put(1, {'user_id': 1})
+        cache.put(2, {'user_id': 2})
+        cache.get(1)
+        cache.put(3, {'user_id': 3})
+        assert cache.get(2) is None
+        assert cache.get(1) is not None
+
+        expired = UserCache(maxsize=2, ttl=-1)
+        expired.put(1, {'user_id': 1})
+        assert expired.get(1) is None
+
+
+class TestUserBrowsing:
+    """Admin uchun foydalanuvchilar ro'yxati"""
+
+    def test_counts_and_top_users(self, database):
+        """Sonlar va top-N SQL da hisoblanadi"""
+        for user_id in range(1, 6):
+            database.add_user(user_id)
+        database.ban_user(2)
+        database.make_admin(3)
+        for _ in range(3):
+            database.complete_download(database.log_download(4, "u", "video"), 1)
+        database.complete_download(database.log_download(5, "u", "video"), 1)
+
+        assert database.get_user_counts() == {'total': 5, 'admins': 1, 'banned': 1, 'active': 4}
+        assert [u['user_id'] for u in database.get_top_users(limit=2)] == [4, 5]
+
+    def test_keyset_pages(self, database):
+        """next/prev sahifalar bir-biriga ulanadi"""
+        for user_id in range(1, 8):
+            database.add_user(user_id)
+
+        first, more = database.get_users_page(0, "next", limit=3)
+        assert [u['user_id'] for u in first] == [1, 2, 3] and more
+        second, more = database.get_users_page(3, "next", limit=3)
+        assert [u['user_id'] for u in second] == [4, 5, 6] and more
+        last, more = database.get_users_page(6, "next", limit=3)
+        assert [u['user_id'] for u in last] == [7] and not more
+
+        back, more = database.get_users_page(4, "prev", limit=3)
+        assert [u['user_id'] for u in back] == [1, 2, 3] and not more
+
+
+class TestRetention:
+    """Eski download tarixini arxivlash"""
+
+    def test_old_rows_move_to_monthly_archive(self, database, tmp_path):
+        """Eski qatorlar gzip arxivga o'tadi, foydalanuvchi hisoblagichlari saqlanadi"""
+        database.add_user(7)
+        old_id = database.log_download(7, "https://x.com/a/status/1", "video")
+        database.complete_download(old_id, 100)
+        new_id = database.log_download(7, "https://x.com/a/status/2", "video")
+        with database.get_connection() as conn:
+            conn.execute("UPDATE downloads SET download_time = '2020-01-15 10:00:00' WHERE id = ?", (old_id,))
+
+        archive_dir = tmp_path / "archive"
+        assert database.archive_downloads(older_than_days=30, archive_dir=archive_dir) == 1
+
+        assert [d['id'] for d in database.get_user_downloads(7)] == [new_id]
+        assert database.get_user(7)['downloads_count'] == 1
+        assert database.get_statistics()['successful_downloads'] == 1
+
+        with gzip.open(archive_dir / "downloads-2020-01.jsonl.gz", "rt") as f:
+            rows = [json.loads(line) for line in f]
+        assert [r['id'] for r in rows] == [old_id]
+
+    def test_incremental_vacuum(self, database):
+        """Yangi baza auto_vacuum=INCREMENTAL bilan yaratiladi"""
+        conn = database.get_connection()
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        assert database.incremental_vacuum() >= 0
+
+    def test_legacy_db_is_not_vacuumed_implicitly(self, tmp_path):
+        """Eski bazada kunlik ish to'liq VACUUM qilmaydi; faqat qo'lda yoqiladi"""
+        path = tmp_path / "legacy.db"
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE legacy (x)")
+        conn.close()
+        database = Database(path)
+        try:
+            conn = database.get_connection()
+            assert database.incremental_vacuum() == 0
+            assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+
+            assert database.enable_incremental_vacuum()
+            assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+            assert database.incremental_vacuum() >= 0
+        finally:
+            database.close()
+
+
+class TestNotifications:
+    """Shaxsiy va ommaviy bildirishnomalar"""
+
+    def test_broadcast_is_one_row_read_per_user(self, database):
+        """Ommaviy xabar bitta qator; o'qilganlik har foydalanuvchida alohida"""
+        database.add_user(7)
+        database.add_user(8)
+        database.add_notification(7, "shaxsiy")
+        database.broadcast_notification("hammaga")
+
+        conn = database.get_connection()
+        assert conn.execute('SELECT COUNT(*) FROM notifications').fetchone()[0] == 2
+
+        unread = database.get_unread_notifications(7)
+        assert sorted(n['message'] for n in unread) == ["hammaga", "shaxsiy"]
+        database.mark_notifications_read(7, [n['id'] for n in unread])
+
+        assert database.get_unread_notifications(7) == []
+        assert [n['message'] for n in database.get_unread_notifications(8)] == ["hammaga"]
+
+    def test_broadcast_not_shown_to_later_users(self, database):
+        """Xabardan keyin qo'shilgan foydalanuvchi uni ko'rmaydi"""
+        database.broadcast_notification("eski")
+        database.add_user(9)
+        with database.get_connection() as conn:
+            conn.execute("UPDATE notifications SET created_at = '2020-01-01 00:00:00'")
+        assert database.get_unread_notifications(9) == []
+
+    def test_broadcast_hidden_from_banned_users(self, database):
+        """Ban qilingan foydalanuvchi ommaviy xabarni ko'rmaydi, shaxsiysini ko'radi"""
+        database.add_user(10)
+        database.ban_user(10)
+        database.add_notification(10, "shaxsiy")
+        database.broadcast_notification("hammaga")
+        assert [n['message'] for n in database.get_unread_notifications(10)] == ["shaxsiy"]
+
+
+class TestBroadcastRecipients:
+    """Broadcast qabul qiluvchilari holati"""
+
+    def test_recipients_exclude_banned(self, database):
+        """Ban qilinganlar qabul qiluvchilar ro'yxatiga kirmaydi"""
+        for user_id in (1, 2, 3):
+            database.add_user(user_id)
+        database.ban_user(2)
+
+        message_id = database.create_broadcast(1, "salom")
+        assert database.get_broadcast_recipients(message_id) == [1, 3]
+        assert [m['id'] for m in database.get_pending_messages()] == [message_id]
+
+    def test_results_resume_from_pending(self, database):
+        """Yozilgan natijalar qayta o'qilmaydi, takroriy yozuv hisoblamaydi"""
+        message_id = database.create_broadcast(1, "salom", user_ids=[1, 2, 3, 4])
+        assert database.get_broadcast_recipients(message_id, after_user_id=1, limit=2) == [2, 3]
+
+        results = [(1, "sent", None), (2, "blocked", "Forbidden")]
+        assert database.record_broadcast_results(message_id, results)
+        assert database.record_broadcast_results(message_id, results)
+        assert database.get_broadcast_recipients(message_id) == [3, 4]
+        assert database.count_broadcast_pending(message_id) == 2
+
+        [message] = database.get_pending_messages()
+        assert (message['sent_count'], message['failed_count']) == (1, 1)
+
+        database.finish_broadcast(message_id)
+        assert database.get_pending_messages() == []
@@ -0,0 +1,144 @@
+"""
+Natijani yetkazish testlari
+"""
+import asyncio
+
+from app.delivery import check_upload_size, deliver_once, refetch_format, send_cached, upload_all
+from app.formats import FileTooLargeError
+from app.singleflight import SingleFlight
+
+
+class TestUploadAll:
+    """Media turlari bir-biridan mustaqil yuboriladi"""
+
+    def test_audio_failure_does_not_cancel_video(self):
+        """Audio ajratish xato bersa ham video yuborib bo'linadi"""
+        sent = []
+
+        async def upload(media_type):
+            if media_type == "audio":
+                raise RuntimeError("ffmpeg failed")
+            await asyncio.sleep(0.05)
+            sent.append(media_type)
+            return "video-file-id", 100
+
+        delivery = asyncio.run(upload_all({"video", "audio"}, upload))
+        assert sent == ["video"]
+        assert delivery.sent == {"video": ("video-file-id", 100)}
+        assert isinstance(delivery.errors["audio"], RuntimeError)
+        assert delivery.size == 100
+
+    def test_skipped_media_is_not_an_error(self):
+        """None qaytargan (tayyorlanmagan) media na yuborilgan, na xato"""
+        async def upload(media_type):
+            return None if media_type == "audio" else ("id", 1)
+
+        delivery = asyncio.run(upload_all({"video", "audio"}, upload))
+        assert list(delivery.sent) == ["video"]
+        assert not delivery.errors
+
+    def test_too_big_media_is_recorded_as_error(self):
+        """Hamma fayl limitdan katta bo'lsa natija bo'sh emas - xato sifatida qoladi"""
+        async def upload(media_type):
+            check_upload_size(2048, 1024)
+            return "id", 2048
+
+        delivery = asyncio.run(upload_all({"video", "audio"}, upload))
+        assert not delivery.sent and not delivery.empty
+        assert set(delivery.errors) == {"video", "audio"}
+        assert all(isinstance(e, FileTooLargeError) for e in delivery.errors.values())
+
+    def test_upload_size_within_limit(self):
+        """Limit ichidagi yoki limitsiz (0) fayl o'tkaziladi"""
+        check_upload_size(1024, 1024)
+        check_upload_size(10 ** 12, 0)
+
+
+class StaleFileId(Exception):
+    """Telegram rad etgan file_id"""
+
+
+class TestSendCached:
+    """Keshdan yuborish: faqat rad etilgan media qayta olinadi"""
+
+    def test_stale_audio_keeps_sent_video(self):
+        """Video yuborilgan, audio rad etilgan - faqat audio qayta yuklanadi"""
+        sent = []
+        cached = {
+            "video": {"file_id": "video-id", "file_size": 10},
+            "audio": {"file_id": "old-audio-id", "file_size": 5},
+        }
+
+        async def send(media_type, entry):
+            if media_type == "audio":
+                raise StaleFileId(entry["file_id"])
+            sent.append(media_type)
+
+        delivery = asyncio.run(send_cached(cached, send, StaleFileId))
+        assert sent == ["video"]
+        assert delivery.sent == {"video": ("video-id", 10)}
+        assert set(delivery.errors) == {"audio"}
+        assert refetch_format("both", set(delivery.errors)) == "audio"
+        assert refetch_format("both", {"video", "audio"}) == "both"
+
+
+class FakeResult:
+    """Yuklab olish natijasi o'rnida"""
+
+    title = "Video"
+    media_types = {"video", "audio"}
+
+    def close(self):
+        pass
+
+
+class TestDeliverOnce:
+    """Parallel bir xil so'rovlar: bitta yuklab olish, bitta upload"""
+
+    def run_requesters(self, fail_leader_upload=False):
+        flights = SingleFlight()
+        calls = {"download": 0, "upload": [], "file_id": []}
+
+        async def download():
+            calls["download"] += 1
+            await asyncio.sleep(0.02)
+            return FakeResult()
+
+        def requester(chat_id):
+            def make_upload(result):
+                async def upload(media_type):
+                    calls["upload"].append((chat_id, media_type))
+                    if fail_leader_upload and chat_id == 1:
+                        raise RuntimeError("upload failed")
+                    await asyncio.sleep(0.01)
+                    return f"{media_type}-id", 10
+                return upload
+
+            async def send_file_id(result, media_type, file_id):
+                calls["file_id"].append((chat_id, media_type, file_id))
+
+            return deliver_once(flights, ("url", "both"), download, make_upload, send_file_id)
+
+        async def main():
+            return await asyncio.gather(requester(1), requester(2))
+
+        return asyncio.run(main()), calls
+
+    def test_two_requests_upload_once(self):
+        """Ikkinchi so'rovchi yetakchining file_id lari bilan oladi"""
+        results, calls = self.run_requesters()
+        assert calls["download"] == 1
+        assert sorted(calls["upload"]) == [(1, "audio"), (1, "video")]
+        assert sorted(calls["file_id"]) == [(2, "audio", "audio-id"), (2, "video", "video-id")]
+        for _, delivery in results:
+            assert set(delivery.sent) == {"video", "audio"}
+
+    def test_follower_uploads_when_leader_failed(self):
+        """Yetakchi yubora olmasa, qolganlar o'zi yuklaydi"""
+        results, calls = self.run_requesters(fail_leader_upload=True)
+        assert calls["download"] == 1
+        assert not calls["file_id"]
+        assert sorted(media for chat, media in calls["upload"] if chat == 2) == ["audio", "video"]
+        (_, leader), (_, follower) = results
+        assert set(leader.errors) == {"video", "audio"}
+        assert set(follower.sent) == {"video", "audio"}
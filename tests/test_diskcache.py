@@ -0,0 +1,114 @@
+"""
+Disk kesh testlari
+"""
+import asyncio
+
+import pytest
+
+from app.diskcache import DiskCache, DiskFullError
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def cache(tmp_path):
+    disk = DiskCache(tmp_path / "work", tmp_path / "index.db",
+                     max_bytes=10 * MB, high_watermark=0.9, low_watermark=0.7, min_free_bytes=0)
+    disk.load()
+    yield disk
+    disk.close()
+
+
+def fill(path, size):
+    (path / "media.mp4").write_bytes(b"x" * size)
+
+
+class TestDiskCache:
+    """Hisob, tozalash va indeks"""
+
+    def test_fanout_layout_and_accounting(self, cache):
+        """Katalog xesh bo'yicha ikki darajali, hajm commit da aniqlanadi"""
+        path = cache.create(4 * MB)
+        assert path.parent.parent == cache.root and path.parent.name == path.name[:2]
+        assert cache.used_bytes == 4 * MB
+
+        fill(path, MB)
+        cache.commit(path)
+        assert cache.used_bytes == MB
+
+        cache.release(path)
+        assert not path.exists() and cache.used_bytes == 0
+
+    def test_admit_evicts_lru_unpinned(self, cache):
+        """Joy yetmasa eng eski bo'sh kataloglar o'chiriladi, band qilinganlar qoladi"""
+        paths = []
+        for _ in range(4):
+            path = cache.create(2 * MB)
+            fill(path, 2 * MB)
+            cache.commit(path)
+            paths.append(path)
+        pinned = paths[1]
+        for path in (paths[0], paths[2], paths[3]):
+            cache.release(path, delete=False)
+        cache.touch(paths[0])
+
+        assert not cache.can_admit(2 * MB)
+        new = asyncio.run(cache.admit(2 * MB))
+
+        # LRU tartibi: 2, 3, 0 - yangi ish bilan pastki chegaraga (7 MB) tushguncha
+        assert pinned.exists() and paths[0].exists() and new.exists()
+        assert not paths[2].exists() and not paths[3].exists()
+        assert cache.used_bytes == 6 * MB
+
+    def test_admit_refuses_when_everything_pinned(self, cache):
+        cache.create(8 * MB)
+        with pytest.raises(DiskFullError):
+            asyncio.run(cache.admit(2 * MB))
+
+    def test_index_survives_restart(self, cache, tmp_path):
+        """Indeks SQLite da saqlanadi: qayta ochilganda kataloglar ishlatilmayotgan bo'ladi"""
+        path = cache.create(MB)
+        fill(path, MB)
+        cache.commit(path)
+        cache.close()
+
+        reopened = DiskCache(cache.root, tmp_path / "index.db", max_bytes=10 * MB, min_free_bytes=0)
+        reopened.load()
+        try:
+            assert reopened.used_bytes == MB
+            assert reopened.stats()['pinned'] == 0
+            reopened.max_age = -1
+            assert reopened.maintain() == MB
+            assert not path.exists()
+        finally:
+            reopened.close()
+
+    def test_recover_removes_orphans_only(self, cache):
+        """Ishga tushganda: indeksdagi yetimlar va indeksga tushmagan kataloglar o'chiriladi"""
+        live = cache.create(MB)
+        leaked = cache.create(MB)
+        cache.release(leaked, delete=False)
+        # create() dan keyin, indeks yozilishidan oldin to'xtagan jarayon qoldig'i
+        unindexed = cache.path_for("ab" + "0" * 30)
+        unindexed.mkdir(parents=True)
+        fill(unindexed, 100)
+
+        assert cache.recover() == {'workdirs': 2, 'bytes': MB + 100}
+        assert live.exists() and not leaked.exists() and not unindexed.exists()
+        assert cache.used_bytes == MB
+
+    def test_recover_stays_in_own_root(self, tmp_path):
+        """Boshqa nusxa ildiziga va ildizdagi indeks fayliga tegilmaydi"""
+        root = tmp_path / "work" / "a"
+        cache = DiskCache(root, root / "index.db", max_bytes=10 * MB, min_free_bytes=0)
+        cache.load()
+        try:
+            other = tmp_path / "work" / "b" / "ab" / ("ab" + "0" * 30)
+            other.mkdir(parents=True)
+            fill(other, 100)
+
+            assert cache.recover() == {'workdirs': 0, 'bytes': 0}
+            assert other.exists()
+            assert (root / "index.db").exists()
+        finally:
+            cache.close()
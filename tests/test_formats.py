@@ -0,0 +1,91 @@
+"""
+Yuklab olish rejalari testlari
+"""
+import pytest
+
+from app.formats import FileTooLargeError, estimate_size, plan_download, select_format
+
+
+class TestDownloadPlans:
+    """Format turi -> yt-dlp rejasi"""
+
+    def test_audio_fetches_audio_only(self):
+        """Audio uchun video oqimi yuklanmaydi"""
+        plan = plan_download("audio")
+        assert plan.outputs == ("audio",)
+        assert plan.ydl_format.startswith("bestaudio")
+        assert "merge_output_format" not in plan.ydl_options("x.%(ext)s")
+
+    def test_image_skips_media_download(self):
+        """Rasm uchun faqat thumbnail olinadi"""
+        opts = plan_download("image").ydl_options("x.%(ext)s")
+        assert opts["skip_download"] is True
+        assert opts["writethumbnail"] is True
+        assert "format" not in opts
+
+    def test_gif_caps_resolution(self):
+        """GIF uchun past o'lchamli oqim tanlanadi"""
+        plan = plan_download("gif")
+        assert plan.outputs == ("animation",)
+        assert "height<=" in plan.ydl_format
+
+    def test_unknown_falls_back_to_both(self):
+        """Noma'lum format - video + audio"""
+        assert plan_download("unknown").outputs == ("video", "audio")
+
+
+class TestSelectFormat:
+    """Pre-flight format tanlash"""
+
+    INFO = {
+        "duration": 600,
+        "formats": [
+            {"format_id": "a1", "vcodec": "none", "acodec": "mp4a", "ext": "m4a", "abr": 128, "filesize": 10_000_000},
+            {"format_id": "v360", "vcodec": "avc1", "acodec": "none", "height": 360, "filesize": 30_000_000},
+            {"format_id": "v720", "vcodec": "avc1", "acodec": "none", "height": 720, "filesize": 90_000_000},
+            # Hajmi yo'q - davomiylik x bitrate bo'yicha (~150 MB)
+            {"format_id": "v1080", "vcodec": "avc1", "acodec": "none", "height": 1080, "tbr": 2000},
+        ],
+    }
+
+    def test_picks_best_fitting_combination(self):
+        """Limitga sig'adigan eng yuqori sifat tanlanadi"""
+        selected = select_format(self.INFO, plan_download("video"), 120_000_000)
+        assert selected.format_id == "v720+a1"
+        assert selected.estimated_size == 100_000_000
+
+    def test_estimates_size_from_bitrate(self):
+        """filesize bo'lmasa tbr x duration ishlatiladi"""
+        assert estimate_size({"tbr": 2000}, 600) == 150_000_000
+        assert estimate_size({"tbr": 2000}, None) is None
+
+    def test_audio_plan_ignores_video(self):
+        """Audio rejasi faqat audio formatlarni ko'radi"""
+        selected = select_format(self.INFO, plan_download("audio"), 50_000_000)
+        assert selected.format_id == "a1"
+
+    def test_rejects_when_nothing_fits(self):
+        """Hech narsa sig'masa oldindan rad etiladi"""
+        with pytest.raises(FileTooLargeError):
+            select_format(self.INFO, plan_download("video"), 20_000_000)
+
+    def test_mixed_sizes_never_fall_back_to_best(self):
+        """Ma'lumlari sig'masa, pastroq sifatli noma'lum hajmli format tanlanadi"""
+        info = {"formats": [
+            {"format_id": "hd", "vcodec": "avc1", "acodec": "mp4a", "height": 1080, "filesize": 500_000_000},
+            {"format_id": "sd", "vcodec": "avc1", "acodec": "mp4a", "height": 480},
+            {"format_id": "uhd", "vcodec": "avc1", "acodec": "mp4a", "height": 2160},
+        ]}
+        selected = select_format(info, plan_download("video"), 100_000_000)
+        assert selected.format_id == "sd"
+        assert selected.estimated_size is None
+
+        # Pastroq sifatli nomzod yo'q - rad etiladi
+        info["formats"].pop(1)
+        with pytest.raises(FileTooLargeError):
+            select_format(info, plan_download("video"), 100_000_000)
+
+    def test_unknown_sizes_defer_to_plan(self):
+        """Hajmlar noma'lum bo'lsa rejadagi selektor qoladi"""
+        info = {"formats": [{"format_id": "b", "vcodec": "avc1", "acodec": "mp4a"}]}
+        assert select_format(info, plan_download("video"), 1) is None
@@ -0,0 +1,94 @@
+"""
+Metrikalar reestri testlari
+"""
+import asyncio
+
+import pytest
+
+from app.metrics import Registry, StageTimer, bot_api_middleware, BOT_API_SECONDS
+
+
+class TestRegistry:
+    """Counter, gauge va gistogramma chiqishi"""
+
+    def test_counter_render(self):
+        """Label lar bo'yicha alohida qatorlar"""
+        registry = Registry()
+        downloads = registry.counter("downloads_total", "Yuklab olishlar", ("platform", "outcome"))
+        downloads.inc(platform="tiktok", outcome="completed")
+        downloads.inc(2, platform="tiktok", outcome="completed")
+        downloads.inc(platform="youtube", outcome="failed")
+
+        text = registry.render()
+        assert "# TYPE downloads_total counter" in text
+        assert 'downloads_total{platform="tiktok",outcome="completed"} 3' in text
+        assert 'downloads_total{platform="youtube",outcome="failed"} 1' in text
+
+    def test_labels_are_validated(self):
+        """Noto'g'ri label lar va kamaytirish rad etiladi"""
+        registry = Registry()
+        counter = registry.counter("c_total", "c", ("stage",))
+        with pytest.raises(ValueError):
+            counter.inc(platform="tiktok")
+        with pytest.raises(ValueError):
+            counter.inc(-1, stage="download")
+        with pytest.raises(ValueError):
+            registry.counter("c_total", "c")
+
+    def test_gauge_function(self):
+        """set_function qiymati scrape paytida olinadi"""
+        registry = Registry()
+        depth = {"value": 3}
+        gauge = registry.gauge("queue_depth", "Navbat")
+        gauge.set_function(lambda: depth["value"])
+        depth["value"] = 7
+        assert "queue_depth 7" in registry.render()
+
+    def test_histogram_buckets(self):
+        """Bucket lar kumulyativ, _sum va _count bilan"""
+        registry = Registry()
+        hist = registry.histogram("stage_seconds", "Bosqich", ("stage",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            hist.observe(value, stage="download")
+
+        text = registry.render()
+        assert 'stage_seconds_bucket{stage="download",le="0.1"} 1' in text
+        assert 'stage_seconds_bucket{stage="download",le="1"} 2' in text
+        assert 'stage_seconds_bucket{stage="download",le="+Inf"} 3' in text
+        assert 'stage_seconds_sum{stage="download"} 5.55' in text
+        assert 'stage_seconds_count{stage="download"} 3' in text
+
+
+class TestInstrumentation:
+    """Bosqich taymeri va Bot API middleware"""
+
+    def test_split_stage(self):
+        """Bosqich qismi ajratiladi, umumiy vaqt o'zgarmaydi"""
+        timer = StageTimer()
+        timer.timings["download"] = 3.0
+        timer.split("download", "extract", 1.0)
+        assert timer.timings == {"download": 2.0, "extract": 1.0}
+        # Bosqichdan uzun qism uni manfiy qilmaydi
+        timer.split("download", "extract", 10.0)
+        assert timer.timings == {"download": 0.0, "extract": 3.0}
+
+    def test_bot_api_middleware(self):
+        """Muvaffaqiyatli va xato so'rovlar metod bo'yicha yoziladi"""
+        class SendMessage:
+            pass
+
+        async def ok(bot, method):
+            return "response"
+
+        async def fail(bot, method):
+            raise RuntimeError("network")
+
+        before_ok = BOT_API_SECONDS.count(method="SendMessage", outcome="ok")
+        before_error = BOT_API_SECONDS.count(method="SendMessage", outcome="error")
+
+        assert asyncio.run(bot_api_middleware(ok, None, SendMessage())) == "response"
+        with pytest.raises(RuntimeError):
+            asyncio.run(bot_api_middleware(fail, None, SendMessage()))
+
+        assert BOT_API_SECONDS.count(method="SendMessage", outcome="ok") == before_ok + 1
+        assert BOT_API_SECONDS.count(method="SendMessage", outcome="error") == before_error + 1
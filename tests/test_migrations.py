@@ -0,0 +1,161 @@
+"""
+Sxema migratsiyalari va indekslar testlari
+"""
+import sqlite3
+
+import pytest
+
+from app.database import Database
+from app.migrations import MIGRATIONS, Migration, current_version, migrate
+
+LATEST = max(m.version for m in MIGRATIONS)
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = Database(tmp_path / "bot.db")
+    yield db
+    db.close()
+
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+class TestMigrate:
+    """Migratsiya jarayoni"""
+
+    def test_fresh_database_reaches_latest(self, database):
+        """Yangi baza oxirgi versiyagacha migratsiya qilinadi"""
+        assert current_version(database.get_connection()) == LATEST
+
+    def test_rerun_is_noop(self, database):
+        """Qayta ishga tushirish hech narsa qo'llamaydi"""
+        conn = database.get_connection()
+        assert migrate(conn) == LATEST
+        count = conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0]
+        assert count == len(MIGRATIONS)
+
+    def test_legacy_database_is_upgraded(self, tmp_path):
+        """schema_version siz eski baza: ustun va indekslar qo'shiladi, ma'lumot saqlanadi"""
+        path = tmp_path / "legacy.db"
+        conn = sqlite3.connect(path)
+        conn.execute('''
+            CREATE TABLE downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL, url TEXT NOT NULL, format TEXT NOT NULL,
+                title TEXT, file_size INTEGER, status TEXT,
+                download_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completion_time TIMESTAMP, error_message TEXT
+            )
+        ''')
+        conn.execute("INSERT INTO downloads (user_id, url, format) VALUES (1, 'u', 'video')")
+        conn.commit()
+        conn.close()
+
+        db = Database(path)
+        try:
+            conn = db.get_connection()
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(downloads)')}
+            assert 'cache_hit' in columns
+            assert conn.execute('SELECT COUNT(*) FROM downloads').fetchone()[0] == 1
+            assert current_version(conn) == LATEST
+        finally:
+            db.close()
+
+    def test_failed_migration_is_rolled_back(self, database):
+        """Xato bergan migratsiya qisman qo'llanmaydi"""
+        conn = database.get_connection()
+        broken = Migration(LATEST + 1, "broken", (
+            'CREATE TABLE half_done (id INTEGER)',
+            'THIS IS NOT SQL',
+        ))
+        with pytest.raises(sqlite3.OperationalError):
+            migrate(conn, MIGRATIONS + (broken,))
+
+        assert current_version(conn) == LATEST
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'half_done' not in tables
+
+
+def executed_plans(database, call):
+    """Metod haqiqatda bajargan SELECT lar va ularning rejalari.
+
+    trace callback parametrlar qo'yilgan SQL ni beradi, shuning uchun
+    ilovadagi so'rov matni o'zgarsa test ham shuni tekshiradi.
+    """
+    conn = database.get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call(database)
+    finally:
+        conn.set_trace_callback(None)
+    return [
+        query_plan(conn, sql)
+        for sql in statements if sql.lstrip().upper().startswith("SELECT")
+    ]
+
+
+class TestQueryPlans:
+    """Hot-path so'rovlari indeks ishlatadi (to'liq skan va vaqtinchalik saralash yo'q)"""
+
+    @pytest.mark.parametrize("call, expected", [
+        (
+            lambda db: db.get_user_downloads(1),
+            [['SEARCH downloads USING INDEX idx_downloads_user_time (user_id=?)']],
+        ),
+        (
+            lambda db: db.get_statistics(),
+            [
+                ['SEARCH stats_totals USING INTEGER PRIMARY KEY (rowid=?)'],
+                ['SEARCH users USING COVERING INDEX idx_users_last_activity (last_activity>?)'],
+            ],
+        ),
+        (
+            lambda db: db.get_unread_notifications(1),
+            [[
+                'MERGE (UNION ALL)',
+                'LEFT',
+                'SEARCH notifications USING INDEX idx_notifications_user_unread (user_id=? AND is_read=?)',
+                'RIGHT',
+                'SEARCH n USING INDEX idx_notifications_user_unread (user_id=? AND is_read=? AND created_at>?)',
+                'SCALAR SUBQUERY 2',
+                'SEARCH users USING INTEGER PRIMARY KEY (rowid=?)',
+                'SCALAR SUBQUERY 3',
+                'SEARCH users USING INTEGER PRIMARY KEY (rowid=?)',
+                'CORRELATED SCALAR SUBQUERY 4',
+                'SEARCH r USING PRIMARY KEY (user_id=? AND notification_id=?)',
+            ]],
+        ),
+        (
+            lambda db: db.get_pending_messages(),
+            [['SCAN messages USING INDEX idx_messages_pending']],
+        ),
+        (
+            lambda db: db.get_broadcast_recipients(1),
+            [['SEARCH broadcast_recipients USING PRIMARY KEY (message_id=? AND user_id>?)']],
+        ),
+        (
+            lambda db: db.get_top_users(5),
+            [['SCAN users USING INDEX idx_users_downloads']],
+        ),
+        (
+            lambda db: db.get_user_counts(),
+            [[
+                'SCAN CONSTANT ROW',
+                'SCALAR SUBQUERY 1',
+                'SCAN users USING COVERING INDEX idx_users_last_activity',
+                'SCALAR SUBQUERY 2',
+                'SCAN users USING INDEX idx_users_admins',
+                'SCALAR SUBQUERY 3',
+                'SCAN users USING INDEX idx_users_banned',
+            ]],
+        ),
+        (
+            lambda db: db.get_users_page(0),
+            [['SEARCH users USING INTEGER PRIMARY KEY (rowid>?)']],
+        ),
+    ])
+    def test_hot_query_plan(self, database, call, expected):
+        assert executed_plans(database, call) == expected
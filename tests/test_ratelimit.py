@@ -0,0 +1,58 @@
+"""
+Tezlik cheklovchi testlari
+"""
+import asyncio
+import time
+
+from app.ratelimit import RateLimiter, Throttle
+
+
+def elapsed(coro_factory) -> float:
+    """Ssenariy bajarilish vaqti (soniya)"""
+    async def main():
+        start = time.monotonic()
+        await coro_factory()
+        return time.monotonic() - start
+
+    return asyncio.run(main())
+
+
+class TestRateLimiter:
+    """Global va chat bo'yicha cheklov"""
+
+    def test_concurrent_acquires_are_paced(self):
+        """Parallel chaqiruvlar ham rate dan oshmaydi"""
+        limiter = RateLimiter(rate=100, burst=5)
+        seconds = elapsed(lambda: asyncio.gather(*(limiter.acquire() for _ in range(25))))
+        # 5 tasi darhol, qolgan 20 tasi 10 ms oraliqda
+        assert 0.18 <= seconds < 0.5
+
+    def test_pause_delays_everyone(self):
+        """RetryAfter dan keyin barcha yuborishlar kutadi"""
+        limiter = RateLimiter(rate=1000)
+
+        async def scenario():
+            limiter.pause(0.2)
+            await asyncio.gather(limiter.acquire(), limiter.acquire())
+
+        assert elapsed(scenario) >= 0.2
+
+    def test_per_chat_interval(self):
+        """Bitta chatga ketma-ket yuborish kutadi, turli chatlar kutmaydi"""
+        limiter = RateLimiter(rate=1000, burst=10, per_chat_interval=0.2)
+        assert elapsed(lambda: asyncio.gather(*(limiter.acquire(c) for c in range(5)))) < 0.1
+        assert elapsed(lambda: asyncio.gather(limiter.acquire(7), limiter.acquire(7))) >= 0.2
+
+
+class TestThrottle:
+    """Progress tahrirlari"""
+
+    def test_ready_once_per_interval(self):
+        """Interval ichida faqat birinchi chaqiruv o'tadi"""
+        now = [0.0]
+        throttle = Throttle(5, clock=lambda: now[0])
+        assert throttle.ready()
+        now[0] = 4.9
+        assert not throttle.ready()
+        now[0] = 5.0
+        assert throttle.ready()
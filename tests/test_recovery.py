@@ -0,0 +1,107 @@
+"""
+Ishga tushishdagi tiklash testlari (bir baza va DATA_DIR ni bir nechta nusxa ishlatadi)
+"""
+import asyncio
+
+import pytest
+
+from app import recovery
+from app.database import AsyncDatabase, Database
+from app.diskcache import DiskCache
+
+URL = "https://x.com/a/status/1"
+
+
+@pytest.fixture
+def instances(tmp_path):
+    """Bitta bazadagi a (shu nusxa), b (tirik) va c (o'lgan) nusxalar"""
+    path = tmp_path / "bot.db"
+    databases = {name: Database(path, instance_id=name) for name in "abc"}
+    yield databases
+    for database in databases.values():
+        database.close()
+
+
+def workdir(root, key):
+    path = root / key[:2] / key
+    path.mkdir(parents=True)
+    (path / "media.mp4").write_bytes(b"x" * 100)
+    return path
+
+
+def recover(monkeypatch, tmp_path, database, disk):
+    async def main():
+        adb = AsyncDatabase(database)
+        monkeypatch.setattr(recovery, "adb", adb)
+        try:
+            return await recovery.recover_on_startup(None)
+        finally:
+            adb._executor.shutdown(wait=True)
+
+    monkeypatch.setattr(recovery, "disk_cache", disk)
+    monkeypatch.setattr(recovery, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(recovery, "RECOVERY_POLICY", "fail")
+    return asyncio.run(main())
+
+
+class TestRecoverOnStartup:
+    """Tiklash faqat shu va o'lgan nusxalarning ishlariga tegadi"""
+
+    def test_live_instance_jobs_survive(self, monkeypatch, tmp_path, instances):
+        """Tirik nusxaning downloadi va katalogi qoladi, qolganlari tiklanadi"""
+        own, live, dead = instances["a"], instances["b"], instances["c"]
+        for user_id in (1, 2, 3, 4):
+            own.add_user(user_id)
+        ids = {
+            "a": own.log_download(1, URL, "video", status="processing"),
+            "b": live.log_download(2, URL, "video", status="processing"),
+            "c": dead.log_download(3, URL, "video", status="processing"),
+        }
+        live.heartbeat()
+        dead.heartbeat()
+        with own.get_connection() as conn:
+            # Yangilanishdan oldingi (egasiz) qator
+            conn.execute(
+                "INSERT INTO downloads (id, user_id, url, format, status) VALUES (999, 4, ?, 'video', 'processing')",
+                (URL,),
+            )
+            conn.execute("UPDATE downloads SET download_time = '2020-01-01 00:00:00'")
+            conn.execute("UPDATE instances SET heartbeat_at = '2020-01-01 00:00:00' WHERE instance_id = 'c'")
+        ids["legacy"] = 999
+
+        work = tmp_path / "work"
+        disk = DiskCache(work / "a", work / "a" / "index.db", min_free_bytes=0)
+        disk.load()
+        orphan = workdir(work / "a", "aa" + "0" * 30)
+        live_dir = workdir(work / "b", "bb" + "0" * 30)
+        dead_dir = workdir(work / "c", "cc" + "0" * 30)
+        legacy_dir = workdir(work, "dd" + "0" * 30)
+        try:
+            report = recover(monkeypatch, tmp_path, own, disk)
+        finally:
+            disk.close()
+
+        statuses = {
+            row['id']: row['status']
+            for row in own.get_connection().execute('SELECT id, status FROM downloads')
+        }
+        assert statuses == {
+            ids["a"]: 'failed', ids["b"]: 'processing', ids["c"]: 'failed', ids["legacy"]: 'failed',
+        }
+        assert report.downloads == 3
+
+        assert live_dir.exists()
+        assert not orphan.exists() and not dead_dir.exists() and not legacy_dir.exists()
+        assert report.workdirs == 3
+        assert report.bytes == 300
+
+    def test_heartbeat_written_before_recovery(self, monkeypatch, tmp_path, instances):
+        """Tiklashdan oldin shu nusxa o'zini tirik deb belgilaydi"""
+        work = tmp_path / "work"
+        disk = DiskCache(work / "a", work / "a" / "index.db", min_free_bytes=0)
+        disk.load()
+        try:
+            recover(monkeypatch, tmp_path, instances["a"], disk)
+        finally:
+            disk.close()
+        assert instances["b"].live_instances(60) == ["a"]
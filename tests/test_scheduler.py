@@ -0,0 +1,117 @@
+"""
+Scheduler testlari
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from app.scheduler import Cron, Scheduler
+
+
+def run(scheduler, seconds):
+    """Schedulerni `seconds` davomida ishlatib to'xtatish"""
+    async def main():
+        await scheduler.start()
+        await asyncio.sleep(seconds)
+        await scheduler.stop()
+
+    asyncio.run(main())
+
+
+class TestCron:
+    """Cron ifodalar"""
+
+    @pytest.mark.parametrize("expression, after, expected", [
+        ("30 3 * * *", datetime(2024, 1, 1, 3, 30), datetime(2024, 1, 2, 3, 30)),
+        ("30 3 * * *", datetime(2024, 1, 1, 1, 0), datetime(2024, 1, 1, 3, 30)),
+        ("*/15 * * * *", datetime(2024, 1, 1, 10, 16), datetime(2024, 1, 1, 10, 30)),
+        ("0 9 * * 1-5", datetime(2024, 1, 5, 10, 0), datetime(2024, 1, 8, 9, 0)),
+        ("0 0 1 * *", datetime(2024, 12, 15, 0, 0), datetime(2025, 1, 1, 0, 0)),
+        ("0 0 29 2 *", datetime(2024, 3, 1, 0, 0), datetime(2028, 2, 29, 0, 0)),
+        # Kun yoki hafta kuni (yakshanba = 0 = 7)
+        ("0 12 15 * 7", datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 7, 12, 0)),
+    ])
+    def test_next_run(self, expression, after, expected):
+        assert Cron(expression).next_run(after) == expected
+
+    @pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *"])
+    def test_invalid(self, expression):
+        with pytest.raises(ValueError):
+            Cron(expression)
+
+
+class TestScheduler:
+    """Ishlarni bajarish va nazorat"""
+
+    def test_interval_job_runs_and_records_duration(self):
+        """Interval ishi takrorlanadi, davomiylik yoziladi"""
+        scheduler = Scheduler()
+        calls = []
+
+        async def job():
+            calls.append(1)
+
+        scheduler.add_job("job", job, every=0.05, run_at_start=True)
+        run(scheduler, 0.2)
+
+        stats = scheduler.stats()['job']
+        assert len(calls) >= 3
+        assert stats['runs'] == len(calls) and stats['failures'] == 0
+        assert stats['last_duration'] is not None
+
+    def test_crashing_job_restarts_with_backoff(self):
+        """Xato bergan ish kutishdan keyin qayta uriniladi, kutish o'sadi"""
+        scheduler = Scheduler(backoff_base=0.05, backoff_max=1)
+        times = []
+
+        async def job():
+            times.append(time.monotonic())
+            raise RuntimeError("boom")
+
+        scheduler.add_job("job", job, every=60, run_at_start=True)
+        run(scheduler, 0.45)
+
+        # 0, 0.05, 0.15, 0.35 - oraliqlar 0.05, 0.1, 0.2
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        assert len(gaps) == 3
+        assert gaps[0] < gaps[1] < gaps[2]
+        assert scheduler.stats()['job']['last_error'] == "boom"
+
+    def test_timeout_cancels_job(self):
+        """Timeout dan oshgan ish to'xtatiladi va xato sifatida yoziladi"""
+        scheduler = Scheduler()
+        cancelled = []
+
+        async def job():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        scheduler.add_job("job", job, every=60, timeout=0.05, run_at_start=True)
+        run(scheduler, 0.15)
+
+        assert cancelled
+        assert scheduler.stats()['job']['last_error'].startswith("timeout")
+
+    def test_blocking_job_runs_off_loop(self):
+        """blocking=True ish event loop threadida bajarilmaydi"""
+        scheduler = Scheduler()
+        threads = []
+        scheduler.add_job("job", lambda: threads.append(threading.get_ident()),
+                          every=60, blocking=True, run_at_start=True)
+        run(scheduler, 0.1)
+
+        assert threads and threads[0] != threading.get_ident()
+
+    def test_add_job_validation(self):
+        scheduler = Scheduler()
+        with pytest.raises(ValueError):
+            scheduler.add_job("job", lambda: None)
+        scheduler.add_job("job", lambda: None, every=1)
+        with pytest.raises(ValueError):
+            scheduler.add_job("job", lambda: None, cron="* * * * *")
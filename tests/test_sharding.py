@@ -0,0 +1,125 @@
+"""
+Shardlangan backend testlari
+"""
+import pytest
+
+from app.database import Database, create_database
+from app.sharding import ShardedDatabase, shard_path
+from app.storage import StorageBackend
+
+SHARDS = 3
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    db = ShardedDatabase(tmp_path / "bot.db", SHARDS)
+    yield db
+    db.close()
+
+
+class TestBackends:
+    """Backend tanlash"""
+
+    def test_factory(self, tmp_path):
+        """DB_SHARDS > 1 bo'lsa shardlangan backend yaratiladi"""
+        single = create_database(tmp_path / "a.db", shards=1)
+        sharded = create_database(tmp_path / "b.db", shards=2)
+        try:
+            assert type(single) is Database
+            assert isinstance(sharded, ShardedDatabase)
+            assert isinstance(sharded, StorageBackend)
+            assert shard_path(tmp_path / "b.db", 1).exists()
+        finally:
+            single.close()
+            sharded.close()
+
+
+class TestShardedDatabase:
+    """Marshrutlash va birlashtirish"""
+
+    def test_user_rows_live_in_their_shard(self, sharded):
+        """Foydalanuvchi faqat o'z shardida saqlanadi"""
+        sharded.add_user(7, username="u")
+        assert sharded.get_user(7)['username'] == "u"
+        owners = [i for i, shard in enumerate(sharded.shards) if shard.get_user(7)]
+        assert owners == [7 % SHARDS]
+
+    def test_download_ids_encode_shard(self, sharded):
+        """Download id shard raqamini saqlaydi va complete to'g'ri shardga boradi"""
+        ids = []
+        for user_id in (1, 2, 3, 4):
+            sharded.add_user(user_id)
+            download_id = sharded.log_download(user_id, "https://x.com/a/status/1", "video")
+            assert download_id % SHARDS == user_id % SHARDS
+            sharded.complete_download(download_id, 10)
+            ids.append(download_id)
+
+        assert len(set(ids)) == 4
+        assert sharded.get_user(4)['downloads_count'] == 1
+        assert sharded.get_statistics()['successful_downloads'] == 4
+
+    def test_write_batch_is_split_by_shard(self, sharded):
+        """Write-behind partiyasi shardlarga bo'linadi"""
+        inserts, updates = [], []
+        for user_id in (1, 2, 3):
+            sharded.add_user(user_id)
+            download_id = sharded.allocate_download_id(user_id)
+            inserts.append((download_id, user_id, "u", "video", "", 0, "processing", "2024-01-01 10:00:00"))
+            updates.append(("completed", download_id, 5, False, None, "2024-01-01 10:00:05"))
+
+        assert sharded.apply_write_batch(inserts, updates, [(2, "2024-01-01 10:00:05")]) == ([], [], [])
+        stats = sharded.get_statistics()
+        assert stats['successful_downloads'] == 3
+        assert stats['total_storage_used'] == 15
+        assert stats['avg_download_time'] == 5
+        assert sharded.get_user(2)['last_activity'] == "2024-01-01 10:00:05"
+
+    def test_admin_queries_fan_out(self, sharded):
+        """Sonlar, top-N va sahifalar barcha shardlardan birlashtiriladi"""
+        for user_id in range(1, 10):
+            sharded.add_user(user_id)
+            for _ in range(user_id % 4):
+                sharded.complete_download(sharded.log_download(user_id, "u", "video"), 1)
+        sharded.ban_user(5)
+
+        assert sharded.get_user_counts() == {'total': 9, 'admins': 0, 'banned': 1, 'active': 8}
+        top = sharded.get_top_users(limit=3)
+        assert [u['user_id'] for u in top] == [7, 3, 6]
+
+        page, more = sharded.get_users_page(0, "next", limit=4)
+        assert [u['user_id'] for u in page] == [1, 2, 3, 4] and more
+        page, more = sharded.get_users_page(8, "next", limit=4)
+        assert [u['user_id'] for u in page] == [9] and not more
+        page, more = sharded.get_users_page(5, "prev", limit=3)
+        assert [u['user_id'] for u in page] == [2, 3, 4] and more
+
+    def test_notification_ids_round_trip(self, sharded):
+        """Notification id lari shard bilan kodlanadi va o'qilganda dekodlanadi"""
+        for user_id in (1, 2):
+            sharded.add_user(user_id)
+            sharded.add_notification(user_id, "salom")
+
+        [notification] = sharded.get_unread_notifications(2)
+        sharded.mark_notifications_read(2, [notification['id']])
+        assert sharded.get_unread_notifications(2) == []
+        assert len(sharded.get_unread_notifications(1)) == 1
+
+    def test_broadcast_reaches_every_shard(self, sharded):
+        """Ommaviy bildirishnoma barcha shard foydalanuvchilariga ko'rinadi"""
+        for user_id in range(1, SHARDS + 1):
+            sharded.add_user(user_id)
+        assert sharded.broadcast_notification("hammaga")
+
+        for user_id in range(1, SHARDS + 1):
+            [notification] = sharded.get_unread_notifications(user_id)
+            sharded.mark_notifications_read(user_id, [notification['id']])
+            assert sharded.get_unread_notifications(user_id) == []
+
+    def test_broadcast_recipients_from_all_shards(self, sharded):
+        """Broadcast qabul qiluvchilari barcha shardlardan yig'iladi"""
+        for user_id in range(1, 6):
+            sharded.add_user(user_id)
+        sharded.ban_user(4)
+
+        message_id = sharded.create_broadcast(1, "salom")
+        assert sharded.get_broadcast_recipients(message_id) == [1, 2, 3, 5]
@@ -0,0 +1,85 @@
+"""
+Single-flight registr testlari
+"""
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """SingleFlight testlari"""
+
+    def test_concurrent_joins_share_one_job(self):
+        """Bir xil kalitga parallel so'rovlar bitta ishni baham ko'radi"""
+        calls = []
+        released = []
+        flights = SingleFlight(on_release=released.append)
+
+        async def job():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def requester():
+            async with flights.join("key", job) as result:
+                await asyncio.sleep(0.01)
+                assert not released
+                return result
+
+        async def run_all():
+            return await asyncio.gather(*(requester() for _ in range(5)))
+
+        assert asyncio.run(run_all()) == ["result"] * 5
+        assert len(calls) == 1
+        assert released == ["result"]
+        assert len(flights) == 0
+
+    def test_error_is_shared_and_not_released(self):
+        """Xatolik barcha kutayotganlarga uzatiladi"""
+        released = []
+        flights = SingleFlight(on_release=released.append)
+
+        async def job():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("failed")
+
+        async def requester():
+            async with flights.join("key", job):
+                pass
+
+        async def run_all():
+            return await asyncio.gather(*(requester() for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(run_all())
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert released == []
+
+    def test_job_cancelled_when_last_waiter_leaves(self):
+        """Barcha kutayotganlar bekor qilinsa ish ham to'xtatiladi"""
+        flights = SingleFlight()
+
+        async def scenario():
+            state = {"cancelled": False}
+
+            async def job():
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    state["cancelled"] = True
+                    raise
+
+            async def requester():
+                async with flights.join("key", job):
+                    pass
+
+            waiter = asyncio.ensure_future(requester())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            await asyncio.sleep(0.01)
+            return state["cancelled"]
+
+        assert asyncio.run(scenario())
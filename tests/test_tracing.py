@@ -0,0 +1,122 @@
+"""
+Tracing testlari
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.metrics import StageTimer
+from app.tracing import Tracer, annotate, current_trace_id, record_span, span, traced
+
+
+def read_traces(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = Tracer(tmp_path / "traces" / "traces.jsonl")
+    tracer.start()
+    yield tracer
+    tracer.stop()
+
+
+def events(trace):
+    return {event["name"]: event for event in trace["traceEvents"] if event["ph"] == "X"}
+
+
+class TestSpans:
+    """Ichma-ich spanlar va contextvars"""
+
+    def test_nested_spans_are_exported(self, tracer, tmp_path):
+        """Trace tugaganda barcha spanlar bitta qatorda yoziladi"""
+        @traced("download_video_and_audio")
+        async def download():
+            timer = StageTimer()
+            with timer.stage("download"):
+                # Ishchi jarayonda o'lchangan bosqich
+                started = time.perf_counter()
+                time.sleep(0.002)
+                record_span("extract", started, time.perf_counter())
+            return current_trace_id()
+
+        async def job():
+            with tracer.trace("job", user_id=1):
+                trace_id = await download()
+                with span("db.cache_file"):
+                    pass
+                annotate(outcome="completed")
+            return trace_id
+
+        trace_id = asyncio.run(job())
+        tracer.stop()
+
+        [trace] = read_traces(tmp_path / "traces" / "traces.jsonl")
+        assert trace["otherData"]["trace_id"] == trace_id
+        assert trace["otherData"]["outcome"] == "completed"
+        spans = events(trace)
+        assert set(spans) == {"job", "download_video_and_audio", "download", "extract", "db.cache_file"}
+        outer = spans["download"]
+        inner = spans["extract"]
+        assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+    def test_parallel_tasks_get_own_lanes(self, tracer, tmp_path):
+        """Parallel task lar viewer da alohida qatorlarda"""
+        async def upload(name):
+            with span(name):
+                await asyncio.sleep(0.01)
+
+        async def job():
+            with tracer.trace("download"):
+                await asyncio.gather(upload("upload_video"), upload("upload_audio"))
+
+        asyncio.run(job())
+        tracer.stop()
+
+        [trace] = read_traces(tmp_path / "traces" / "traces.jsonl")
+        spans = events(trace)
+        assert spans["upload_video"]["tid"] != spans["upload_audio"]["tid"]
+
+    def test_error_is_recorded(self, tracer, tmp_path):
+        """Xato bergan span nomi bilan belgilanadi"""
+        with pytest.raises(ValueError):
+            with tracer.trace("download"):
+                with span("extract"):
+                    raise ValueError("boom")
+        tracer.stop()
+
+        [trace] = read_traces(tmp_path / "traces" / "traces.jsonl")
+        assert events(trace)["extract"]["args"]["error"] == "ValueError"
+
+    def test_span_outside_trace_is_noop(self):
+        """Trace tashqarisida span hech narsa yozmaydi"""
+        with span("db.get_user") as current:
+            assert current is None
+        assert current_trace_id() is None
+
+
+class TestExport:
+    """Fayl ga yozish"""
+
+    def test_min_seconds_filters_fast_traces(self, tmp_path):
+        """Tez trace lar yozilmaydi"""
+        tracer = Tracer(tmp_path / "traces.jsonl", min_seconds=60)
+        tracer.start()
+        with tracer.trace("download"):
+            pass
+        tracer.stop()
+        assert not (tmp_path / "traces.jsonl").exists()
+
+    def test_rotation(self, tmp_path):
+        """Fayl hajmdan oshsa aylantiriladi"""
+        tracer = Tracer(tmp_path / "traces.jsonl", max_bytes=2000, backups=2)
+        tracer.start()
+        for _ in range(50):
+            with tracer.trace("download", url="https://example.com/" + "x" * 100):
+                pass
+        tracer.stop()
+        assert (tmp_path / "traces.jsonl.1").exists()
+        assert not (tmp_path / "traces.jsonl.3").exists()
+        assert all(read_traces(tmp_path / "traces.jsonl"))
@@ -2,7 +2,7 @@
 Media platforma testlari
 """
 import pytest
-from app.validators import is_supported_url
+from app.validators import is_supported_url, normalize_url, platform_of
 
 
 class TestValidators:
@@ -51,6 +51,21 @@ class TestValidators:
         assert not is_supported_url("")
         assert not is_supported_url("https://example.com")  # Qo'llab-quvvatlanmagan sait
 
+    def test_normalize_url(self):
+        """Kesh kaliti uchun URL normalizatsiyasi"""
+        assert (normalize_url("https://www.instagram.com/reel/Cx123/?igsh=abc&utm_source=ig")
+                == normalize_url("https://instagram.com/reel/Cx123"))
+        assert (normalize_url("https://youtu.be/dQw4w9WgXcQ?si=xyz")
+                == normalize_url("https://m.youtube.com/watch?v=dQw4w9WgXcQ#t=10"))
+        assert normalize_url("https://x.com/a/status/1") != normalize_url("https://x.com/a/status/2")
+
+    def test_platform_of(self):
+        """Metrika label i uchun platforma nomi"""
+        assert platform_of("https://vt.tiktok.com/ZSL7MBJ9c/") == "tiktok"
+        assert platform_of("https://youtu.be/dQw4w9WgXcQ") == "youtube"
+        assert platform_of("https://x.com/a/status/1") == "twitter"
+        assert platform_of("https://example.com/video") == "other"
+
 
 class TestDownloadFormats:
     """Format turlari testlari"""
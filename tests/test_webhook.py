@@ -0,0 +1,98 @@
+"""
+Webhook rejimi testlari: secret, /healthz va umumiy FSM holati
+"""
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import StorageKey
+from aiohttp.test_utils import TestClient, TestServer
+
+from app import webhook
+from app.config import WEBHOOK_PATH
+from app.database import AsyncDatabase, Database
+from app.fsm import SQLiteStorage
+
+TOKEN = "123456:TEST-token"
+
+
+def request(app, method, path, **kwargs):
+    """Ilovani test serverida ishga tushirib bitta so'rov yuborish"""
+    async def main():
+        async with TestClient(TestServer(app)) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, await response.text()
+
+    return asyncio.run(main())
+
+
+class TestWebhookSecret:
+    """Secret barcha nusxalarda bir xil"""
+
+    def test_derived_from_token(self, monkeypatch):
+        """WEBHOOK_SECRET bo'sh bo'lsa token dan barqaror hosil qilinadi"""
+        monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "")
+        monkeypatch.setattr(webhook, "BOT_TOKEN", TOKEN)
+        secret = webhook.webhook_secret()
+        assert secret == webhook.webhook_secret()
+        assert len(secret) == 64 and TOKEN not in secret
+
+        monkeypatch.setattr(webhook, "BOT_TOKEN", TOKEN + "x")
+        assert webhook.webhook_secret() != secret
+
+    def test_explicit_secret_wins(self, monkeypatch):
+        """Berilgan WEBHOOK_SECRET o'zgarishsiz ishlatiladi"""
+        monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "s3cret")
+        assert webhook.webhook_secret() == "s3cret"
+
+
+class TestWebhookApp:
+    """aiohttp ilova marshrutlari"""
+
+    @pytest.fixture
+    def app(self):
+        return webhook.build_webhook_app(Dispatcher(), Bot(TOKEN), "good-secret")
+
+    def test_healthz(self, app):
+        """Load balancer uchun /healthz 200 ok qaytaradi"""
+        assert request(app, "GET", "/healthz") == (200, "ok")
+
+    def test_update_without_secret_rejected(self, app):
+        """Noto'g'ri secret bilan kelgan update qabul qilinmaydi"""
+        status, _ = request(app, "POST", WEBHOOK_PATH, json={"update_id": 1},
+                            headers={"X-Telegram-Bot-Api-Secret-Token": "bad"})
+        assert status == 401
+
+
+class TestSQLiteStorage:
+    """FSM holati bir bazadagi nusxalar orasida umumiy"""
+
+    def test_state_visible_to_other_instance(self, tmp_path):
+        """Bir nusxa yozgan holat va ma'lumotni ikkinchisi o'qiydi; clear qatorni o'chiradi"""
+        first, second = Database(tmp_path / "bot.db", "a"), Database(tmp_path / "bot.db", "b")
+        key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+        async def main():
+            adbs = [AsyncDatabase(first), AsyncDatabase(second)]
+            writer, reader = (SQLiteStorage(adb) for adb in adbs)
+            try:
+                await writer.set_state(key, "AdminState:waiting_user_id_for_ban")
+                await writer.update_data(key, {"url": "https://x.com/a/status/1"})
+                seen = await reader.get_state(key), await reader.get_data(key)
+                await reader.set_state(key, None)
+                await reader.set_data(key, {})
+                cleared = await writer.get_state(key), await writer.get_data(key)
+                return seen, cleared
+            finally:
+                for adb in adbs:
+                    adb._executor.shutdown(wait=True)
+
+        try:
+            seen, cleared = asyncio.run(main())
+            rows = first.get_connection().execute('SELECT COUNT(*) FROM fsm_states').fetchone()[0]
+        finally:
+            first.close()
+            second.close()
+        assert seen == ("AdminState:waiting_user_id_for_ban", {"url": "https://x.com/a/status/1"})
+        assert cleared == (None, {})
+        assert rows == 0
@@ -0,0 +1,70 @@
+"""
+Ishchi jarayonlar puli testlari
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.workers import _MP_CONTEXT, WorkerPool, WorkerTimeout
+
+
+def _square(x):
+    return x * x
+
+
+def _sleep_and_report(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _fail():
+    raise ValueError("boom")
+
+
+class TestWorkerPool:
+    """WorkerPool testlari"""
+
+    def test_returns_result(self):
+        """Natija ishchi jarayondan qaytadi"""
+        pool = WorkerPool(2)
+        assert asyncio.run(pool.run(_square, 7)) == 49
+
+    def test_propagates_exception(self):
+        """Ishchidagi xatolik chaqiruvchiga uzatiladi"""
+        pool = WorkerPool(1)
+        with pytest.raises(ValueError):
+            asyncio.run(pool.run(_fail))
+
+    def test_timeout_kills_worker(self):
+        """Timeout bo'lganda jarayon o'ldiriladi va loop bloklanmaydi"""
+        pool = WorkerPool(1)
+        started = time.monotonic()
+        with pytest.raises(WorkerTimeout):
+            asyncio.run(pool.run(_sleep_and_report, 30, timeout=0.5))
+        assert time.monotonic() - started < 10
+        assert pool.active == 0
+
+    def test_runs_in_parallel(self):
+        """Pul o'lchamicha ish bir vaqtda bajariladi"""
+        pool = WorkerPool(3)
+
+        async def run_all():
+            return await asyncio.gather(*(pool.run(_sleep_and_report, 0.5) for _ in range(3)))
+
+        started = time.monotonic()
+        pids = asyncio.run(run_all())
+        assert time.monotonic() - started < 1.4
+        assert len(set(pids)) == 3
+
+    def test_does_not_fork_threaded_process(self):
+        """Ko'p oqimli bot jarayoni to'g'ridan-to'g'ri fork qilinmaydi"""
+        assert _MP_CONTEXT.get_start_method() in ("forkserver", "spawn")
+
+    def test_semaphore_created_on_start(self):
+        """Semafor import/konstruktorda emas, start() da yaratiladi"""
+        pool = WorkerPool(1)
+        assert pool._semaphore is None
+        assert asyncio.run(pool.run(_square, 3)) == 9
+        assert pool._semaphore is not None
@@ -0,0 +1,145 @@
+"""
+Write-behind bufer testlari
+"""
+import asyncio
+
+import pytest
+
+from app.database import AsyncDatabase, Database
+from app.writebehind import WRITES_DROPPED, WriteBehindBuffer
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = Database(tmp_path / "bot.db")
+    db.add_user(7, username="u")
+    yield db
+    db.close()
+
+
+def run(database, scenario, **kwargs):
+    """Bufer bilan ssenariyni bajarish va natijani qaytarish"""
+    async def main():
+        adb = AsyncDatabase(database)
+        writes = WriteBehindBuffer(adb, **kwargs)
+        await writes.start()
+        try:
+            return await scenario(writes, adb)
+        finally:
+            await writes.stop()
+            adb._executor.shutdown(wait=True)
+
+    return asyncio.run(main())
+
+
+class TestWriteBehindBuffer:
+    """Bufer yozuvlari"""
+
+    def test_nothing_written_before_flush(self, database):
+        """Yozuvlar flush gacha faqat xotirada"""
+        async def scenario(writes, adb):
+            writes.log_download(7, "https://x.com/a/status/1", "video")
+            pending = await adb.get_user_downloads(7)
+            await writes.stop()
+            return pending
+
+        assert run(database, scenario, interval_ms=60_000) == []
+        assert len(database.get_user_downloads(7)) == 1
+
+    def test_log_and_complete_in_one_flush(self, database):
+        """Oldindan ajratilgan id bilan log va complete birga yoziladi"""
+        async def scenario(writes, adb):
+            first = writes.log_download(7, "https://x.com/a/status/1", "video", status="processing")
+            second = writes.log_download(7, "https://x.com/a/status/2", "audio", status="processing")
+            writes.complete_download(first, 1024)
+            writes.fail_download(second, "boom")
+            await writes.stop()
+            return first, second
+
+        first, second = run(database, scenario, interval_ms=60_000)
+        assert second == first + 1
+        statuses = {d['id']: d['status'] for d in database.get_user_downloads(7)}
+        assert statuses == {first: 'completed', second: 'failed'}
+        user = database.get_user(7)
+        assert user['downloads_count'] == 1
+        assert user['storage_used'] == 1024
+
+    def test_activity_collapses_per_user(self, database):
+        """Bir foydalanuvchining faoliyati bitta yozuvga birlashadi"""
+        async def scenario(writes, adb):
+            for _ in range(5):
+                writes.update_user_activity(7)
+            size = len(writes)
+            await writes.stop()
+            return size
+
+        assert run(database, scenario, interval_ms=60_000) == 1
+
+    def test_max_records_triggers_flush(self, database):
+        """max_records ga yetganda interval kutilmaydi"""
+        async def scenario(writes, adb):
+            for i in range(3):
+                writes.log_download(7, f"https://x.com/a/status/{i}", "video")
+            for _ in range(50):
+                if not len(writes):
+                    break
+                await asyncio.sleep(0.01)
+            return len(await adb.get_user_downloads(7))
+
+        assert run(database, scenario, interval_ms=60_000, max_records=3) == 3
+
+    def test_ids_continue_after_existing_rows(self, database):
+        """Hisoblagich bazadagi eng katta id dan davom etadi"""
+        existing = database.log_download(7, "https://x.com/a/status/0", "video")
+
+        async def scenario(writes, adb):
+            download_id = writes.log_download(7, "https://x.com/a/status/1", "video")
+            await writes.stop()
+            return download_id
+
+        assert run(database, scenario) == existing + 1
+
+    def test_complete_waits_for_its_insert(self, database):
+        """INSERT yozilmaguncha complete ham qayta navbatda qoladi, keyin qo'llanadi"""
+        async def scenario(writes, adb):
+            download_id = writes.log_download(7, "https://x.com/a/status/1", "video", status="processing")
+            writes.complete_download(download_id, 10)
+            # Birinchi flush da INSERT (masalan, band baza sababli) yozilmadi
+            writes._inserts, held = [], writes._inserts
+            assert not await writes.flush()
+            assert len(writes) == 1
+            writes._inserts[:0] = held
+            assert await writes.flush()
+            return download_id
+
+        download_id = run(database, scenario, interval_ms=60_000)
+        assert database.get_user_downloads(7)[0]['id'] == download_id
+        assert database.get_user_downloads(7)[0]['status'] == 'completed'
+        assert database.get_user(7)['downloads_count'] == 1
+
+    def test_poison_row_is_dropped(self, database):
+        """Buzuq qator qolganlarini to'smaydi va urinishlardan keyin tashlanadi"""
+        async def scenario(writes, adb):
+            poison = writes.log_download(7, "https://x.com/a/status/1", "video")
+            # Xuddi shu id bazada allaqachon bor - INSERT IntegrityError beradi
+            database.get_connection().execute(
+                "INSERT INTO downloads (id, user_id, url, format) VALUES (?, 7, 'other', 'video')", (poison,)
+            )
+            database.get_connection().commit()
+            good = writes.log_download(7, "https://x.com/a/status/2", "video")
+            writes.update_user_activity(7)
+
+            assert not await writes.flush()
+            written = {d['id'] for d in await adb.get_user_downloads(7)}
+            for _ in range(2):
+                assert not await writes.flush()
+            pending_before_drop = len(writes)
+            assert await writes.flush() is False
+            return good, written, pending_before_drop, len(writes)
+
+        before = WRITES_DROPPED.value(kind="insert")
+        good, written, pending_before_drop, pending = run(database, scenario, interval_ms=60_000, max_attempts=4)
+        assert good in written
+        assert pending_before_drop == 1
+        assert pending == 0
+        assert WRITES_DROPPED.value(kind="insert") == before + 1